@@ -0,0 +1,103 @@
+import math
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# columns added to every row by CapacityTransformer, constant within a group
+CAPACITY_COLUMNS = ["failure_rate", "knee_rps", "slo_capacity_rps", "slo_capacity_interpolated_rps"]
+
+
+def failure_rates(df: pd.DataFrame) -> np.ndarray:
+    requests = df["total_requests"].to_numpy(dtype=np.float64)
+    failures = df["total_failures"].to_numpy(dtype=np.float64)
+    # a step without any request did not sustain its rate
+    return np.divide(failures, requests, out=np.ones(len(requests)), where=requests > 0)
+
+
+def knee_rps(rps: np.ndarray, latency: np.ndarray) -> float:
+    """
+    Kneedle on the load latency curve: after scaling both axes to [0, 1], the knee of a
+    convex increasing curve is the point that lies furthest below the chord from the first to the last point.
+    """
+    valid = ~np.isnan(latency)
+    rps, latency = rps[valid], latency[valid]
+    if len(rps) < 3 or rps[-1] == rps[0] or latency.max() == latency.min():
+        return math.nan
+    rps_scaled = (rps - rps[0]) / (rps[-1] - rps[0])
+    latency_scaled = (latency - latency.min()) / (latency.max() - latency.min())
+    return float(rps[np.argmax(rps_scaled - latency_scaled)])
+
+
+def slo_capacity(rps: np.ndarray, metrics: Dict[str, np.ndarray], limits: Dict[str, float]) -> tuple:
+    """
+    Highest swept rate before the first step that violates one of the limits, and the rate at which
+    the first violated metric crosses its limit when interpolating linearly to the next step.
+    Both are NaN if already the lowest rate violates the SLO, and the interpolated capacity equals
+    the highest rate if no step does.
+    """
+    compliant = np.ones(len(rps), dtype=bool)
+    for name, limit in limits.items():
+        # NaN (no requests in the steady window) counts as violation
+        compliant &= metrics[name] <= limit
+    if len(rps) == 0 or not compliant[0]:
+        return math.nan, math.nan
+    if compliant.all():
+        return float(rps[-1]), float(rps[-1])
+    first_violation = int(np.argmin(compliant))
+    low, high = first_violation - 1, first_violation
+    crossings = []
+    for name, limit in limits.items():
+        low_value, high_value = metrics[name][low], metrics[name][high]
+        # NaN violates the limit at the step itself
+        if np.isnan(high_value):
+            crossings.append(rps[high])
+            continue
+        if not high_value > limit:
+            continue
+        if high_value == low_value:
+            crossings.append(rps[high])
+            continue
+        fraction = (limit - low_value) / (high_value - low_value)
+        crossings.append(rps[low] + fraction * (rps[high] - rps[low]))
+    return float(rps[low]), float(min(crossings))
+
+
+def group_capacity(group: pd.DataFrame, limits: Dict[str, float], knee_column: str) -> Dict[str, float]:
+    group = group.sort_values("rps")
+    rps = group["rps"].to_numpy(dtype=np.float64)
+    metrics = {column: group[column].to_numpy(dtype=np.float64) for column in limits if column != "failure_rate"}
+    metrics["failure_rate"] = failure_rates(group)
+    capacity, interpolated = slo_capacity(rps, metrics, limits)
+    return {
+        "knee_rps": knee_rps(rps, group[knee_column].to_numpy(dtype=np.float64)),
+        "slo_capacity_rps": capacity,
+        "slo_capacity_interpolated_rps": interpolated,
+    }
+
+
+def slo_limits(slo_p50_ms: Optional[float], slo_p99_ms: Optional[float], max_failure_rate: float) -> Dict[str, float]:
+    limits = {"failure_rate": max_failure_rate}
+    if slo_p50_ms is not None:
+        limits[f"latency_p{50:3.1f}"] = slo_p50_ms
+    if slo_p99_ms is not None:
+        limits[f"latency_p{99:3.1f}"] = slo_p99_ms
+    return limits
+
+
+def capacity_table(df: pd.DataFrame, group_by: List[str]) -> pd.DataFrame:
+    columns = [column for column in CAPACITY_COLUMNS if column != "failure_rate"]
+    return df[group_by + columns].drop_duplicates(subset=group_by).sort_values(group_by, ignore_index=True)
+
+
+def annotate_capacity(axis, group: pd.DataFrame, color=None):
+    # dotted line at the interpolated SLO capacity and a marker on the x-axis at the knee
+    if "slo_capacity_interpolated_rps" not in group.columns or group.empty:
+        return
+    capacity = group["slo_capacity_interpolated_rps"].iat[0]
+    knee = group["knee_rps"].iat[0]
+    if not math.isnan(capacity):
+        axis.axvline(capacity, color=color, linestyle="dotted", linewidth=2)
+    if not math.isnan(knee):
+        axis.plot([knee], [0], marker="^", color=color, markersize=12, clip_on=False,
+                  transform=axis.get_xaxis_transform())
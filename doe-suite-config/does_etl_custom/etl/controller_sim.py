@@ -0,0 +1,238 @@
+import itertools
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# the controller of the worker is not part of this repository, the simulator assumes this model of it:
+# every control interval it compares the queued tasks per core of the I/O engine and the compute engine,
+# e = queue_io / cores_io - queue_compute / cores_compute, and moves cores between the two
+#  - "pi": cores_io = initial cores_io + round(kp * e + ki * sum of e)
+#  - "threshold": cores_io += delta if e > high, -= delta if e < low
+# always keeping min_cores on each engine. validate() reports how well this matches a recorded run.
+POLICIES = ["pi", "threshold"]
+
+
+class ControllerTimeline:
+    """
+    Cores and queue length of every engine type at every control tick of a worker stdout.log,
+    shape (ticks, len(engine_types)), and the control_delta the worker printed.
+    """
+
+    def __init__(self, path, engine_types, cores, queue_length, control_delta):
+        self.path = path
+        self.engine_types = engine_types
+        self.cores = cores
+        self.queue_length = queue_length
+        self.control_delta = control_delta
+
+    def __len__(self):
+        return len(self.cores)
+
+    def column(self, engine_type: str) -> int:
+        return self.engine_types.index(engine_type)
+
+
+def parse_type_numbers(line: str) -> Dict[str, int]:
+    # "Engine type: <type>, <name>: <n>; Engine type: ..." -> {type: n}
+    numbers = {}
+    for part in line.strip().split("; "):
+        if not part.startswith("Engine type"):
+            continue
+        engine_type, n = part.split(", ")
+        numbers[engine_type.split(": ")[1]] = int(n.split(": ")[1])
+    return numbers
+
+
+def parse_controller_log(path: str) -> ControllerTimeline:
+    # the worker prints a line with the cores and one with the queue lengths per engine type every control tick
+    control_delta = None
+    core_rows, queue_rows = [], []
+    pending = None
+    with open(path, "r") as log_file:
+        for line in log_file:
+            if control_delta is None and line.startswith("delta"):
+                control_delta = int(line.split(",")[0].split(" ")[-1])
+            elif line.startswith("Engine type") and "Buffer" not in line:
+                if pending is None:
+                    pending = parse_type_numbers(line)
+                else:
+                    core_rows.append(pending)
+                    queue_rows.append(parse_type_numbers(line))
+                    pending = None
+    engine_types = []
+    for row in core_rows:
+        engine_types.extend(engine_type for engine_type in row if engine_type not in engine_types)
+    cores = np.array([[row.get(engine_type, 0) for engine_type in engine_types] for row in core_rows], dtype=np.int64)
+    queue_length = np.array([[row.get(engine_type, 0) for engine_type in engine_types] for row in queue_rows], dtype=np.int64)
+    return ControllerTimeline(path, engine_types, cores.reshape(-1, len(engine_types)),
+                              queue_length.reshape(-1, len(engine_types)), control_delta)
+
+
+def arrivals_per_tick(rate_per_sec: np.ndarray, interval_ms: float, ticks: int) -> np.ndarray:
+    # requests arriving in every control tick, for a rate per second such as rates_per_second() of a trace
+    tick_seconds = (np.arange(ticks) * interval_ms / 1000).astype(np.int64)
+    rates = np.asarray(rate_per_sec, dtype=np.float64)
+    return rates[np.minimum(tick_seconds, len(rates) - 1)] * interval_ms / 1000
+
+
+def estimate_work(queue_length: np.ndarray, cores: np.ndarray, arrivals: np.ndarray, interval_ms: float) -> float:
+    """
+    Core seconds per request of one engine, from the ticks where its queue stayed busy:
+    there all cores work, so cores * interval = work * (arrivals - queue growth).
+    """
+    served = arrivals[:-1] - np.diff(queue_length)
+    busy = (queue_length[:-1] > 0) & (queue_length[1:] > 0) & (served > 0)
+    if not busy.any():
+        return np.nan
+    return float(np.median(cores[:-1][busy] * interval_ms / 1000 / served[busy]))
+
+
+def controller_step(policy: str, error, integral, io_cores, initial_io_cores, total_cores, min_cores, params: Dict):
+    # new I/O cores for every simulated configuration, all arguments are arrays over the configurations
+    if policy == "pi":
+        target = initial_io_cores + np.round(params["kp"] * error + params["ki"] * integral)
+    elif policy == "threshold":
+        target = io_cores + params["delta"] * ((error > params["high"]).astype(np.int64) - (error < params["low"]).astype(np.int64))
+    else:
+        raise ValueError(f"unknown policy {policy}, expected one of {POLICIES}")
+    return np.clip(target, min_cores, total_cores - min_cores).astype(np.int64)
+
+
+def simulate(arrivals: np.ndarray, io_work: float, compute_work: float, total_cores: int, initial_io_cores: int,
+             policy: str, params: Dict[str, np.ndarray], interval_ms: float, min_cores: int = 1) -> Dict[str, np.ndarray]:
+    """
+    Fluid queue model of the two engines under the controller, for all configurations at once:
+    every request needs io_work and compute_work core seconds, the backlog of an engine grows by its work of
+    the arrivals and shrinks by its cores times the tick. params holds one array per controller parameter,
+    all of the same length (one entry per configuration).
+    Returns arrays of shape (ticks, configurations): io_cores, io_queue, compute_queue and delay_ms,
+    the time to drain both backlogs with the current cores.
+    """
+    configurations = len(next(iter(params.values())))
+    tick_s = interval_ms / 1000
+    io_cores = np.full(configurations, initial_io_cores, dtype=np.int64)
+    io_backlog = np.zeros(configurations)
+    compute_backlog = np.zeros(configurations)
+    integral = np.zeros(configurations)
+    shape = (len(arrivals), configurations)
+    result = {name: np.zeros(shape) for name in ["io_cores", "io_queue", "compute_queue", "delay_ms"]}
+    for tick, arriving in enumerate(arrivals):
+        compute_cores = total_cores - io_cores
+        io_backlog = np.maximum(io_backlog + arriving * io_work - io_cores * tick_s, 0)
+        compute_backlog = np.maximum(compute_backlog + arriving * compute_work - compute_cores * tick_s, 0)
+        io_queue = io_backlog / io_work if io_work > 0 else np.zeros(configurations)
+        compute_queue = compute_backlog / compute_work if compute_work > 0 else np.zeros(configurations)
+        result["io_cores"][tick] = io_cores
+        result["io_queue"][tick] = io_queue
+        result["compute_queue"][tick] = compute_queue
+        result["delay_ms"][tick] = (io_backlog / io_cores + compute_backlog / compute_cores) * 1000
+        error = io_queue / io_cores - compute_queue / compute_cores
+        integral += error
+        io_cores = controller_step(policy, error, integral, io_cores, initial_io_cores, total_cores, min_cores, params)
+    return result
+
+
+def parameter_grid(grid: Dict[str, List[float]]) -> Dict[str, np.ndarray]:
+    # all combinations of the listed values, one array per parameter
+    names = list(grid.keys())
+    combinations = list(itertools.product(*[grid[name] for name in names]))
+    return {name: np.array([combination[index] for combination in combinations], dtype=np.float64)
+            for index, name in enumerate(names)}
+
+
+def sweep(arrivals: np.ndarray, io_work: float, compute_work: float, total_cores: int, initial_io_cores: int,
+          policy: str, grid: Dict[str, List[float]], interval_ms: float, min_cores: int = 1) -> pd.DataFrame:
+    """
+    Simulate every combination of the parameter grid, e.g. {"kp": [...], "ki": [...]} for "pi" or
+    {"low": [...], "high": [...], "delta": [...]} for "threshold", and summarize each:
+    mean and p99 of the queueing delay, mean I/O cores, and core moves per second.
+    """
+    params = parameter_grid(grid)
+    result = simulate(arrivals, io_work, compute_work, total_cores, initial_io_cores, policy, params, interval_ms, min_cores)
+    duration_s = len(arrivals) * interval_ms / 1000
+    summary = pd.DataFrame(params)
+    summary["delay_mean_ms"] = result["delay_ms"].mean(axis=0)
+    summary["delay_p99_ms"] = np.percentile(result["delay_ms"], 99, axis=0)
+    summary["io_cores_mean"] = result["io_cores"].mean(axis=0)
+    summary["core_moves_per_s"] = np.abs(np.diff(result["io_cores"], axis=0)).sum(axis=0) / duration_s
+    return summary
+
+
+def validate(timeline: ControllerTimeline, io_engine: str, policy: str, params: Dict[str, float],
+             arrivals: Optional[np.ndarray] = None, interval_ms: float = 30, min_cores: int = 1) -> Dict[str, float]:
+    """
+    Compare the model with a recorded run: the controller alone is replayed on the recorded queue lengths
+    and its next I/O cores compared with the recorded ones (cores_mae, cores_match),
+    and with the arrivals, the whole simulation is compared with the recorded timeline (sim_*).
+    """
+    io_column = timeline.column(io_engine)
+    compute_columns = [column for column in range(len(timeline.engine_types)) if column != io_column]
+    io_cores = timeline.cores[:, io_column]
+    compute_cores = timeline.cores[:, compute_columns].sum(axis=1)
+    io_queue = timeline.queue_length[:, io_column]
+    compute_queue = timeline.queue_length[:, compute_columns].sum(axis=1)
+    total_cores = int(np.median(io_cores + compute_cores))
+    scalar_params = {name: np.array([value], dtype=np.float64) for name, value in params.items()}
+
+    error = io_queue / np.maximum(io_cores, 1) - compute_queue / np.maximum(compute_cores, 1)
+    integral = np.cumsum(error)
+    predicted = np.array([
+        controller_step(policy, error[tick:tick + 1], integral[tick:tick + 1], io_cores[tick:tick + 1], io_cores[0],
+                        total_cores, min_cores, scalar_params)[0]
+        for tick in range(len(timeline) - 1)
+    ])
+    report = {
+        "ticks": len(timeline),
+        "cores_mae": float(np.abs(predicted - io_cores[1:]).mean()) if len(predicted) > 0 else np.nan,
+        "cores_match": float((predicted == io_cores[1:]).mean()) if len(predicted) > 0 else np.nan,
+    }
+    if arrivals is not None:
+        arrivals = arrivals[:len(timeline)]
+        io_work = estimate_work(io_queue, io_cores, arrivals, interval_ms)
+        compute_work = estimate_work(compute_queue, compute_cores, arrivals, interval_ms)
+        report["io_work_ms"] = io_work * 1000
+        report["compute_work_ms"] = compute_work * 1000
+        if not np.isnan(io_work) and not np.isnan(compute_work):
+            simulated = simulate(arrivals, io_work, compute_work, total_cores, int(io_cores[0]), policy, scalar_params,
+                                 interval_ms, min_cores)
+            report["sim_cores_mae"] = float(np.abs(simulated["io_cores"][:, 0] - io_cores[:len(arrivals)]).mean())
+            report["sim_io_queue_mae"] = float(np.abs(simulated["io_queue"][:, 0] - io_queue[:len(arrivals)]).mean())
+            report["sim_compute_queue_mae"] = float(np.abs(simulated["compute_queue"][:, 0] - compute_queue[:len(arrivals)]).mean())
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from .coordinated_omission import load_rate_changes, rates_per_second
+
+    parser = argparse.ArgumentParser(description="replay a worker stdout.log through the controller model and sweep its parameters")
+    parser.add_argument("log", help="stdout.log of the worker")
+    parser.add_argument("--trace", help="--trace-path csv of the run, for the arrivals")
+    parser.add_argument("--rps", type=int, default=0, help="constant rate of the run if there is no trace")
+    parser.add_argument("--io-engine", required=True, help="engine type printed for the I/O engine")
+    parser.add_argument("--policy", choices=POLICIES, default="pi")
+    parser.add_argument("--interval-ms", type=float, default=30, help="control interval (CONTROL_INTERVAL)")
+    parser.add_argument("--params", default='{"kp": 0.008, "ki": 0.002}', help="json of the recorded run's parameters")
+    parser.add_argument("--grid", help='json of the values to sweep, e.g. {"kp": [0.004, 0.008], "ki": [0.001, 0.002]}')
+    args = parser.parse_args()
+
+    timeline = parse_controller_log(args.log)
+    arrivals = None
+    if args.trace or args.rps:
+        rate_changes = load_rate_changes(args.trace) if args.trace else None
+        ticks = len(timeline)
+        rate_per_sec = rates_per_second(args.rps, 0, rate_changes)
+        arrivals = arrivals_per_tick(rate_per_sec, args.interval_ms, ticks)
+    report = validate(timeline, args.io_engine, args.policy, json.loads(args.params), arrivals, args.interval_ms)
+    print(json.dumps(report, indent=2))
+    if args.grid:
+        if arrivals is None or np.isnan(report.get("io_work_ms", np.nan)) or np.isnan(report.get("compute_work_ms", np.nan)):
+            raise SystemExit("sweeping needs the arrivals and busy ticks to estimate the work per request")
+        io_cores = timeline.cores[:, timeline.column(args.io_engine)]
+        total_cores = int(np.median(timeline.cores.sum(axis=1)))
+        table = sweep(arrivals, report["io_work_ms"] / 1000, report["compute_work_ms"] / 1000, total_cores, int(io_cores[0]),
+                      args.policy, json.loads(args.grid), args.interval_ms)
+        print(table.sort_values("delay_p99_ms").to_string(index=False))
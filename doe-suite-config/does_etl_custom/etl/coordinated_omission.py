@@ -0,0 +1,93 @@
+import csv
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# the loader fails a run that is this late 10 times in a row, see REQ_ISSUE_SLACK_S in client/src/open_loop.rs
+REQ_ISSUE_SLACK_MS = 100
+
+
+def load_rate_changes(path: str) -> List[Tuple[int, int]]:
+    # (time_sec, requests_per_sec) of a --trace-path csv, checked like client/src/rate_change.rs does
+    with open(path, "r", newline="") as trace_file:
+        reader = csv.reader(trace_file)
+        header = next(reader, None)
+        if header is None or [column.strip() for column in header] != ["time_sec", "requests_per_sec"]:
+            raise ValueError(f"trace {path} must have the columns time_sec,requests_per_sec")
+        changes = [(int(row[0]), int(row[1])) for row in reader if len(row) > 0]
+    if len(changes) == 0 or changes[0][0] != 0:
+        raise ValueError(f"trace {path} must start from second 0")
+    if any(later[0] <= earlier[0] for earlier, later in zip(changes, changes[1:])):
+        raise ValueError(f"time_sec values of trace {path} must be strictly increasing")
+    return changes
+
+
+def rates_per_second(rps: int, request_count: int, rate_changes: Optional[List[Tuple[int, int]]] = None) -> np.ndarray:
+    """
+    Rate of every second of the schedule, long enough for request_count requests.
+    Without a trace the rate of the file name is sent throughout, with a trace its last rate is kept until the end,
+    as the loader does for a duration longer than the trace.
+    The warm-up ramp of the loader is not part of the log, so it is not part of the schedule either.
+    """
+    if rate_changes is None:
+        rate_changes = [(0, rps)]
+    rates = []
+    for index, (time, rate) in enumerate(rate_changes):
+        end = rate_changes[index + 1][0] if index + 1 < len(rate_changes) else time + 1
+        rates.extend([rate] * (end - time))
+    rates = np.array(rates, dtype=np.int64)
+    missing = request_count - int(rates.sum())
+    if missing > 0 and rates[-1] > 0:
+        rates = np.r_[rates, np.full(int(np.ceil(missing / rates[-1])), rates[-1])]
+    return rates
+
+
+def intended_schedule(rate_per_sec: np.ndarray, request_count: int) -> np.ndarray:
+    """
+    Intended send times in us after the start of the schedule, as client/src/generator.rs generates them:
+    the next request is 1 / rate after the previous one, with the rate of the second the previous one fell into.
+    """
+    times = []
+    scheduled = 0
+    now = 0.0
+    for second, rate in enumerate(rate_per_sec):
+        if scheduled >= request_count:
+            break
+        if now >= second + 1:
+            continue
+        if rate <= 0:
+            now = float(second + 1)
+            continue
+        # steps taken while now is within this second
+        steps = int(np.ceil((second + 1 - now) * rate))
+        times.append(now + np.arange(1, steps + 1) / rate)
+        now = float(times[-1][-1])
+        scheduled += steps
+    schedule = np.concatenate(times) if times else np.zeros(0)
+    return schedule[:request_count] * 1e6
+
+
+def loader_lag(start_us: np.ndarray, schedule_us: np.ndarray) -> np.ndarray:
+    """
+    How late (in us) every request was sent compared to its intended send time, in the order of start_us.
+    The i-th request sent is the i-th one scheduled, and as no request is sent early, the start of the schedule
+    is placed so the least late request was sent on time.
+    """
+    order = np.argsort(start_us, kind="stable")
+    count = min(len(start_us), len(schedule_us))
+    sent = start_us[order][:count].astype(np.float64)
+    offsets = sent - schedule_us[:count]
+    lag = np.full(len(start_us), np.nan)
+    if count > 0:
+        lag[order[:count]] = offsets - offsets.min()
+    return lag
+
+
+def corrected_latency_ms(latency_ms: np.ndarray, lag_us: np.ndarray) -> np.ndarray:
+    # latency from the intended send time, what a request would have seen had the loader kept up
+    return latency_ms + np.nan_to_num(lag_us) / 1000
+
+
+def loader_bottleneck(lag_ms_p99: float, max_lag_ms: float = REQ_ISSUE_SLACK_MS) -> bool:
+    # the loader could not keep up with the schedule when the lag of its tail exceeds the slack
+    return bool(lag_ms_p99 > max_lag_ms)
@@ -15,6 +15,7 @@ import pickle
 from .helpers import *
 import math
 from .general import create_fig 
+from .capacity import annotate_capacity
 
 class LineStyle:
     def __init__(self, name, marker, color, linestyle='solid'):
@@ -114,6 +115,8 @@ class HybridLatencyPlotLoader(PlotLoader):
         return fig
 
 class HybridvsSplitLatencyPlotLoader(PlotLoader):
+
+    annotate_capacity: bool = True
     
     def load(self, df: pd.DataFrame, options: Dict,  etl_info: Dict) -> None:
         percentiles = [50, 90, 95, 99]
@@ -187,6 +190,9 @@ class HybridvsSplitLatencyPlotLoader(PlotLoader):
                     linewidth=3,
                     markevery=2,
                     )
+        # knee and SLO capacity, if the CapacityTransformer ran
+        if options.get('annotate_capacity', True):
+            annotate_capacity(axis, controller_df, LINE_DICT[label].color)
         
         # add lines for hybrid
         hybrid_df = df[(df['exp_name'] == 'cpu_efficiency_hybrid') | (df['exp_name'] == 'cpu_efficiency_hybrid_multithread')]
@@ -216,6 +222,8 @@ class HybridvsSplitLatencyPlotLoader(PlotLoader):
                         linewidth=3,
                         markevery=2,
                         )       
+            if options.get('annotate_capacity', True):
+                annotate_capacity(axis, hybrid_group, LINE_DICT[label].color)
         axis.grid(True)
         axis.set_xlabel('RPS')
         axis.set_ylabel(f"Latency P{percentile} (ms)")
@@ -3,16 +3,27 @@ from doespy.etl.steps.transformers import Transformer
 from doespy.etl.steps.loaders import Loader, PlotLoader
 
 import pandas as pd
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
 import itertools 
 import re 
+import numpy as np
 from numpy import int64,ndarray
 from pathlib import PurePath 
 import pickle
 from .helpers import *
+from .coordinated_omission import REQ_ISSUE_SLACK_MS, corrected_latency_ms, intended_schedule, load_rate_changes, loader_bottleneck, loader_lag, rates_per_second
+from .capacity import annotate_capacity, capacity_table, failure_rates, group_capacity, slo_limits
+from .latency_log import INSTANCE_CLASSES, class_column, iter_latency_log, rate_from_path
+from .latency_sketch import BinnedLatencySketch, LatencySketch
+from .parallel import extract_summary
+from .request_join import DEFAULT_BUCKETS, join_requests, tail_attribution, timestamps_path
+from .span_events import grouped_summary, parse_span_events
+from .span_tree import build_span_tree, dominant_phases
+from .steady_state import binned_means, mser_truncation
 import math
+import os
 
 
 class MyExtractor(Extractor):
@@ -28,96 +39,350 @@ class TimestampExtractor(Extractor):
     quartiles: Tuple[float,float] = (0.25,0.75)
     whiskers: Tuple[int,int] = (0.05,0.95)
 
+    summary_version: int = 2
+    workers: int = 0
+
     def default_file_regex():
         return [r"timestamps.*\.csv$"]
 
     def extract(self, path: str, options: Dict) -> List[Dict]:
-        summary_path = PurePath(path).with_suffix('.pkl')
-        try:
-            summary_file = open(summary_path, 'rb')
-            return [pickle.load(summary_file)]
-        except: 
-            pass
-        timestamp_file = open(path)
+        return extract_summary(self, path, options)
+
+    def summarize(self, path: str, options: Dict) -> List[Dict]:
         path_parser = re.fullmatch("(.*)hot_([0-9]+)_rate\.csv",path)
-        series_list = []
-        for timestamp_line in timestamp_file:
-            event_list = re.findall("parent:([0-9]+), span:([0-9]+), time:([0-9]+), point:(\w+)", timestamp_line)
-            event_list = [ (event[2], f"T{index:02}_{event[3]}") for index,event in enumerate(event_list) ]
-            span_list = [(p_event, n_event) for (p_event,n_event) in zip(event_list, event_list[1:])]
-            span_dict = {p_event[1]: int64(n_event[0])-int64(p_event[0]) for (p_event,n_event) in span_list}
-            span_series = pd.Series(span_dict)
-            series_list.append(span_series)
-            # TODO: validate all spans have the same form 
-            # span_dict_list.append(span_dict)
-            # if re.search(".*dedicated.*", path) is not None:
-            #     print(span_dict) 
-        timestamp_frame = pd.DataFrame(series_list)
+        span_events = parse_span_events(path)
+        # spans between consecutive events of a request, named after the position and point of the first event
+        labels, durations, label_names = span_events.consecutive_spans()
+        # TODO: validate all spans have the same form 
         span_dict = {'clients': path_parser[2]}
-        for column in timestamp_frame.columns:
-            column_frame = timestamp_frame[column]
-            span_dict[f'{column}_mean'] = column_frame.mean()
-            span_dict[f'{column}_med'] = column_frame.median()
-            span_dict[f'{column}_q1'] = column_frame.quantile(options['quartiles'][0])
-            span_dict[f'{column}_q3'] = column_frame.quantile(options['quartiles'][1])
-            span_dict[f'{column}_whislo'] = column_frame.quantile(options['whiskers'][0])
-            span_dict[f'{column}_whishi'] = column_frame.quantile(options['whiskers'][1])
-            # print(column_frame[column_frame > column_frame.quantile(options['whiskers'][1])])
-        # create a summary to load instead of repeating preprocessing
-        summary_file = open(summary_path, 'wb')
-        pickle.dump(span_dict,summary_file) 
+        span_dict.update(grouped_summary(labels, durations, label_names, options['quartiles'], options['whiskers']))
         return [span_dict]
 
+class SpanTreeExtractor(Extractor):
+    """
+    Rebuild the span tree of every request from the parent/span ids of a timestamp dump and report,
+    per span kind, the mean critical path and self time of the requests around each latency bucket
+    and which kind dominates it, see span_tree.py.
+    """
+
+    # quantile ranges of the request latency to report
+    buckets: Dict[str, Tuple[float, float]] = {"p50": (0.45, 0.55), "p99": (0.99, 1.0)}
+    # lines before the first request, MorelloTimestampExtractor dumps start with one
+    skip_lines: int = 0
+
+    summary_version: int = 1
+    workers: int = 0
+
+    def default_file_regex():
+        return [r"timestamps.*\.csv$"]
+
+    def extract(self, path: str, options: Dict) -> List[Dict]:
+        return extract_summary(self, path, options)
+
+    def summarize(self, path: str, options: Dict) -> List[Dict]:
+        span_tree = build_span_tree(parse_span_events(path, skip_lines=self.skip_lines))
+        if span_tree.request_count == 0:
+            print(f"no requests in {path}")
+            return []
+        span_dict = {"rps": rate_from_path(path), "requests": span_tree.request_count}
+        span_dict.update(dominant_phases(span_tree, self.buckets))
+        return [span_dict]
+
+class RequestJoinExtractor(Extractor):
+    """
+    Join every latency log with the timestamp dump of the same rate request by request (see request_join.py)
+    and report the mean phase composition of the requests in each latency percentile bucket.
+    With per_request the joined requests are returned instead, one row each.
+    """
+
+    # latency percentile ranges, the last one includes the maximum
+    buckets: List[Tuple[float, float]] = DEFAULT_BUCKETS
+    # {phase: [(start point, end point), ...]} like DISPATCHER_PHASES, None attributes by span kind on the critical path
+    phases: Optional[Dict[str, List[Tuple[str, str]]]] = None
+    # phase covering the whole dispatcher time, the rest of the client latency is reported as Outside
+    total_phase: Optional[str] = None
+    skip_lines: int = 0
+    # microseconds per time unit of the dump, None guesses it from the length of the run
+    time_unit_us: Optional[float] = None
+    per_request: bool = False
+
+    summary_version: int = 1
+    workers: int = 0
+
+    def default_file_regex():
+        return [r"latencies.*\.csv$"]
+
+    def extract(self, path: str, options: Dict) -> List[Dict]:
+        return extract_summary(self, path, options)
+
+    def summarize(self, path: str, options: Dict) -> List[Dict]:
+        timestamp_path = timestamps_path(path)
+        if not os.path.exists(timestamp_path):
+            print(f"no timestamps for {path}")
+            return []
+        requests = join_requests(path, timestamp_path, self.phases, self.total_phase, self.skip_lines, self.time_unit_us)
+        if requests.empty:
+            return []
+        rps = rate_from_path(path)
+        if self.per_request:
+            requests.insert(0, "rps", rps)
+            return requests.to_dict("records")
+        phase_columns = [column for column in requests.columns
+                         if column not in ["start_us", "instance", "failed", "latency_ms"]]
+        rows = tail_attribution(requests, phase_columns, [tuple(bucket) for bucket in self.buckets])
+        for row in rows:
+            row["rps"] = rps
+        return rows
+
 class LatencyExtractor(Extractor):
+
+    summary_version: int = 5
+    workers: int = 0
+    # relative error bound of the percentiles, see LatencySketch
+    sketch_accuracy: float = 0.01
+    # "mser" detects the end of the warm-up per file (see steady_state.py), "fixed" skips warmup_seconds
+    steady_state: str = "mser"
+    warmup_seconds: float = 10
+    steady_state_bin_ms: int = 200
+    # classes of the url that get their own summary columns prefixed with the class, e.g. hot_latency_p99.0
+    instance_classes: List[str] = INSTANCE_CLASSES
+    # rebuild the intended send time of every request of an open loop run, see coordinated_omission.py,
+    # and report the loader lag and the latency from the intended send time as loader_lag_p* and corrected_latency_p*
+    coordinated_omission: bool = False
+    # --trace-path csv the run was loaded with, without one the rate in the file name is the schedule
+    trace_path: Optional[str] = None
+    max_loader_lag_ms: float = REQ_ISSUE_SLACK_MS
     
     def default_file_regex():
         return [r"latencies.*\.csv$"]
 
     def extract(self, path: str, options: Dict) -> List[Dict]:
-        log_summary_path = PurePath(path).with_suffix('.pkl')
-        try:
-            log_summary_file = open(log_summary_path, 'rb')
-            return pickle.load(log_summary_file)
-        except: 
-            pass
-        latency_log = open(path)
-        end2end_list = []
-        total_requests = 0
-        total_failures = 0
-        path_parser = re.fullmatch("(.*)hot_([0-9]+)_rate\.csv",path)
-        # path_parser = re.fullmatch("(.*)hot_([0-9]+)_rps\.csv",path)
-        time_start_us = None
-        for index, latency_line in enumerate(latency_log.readlines()[1:]):
-            current_latency = re.fullmatch("http://[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}:8080/(\w+)/(\w+),([0-9]+),([0-9]+),(\w+),(\w+),([0-9]{1,3})\n", latency_line)
-            if current_latency is not None:
-                # skip first 10 seconds
-                seconds_skipped = 10
-                time_current_us = int(current_latency[3])
-                if time_start_us == None:
-                    time_start_us = time_current_us
-                if (time_current_us - time_start_us) / 1e6 < seconds_skipped:
-                    continue
-                total_requests = total_requests + 1
-                # check if timeout or other failure
-                if current_latency[5] == "true" or current_latency[6] == "true":
-                    total_failures = total_failures + 1
-                end2end_list.append(int(current_latency[4])/1000)
-            else:
-                print(f"could not parse latency line for {path} at line {index + 1}")
-
-        end2end_series = pd.Series(end2end_list)
-        span_dict = { "rps" : int(path_parser[2]),
-                     "total_requests": total_requests,
-                     "total_failures": total_failures} 
+        return extract_summary(self, path, options)
+
+    def summarize(self, path: str, options: Dict) -> List[Dict]:
+        # single pass over the log, only per bin sketches of the latencies are kept
+        latency_bins = None
+        class_bins = {}
+        # the schedule needs the start order, so only the starts and latencies are kept for it
+        start_chunks, latency_chunks = [], []
+        malformed = 0
+        for latency_chunk in iter_latency_log(path):
+            malformed += latency_chunk.malformed
+            if len(latency_chunk) == 0:
+                continue
+            if self.coordinated_omission:
+                start_chunks.append(latency_chunk.start_us)
+                latency_chunks.append(latency_chunk.latency_ms)
+            # responses arrive roughly in start order, so the first block holds the earliest start
+            if latency_bins is None:
+                latency_bins = BinnedLatencySketch(self.steady_state_bin_ms * 1000, latency_chunk.start_us.min(), self.sketch_accuracy)
+                class_bins = {instance_class: BinnedLatencySketch(latency_bins.bin_us, latency_bins.origin_us, self.sketch_accuracy)
+                              for instance_class in self.instance_classes}
+            latency_bins.add(latency_chunk.start_us, latency_chunk.latency_ms, latency_chunk.failed)
+            for instance_class, bins in class_bins.items():
+                class_chunk = latency_chunk.filter(latency_chunk.instance == instance_class)
+                bins.add(class_chunk.start_us, class_chunk.latency_ms, class_chunk.failed)
+        if malformed > 0:
+            print(f"could not parse {malformed} latency lines for {path}")
+        if latency_bins is None:
+            latency_bins = BinnedLatencySketch(self.steady_state_bin_ms * 1000, 0, self.sketch_accuracy)
+
+        # the warm-up is detected on all requests, so the classes share the steady window
+        if self.steady_state == "mser":
+            cutoff_bin = mser_truncation(binned_means(latency_bins.latency_sums, latency_bins.counts))
+        elif self.steady_state == "fixed":
+            cutoff_bin = math.ceil(self.warmup_seconds * 1000 / self.steady_state_bin_ms)
+        else:
+            raise ValueError(f"unknown steady state detection {self.steady_state}, expected mser or fixed")
+        steady_window_s = max(len(latency_bins) - cutoff_bin, 0) * self.steady_state_bin_ms / 1000
         percentiles = [5, 50, 90, 95, 99, 100]
         if 'percentiles' in options.keys():
             percentiles = options['percentiles'] 
-        for percentile in percentiles:
-            span_dict[f"latency_p{percentile:3.1f}"] = end2end_series.quantile(percentile/100)
-        log_summary_file = open(log_summary_path, 'wb')
-        pickle.dump([span_dict],log_summary_file) 
+        span_dict = { "rps" : rate_from_path(path),
+                     # the percentiles are over requests started in [warmup_cutoff_s, warmup_cutoff_s + steady_window_s)
+                     "warmup_cutoff_s": cutoff_bin * self.steady_state_bin_ms / 1000,
+                     "steady_window_s": steady_window_s}
+        for instance_class, bins in [("all", latency_bins)] + list(class_bins.items()):
+            total_requests = int(bins.counts[cutoff_bin:].sum())
+            if instance_class != "all" and total_requests == 0:
+                continue
+            latency_sketch = bins.sketch(cutoff_bin)
+            span_dict[class_column(instance_class, "total_requests")] = total_requests
+            span_dict[class_column(instance_class, "total_failures")] = int(bins.failures[cutoff_bin:].sum())
+            span_dict[class_column(instance_class, "throughput_rps")] = total_requests / steady_window_s if steady_window_s > 0 else math.nan
+            span_dict[class_column(instance_class, "latency_sketch")] = latency_sketch
+            for column, value in latency_sketch.percentiles(percentiles).items():
+                span_dict[class_column(instance_class, column)] = value
+        if self.coordinated_omission and len(start_chunks) > 0:
+            span_dict.update(self.schedule_summary(path, np.concatenate(start_chunks), np.concatenate(latency_chunks),
+                                                   latency_bins, cutoff_bin, percentiles))
         return [span_dict] 
 
+    def schedule_summary(self, path, start_us, latency_ms, latency_bins, cutoff_bin, percentiles) -> Dict:
+        rate_changes = load_rate_changes(self.trace_path) if self.trace_path else None
+        rate_per_sec = rates_per_second(rate_from_path(path), len(start_us), rate_changes)
+        lag_us = loader_lag(start_us, intended_schedule(rate_per_sec, len(start_us)))
+        # same steady window as the measured latencies
+        steady = np.maximum((start_us - latency_bins.origin_us) // latency_bins.bin_us, 0) >= cutoff_bin
+        lag_sketch = LatencySketch(self.sketch_accuracy)
+        lag_sketch.add(lag_us[steady & ~np.isnan(lag_us)] / 1000)
+        corrected_sketch = LatencySketch(self.sketch_accuracy)
+        corrected_sketch.add(corrected_latency_ms(latency_ms, lag_us)[steady])
+        summary = {"loader_lag_sketch": lag_sketch, "corrected_latency_sketch": corrected_sketch}
+        for column, value in lag_sketch.percentiles(percentiles).items():
+            summary[column.replace("latency_", "loader_lag_")] = value
+        for column, value in corrected_sketch.percentiles(percentiles).items():
+            summary[f"corrected_{column}"] = value
+        summary["loader_bottleneck"] = loader_bottleneck(lag_sketch.quantiles([0.99])[0], self.max_loader_lag_ms)
+        if summary["loader_bottleneck"]:
+            print(f"loader fell behind its schedule for {path}, p99 lag {lag_sketch.quantiles([0.99])[0]:.1f}ms")
+        return summary
+
+
+class LatencySketchMergeTransformer(Transformer):
+    """
+    Merge the latency sketches of all rows that agree on group_by (e.g. all factors except the repetition)
+    and recompute the percentiles over the merged distribution.
+    """
+
+    group_by: List[str]
+
+    percentiles: List[float] = [5, 50, 90, 95, 99, 100]
+
+    def transform(self, df: pd.DataFrame, options: Dict) -> pd.DataFrame:
+        if df.empty:
+            return df
+        df = df[df['latency_sketch'].notna()]
+        group_by = options.get('group_by', self.group_by)
+        percentiles = options.get('percentiles', self.percentiles)
+        merged_rows = []
+        for group_name, group in df.groupby(group_by):
+            if not isinstance(group_name, tuple):
+                group_name = (group_name,)
+            merged_row = dict(zip(group_by, group_name))
+            for instance_class in ["all"] + INSTANCE_CLASSES:
+                sketch_column = class_column(instance_class, 'latency_sketch')
+                if sketch_column not in group.columns or group[sketch_column].isna().all():
+                    continue
+                latency_sketch = LatencySketch.merged(group[sketch_column].dropna())
+                for column in ['total_requests', 'total_failures']:
+                    merged_row[class_column(instance_class, column)] = group[class_column(instance_class, column)].sum()
+                merged_row[sketch_column] = latency_sketch
+                for column, value in latency_sketch.percentiles(percentiles).items():
+                    merged_row[class_column(instance_class, column)] = value
+            merged_rows.append(merged_row)
+        return pd.DataFrame(merged_rows)
+
+
+def explode_columns(df: pd.DataFrame, array_columns: List[str] = []) -> pd.DataFrame:
+    # one row per array element, array_columns defaults to all columns with an array in the first row
+    if df.empty:
+        return df
+    array_columns = array_columns or [column for column in df.columns if isinstance(df[column].iloc[0], ndarray)]
+    lengths = np.array([len(values) for values in df[array_columns[0]]], dtype=np.int64)
+    for column in array_columns[1:]:
+        if not np.array_equal(lengths, [len(values) for values in df[column]]):
+            raise ValueError(f"the arrays of {column} and {array_columns[0]} differ in length")
+    exploded = {}
+    for column in df.columns:
+        if column in array_columns:
+            exploded[column] = np.concatenate(df[column].to_list())
+        elif pd.api.types.is_numeric_dtype(df[column]) or pd.api.types.is_bool_dtype(df[column]):
+            exploded[column] = np.repeat(df[column].to_numpy(), lengths)
+        else:
+            codes, categories = pd.factorize(df[column])
+            exploded[column] = pd.Categorical.from_codes(np.repeat(codes, lengths), categories)
+    return pd.DataFrame(exploded)
+
+
+class ExplodeColumnsTransformer(Transformer):
+    """
+    Expand rows whose columns hold equally long arrays (e.g. one row per file from MixedWorkloadExtractor)
+    into one row per array element, the other columns are repeated as categoricals.
+    """
+
+    # columns holding arrays, all columns with an array in the first row if empty
+    columns: List[str] = []
+
+    def transform(self, df: pd.DataFrame, options: Dict) -> pd.DataFrame:
+        return explode_columns(df, options.get('columns', self.columns))
+
+class CapacityTransformer(Transformer):
+    """
+    For every group of a load latency sweep (one row per rate), add the knee of the latency curve,
+    the highest rate that stays within the SLO (p50/p99 latency and failure rate) and the capacity
+    interpolated between that rate and the next sweep step, see capacity.py.
+    Use CapacityTableLoader to write them as a table, the load latency plot loaders draw them.
+    """
+
+    group_by: List[str] = ['server', 'function', 'size', 'hotpercent']
+
+    slo_p50_ms: Optional[float] = None
+
+    slo_p99_ms: Optional[float] = 100
+
+    max_failure_rate: float = 0.005
+
+    knee_percentile: float = 50
+
+    def transform(self, df: pd.DataFrame, options: Dict) -> pd.DataFrame:
+        if df.empty:
+            return df
+        group_by = [column for column in options.get('group_by', self.group_by) if column in df.columns]
+        limits = slo_limits(options.get('slo_p50_ms', self.slo_p50_ms),
+                            options.get('slo_p99_ms', self.slo_p99_ms),
+                            options.get('max_failure_rate', self.max_failure_rate))
+        knee_column = f"latency_p{options.get('knee_percentile', self.knee_percentile):3.1f}"
+        df = df.copy()
+        df['failure_rate'] = failure_rates(df)
+        groups = df.groupby(group_by, dropna=False) if group_by else [(None, df)]
+        for _, group in groups:
+            for column, value in group_capacity(group, limits, knee_column).items():
+                df.loc[group.index, column] = value
+        return df
+
+class CapacityTableLoader(Loader):
+
+    group_by: List[str] = ['server', 'function', 'size', 'hotpercent']
+
+    def load(self, df: pd.DataFrame, options: Dict, etl_info: Dict) -> None:
+        if not df.empty:
+            group_by = [column for column in options.get('group_by', self.group_by) if column in df.columns]
+            table = capacity_table(df, group_by)
+            print(table.to_string(index=False))
+            output_dir = self.get_output_dir(etl_info)
+            table.to_csv(os.path.join(output_dir, "capacity.csv"), index=False)
+
+class SpanTreeReportLoader(Loader):
+
+    group_by: List[str] = ['server', 'function', 'rps']
+
+    def load(self, df: pd.DataFrame, options: Dict, etl_info: Dict) -> None:
+        if not df.empty:
+            group_by = [column for column in options.get('group_by', self.group_by) if column in df.columns]
+            df = df.sort_values(group_by, ignore_index=True)
+            dominant_columns = [column for column in df.columns if column.startswith('dominant_')]
+            print(df[group_by + dominant_columns].to_string(index=False))
+            report_columns = [column for column in df.columns
+                              if column.startswith(('dominant_', 'latency_', 'critical_', 'self_'))]
+            output_dir = self.get_output_dir(etl_info)
+            df[group_by + ['requests'] + report_columns].to_csv(os.path.join(output_dir, "critical_path.csv"), index=False)
+
+class TailAttributionLoader(Loader):
+
+    group_by: List[str] = ['server', 'function', 'rps']
+
+    def load(self, df: pd.DataFrame, options: Dict, etl_info: Dict) -> None:
+        if not df.empty:
+            group_by = [column for column in options.get('group_by', self.group_by) if column in df.columns]
+            phase_columns = [column for column in df.columns if column.endswith('_ms') and column != 'latency_ms']
+            # keep the bucket order of the extractor within every group
+            df = df.sort_values(group_by, kind='stable', ignore_index=True)
+            table = df[group_by + ['bucket', 'requests', 'latency_ms', 'failure_rate'] + phase_columns]
+            print(table.to_string(index=False))
+            output_dir = self.get_output_dir(etl_info)
+            table.to_csv(os.path.join(output_dir, "tail_attribution.csv"), index=False)
+
 class MyTransformer(Transformer):
     def transform(self, df: pd.DataFrame, options: Dict) -> pd.DataFrame:
         print(f"MyTransformer: do nothing  ({df.info()})")
@@ -234,6 +499,11 @@ class LoadLatencyPlotLoader(PlotLoader):
 
     line_group_bys: List[str] = ['server']
 
+    annotate_capacity: bool = True
+
+    # lines to draw per group: "all" for the blended latencies, "hot" or "cold" for one class of requests
+    instance_classes: List[str] = ["all"]
+
     def load(self, df: pd.DataFrame, options: Dict, etl_info: Dict) -> None:
         if not df.empty:
             # group for different plots
@@ -256,6 +526,8 @@ class LoadLatencyPlotLoader(PlotLoader):
                     file_name = figurename.replace(' ', '_').replace(":","_")
                     self.save_plot(fig, filename=file_name, output_dir=output_dir)
 
+INSTANCE_LINESTYLES = {"all": "dashed", "hot": "solid", "cold": "dotted"}
+
 def create_fig(df, options, percentile):
     # decide on grid size
     horizontal_groups = get_groupby_len(df, options['horizontal_group_bys'])
@@ -339,12 +611,28 @@ def add_lines(axis, df, options, x_col_name, y_col_name, title):
     for (group_name, group) in grouped:
         group.sort_values(x_col_name, ignore_index=True, inplace=True)
         # axis.errorbar(target_frame['rps'], target_frame['latency_p50'], yerr=(target_frame['latency_p5'], target_frame['latency_p95']), label=target)
-        axis.plot(
-            group[x_col_name],
-            group[y_col_name],
-            label=get_group_name(group_name,line_group_list),
-            linestyle="dashed",
-            marker=next(marker_cycle),
-        )
+        instance_classes = options.get('instance_classes', ["all"])
+        marker = next(marker_cycle)
+        color = None
+        for instance_class in instance_classes:
+            class_y_col_name = class_column(instance_class, y_col_name)
+            if class_y_col_name not in group.columns:
+                continue
+            label = get_group_name(group_name,line_group_list)
+            if len(instance_classes) > 1:
+                label = f"{label.rstrip()} {instance_class}"
+            lines = axis.plot(
+                group[x_col_name],
+                group[class_y_col_name],
+                label=label,
+                linestyle=INSTANCE_LINESTYLES.get(instance_class, "dashed"),
+                marker=marker,
+                color=color,
+            )
+            # the classes of a group share its color
+            color = lines[0].get_color()
+            # knee and SLO capacity, if the CapacityTransformer ran, are computed from the blended latencies
+            if instance_class == "all" and options.get('annotate_capacity', True):
+                annotate_capacity(axis, group, color)
         axis.grid(True)
         axis.set_title(title)
\ No newline at end of file
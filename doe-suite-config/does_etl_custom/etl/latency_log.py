@@ -0,0 +1,239 @@
+import io
+import re
+from typing import Dict, Iterator, List
+
+import numpy as np
+import pandas as pd
+
+# columns as written by client/src/file_writing.rs::write_latencies
+LATENCY_COLUMNS = ["instance", "startTime", "responseTime", "connectionTimeout", "functionTimeout", "statusCode"]
+LATENCY_DTYPES = {
+    "instance": "category",
+    "startTime": "int64",
+    "responseTime": "int64",
+    "connectionTimeout": "category",
+    "functionTimeout": "category",
+    "statusCode": "int16",
+}
+
+URL_REGEX = re.compile(r"http://[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}:8080/(\w+)/(\w+)")
+RATE_REGEX = re.compile(r"(.*)hot_([0-9]+)_rate\.csv")
+# the client sends hot requests to /hot/<function> and cold ones to /cold/<function>, see client/src/request_type.rs
+INSTANCE_CLASSES = ["hot", "cold"]
+
+
+class LatencyLog:
+    """
+    Columns of one latency log, each a NumPy array with one entry per well formed row.
+    Rows stay in file order, which is the order the loader received the responses in.
+    """
+
+    def __init__(self, path, instance, function, start_us, latency_us, timeout, error, status, malformed=0):
+        self.path = path
+        # url path is /<instance>/<function>, where instance is hot or cold
+        self.instance = instance
+        self.function = function
+        self.start_us = start_us
+        self.latency_us = latency_us
+        self.timeout = timeout
+        self.error = error
+        self.status = status
+        # number of rows that could not be parsed and were dropped
+        self.malformed = malformed
+
+    def __len__(self):
+        return len(self.start_us)
+
+    @property
+    def failed(self) -> np.ndarray:
+        return self.timeout | self.error
+
+    @property
+    def latency_ms(self) -> np.ndarray:
+        return self.latency_us / 1000
+
+    def filter(self, mask: np.ndarray) -> "LatencyLog":
+        return LatencyLog(
+            self.path,
+            self.instance[mask],
+            self.function[mask],
+            self.start_us[mask],
+            self.latency_us[mask],
+            self.timeout[mask],
+            self.error[mask],
+            self.status[mask],
+            self.malformed,
+        )
+
+    @classmethod
+    def concat(cls, path: str, logs: List["LatencyLog"]) -> "LatencyLog":
+        if len(logs) == 1:
+            return logs[0]
+        if len(logs) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return cls(path, empty.astype(object), empty.astype(object), empty, empty,
+                       empty.astype(bool), empty.astype(bool), empty.astype(np.int16))
+        return cls(
+            path,
+            np.concatenate([log.instance for log in logs]),
+            np.concatenate([log.function for log in logs]),
+            np.concatenate([log.start_us for log in logs]),
+            np.concatenate([log.latency_us for log in logs]),
+            np.concatenate([log.timeout for log in logs]),
+            np.concatenate([log.error for log in logs]),
+            np.concatenate([log.status for log in logs]),
+            sum(log.malformed for log in logs),
+        )
+
+    def report_malformed(self):
+        if self.malformed > 0:
+            print(f"could not parse {self.malformed} latency lines for {self.path}")
+
+
+def rate_from_path(path: str) -> int:
+    return int(RATE_REGEX.fullmatch(path)[2])
+
+
+def class_column(instance_class: str, column: str) -> str:
+    # summary columns of the hot or cold requests carry the class as prefix, the blended ones ("all") none
+    return column if instance_class == "all" else f"{instance_class}_{column}"
+
+
+def read_latency_log(path: str) -> LatencyLog:
+    return LatencyLog.concat(path, list(iter_latency_log(path)))
+
+
+def iter_latency_log(path: str, chunk_bytes: int = 1 << 26, use_store: bool = True) -> Iterator[LatencyLog]:
+    """
+    Read the latency log in blocks of whole lines of about chunk_bytes,
+    so a single pass over a large file only holds one block of columns at a time.
+    If the file was ingested into the results store (DOES_ETL_STORE_DIR), its parquet copy is read instead.
+    """
+    if use_store:
+        from .results_store import iter_stored_latency_log, stored_entry
+        entry = stored_entry(path)
+        if entry is not None:
+            yield from iter_stored_latency_log(path, entry)
+            return
+    with open(path, "rb") as latency_file:
+        header = latency_file.readline().decode().strip().split(",")
+        if header != LATENCY_COLUMNS:
+            raise ValueError(f"unexpected latency log header in {path}: {header}")
+        remainder = b""
+        while True:
+            block = latency_file.read(chunk_bytes)
+            if not block:
+                break
+            block = remainder + block
+            line_end = block.rfind(b"\n") + 1
+            remainder = block[line_end:]
+            if line_end > 0:
+                yield _parse_block(path, block[:line_end])
+        if remainder.strip():
+            yield _parse_block(path, remainder)
+
+
+def _parse_block(path: str, block: bytes) -> LatencyLog:
+    dropped = 0
+    try:
+        frame = pd.read_csv(io.BytesIO(block), header=None, names=LATENCY_COLUMNS, dtype=LATENCY_DTYPES)
+        # a first row with a field too many silently turns into the index
+        if not isinstance(frame.index, pd.RangeIndex):
+            raise ValueError("extra field in first row")
+        tolerant = False
+    except (ValueError, pd.errors.ParserError):
+        # some rows are broken: drop the ones with a wrong field count, parse the rest without the integer dtypes
+        block, dropped = _drop_wrong_field_counts(block)
+        frame = _read_frame_tolerant(block)
+        tolerant = True
+
+    instance, function, valid = _split_urls(frame["instance"])
+    start_us = frame["startTime"].to_numpy()
+    latency_us = frame["responseTime"].to_numpy()
+    status = frame["statusCode"].to_numpy()
+    timeout, timeout_valid = _parse_bools(frame["connectionTimeout"])
+    error, error_valid = _parse_bools(frame["functionTimeout"])
+    valid &= timeout_valid & error_valid
+    if tolerant:
+        # unparsable fields and rows with a wrong field count are NaN at this point
+        valid &= ~(np.isnan(start_us) | np.isnan(latency_us) | np.isnan(status))
+        valid &= (status >= 0) & (status <= 999)
+        start_us = np.nan_to_num(start_us).astype(np.int64)
+        latency_us = np.nan_to_num(latency_us).astype(np.int64)
+        status = np.nan_to_num(status).astype(np.int16)
+
+    log = LatencyLog(path, instance, function, start_us, latency_us, timeout, error, status)
+    if not valid.all():
+        log = log.filter(valid)
+    log.malformed = int((~valid).sum()) + dropped
+    return log
+
+
+def _drop_wrong_field_counts(block: bytes):
+    # removes the non-empty lines without exactly one field per column, returns the rest and their number
+    data = np.frombuffer(block, dtype=np.uint8)
+    line_ends = np.flatnonzero(data == ord("\n"))
+    if len(line_ends) == 0 or line_ends[-1] != len(data) - 1:
+        line_ends = np.append(line_ends, len(data))
+    line_starts = np.concatenate([[0], line_ends[:-1] + 1])
+    commas = np.flatnonzero(data == ord(","))
+    field_counts = np.searchsorted(commas, line_ends) - np.searchsorted(commas, line_starts) + 1
+    wrong = (field_counts != len(LATENCY_COLUMNS)) & (line_ends > line_starts)
+    if not wrong.any():
+        return block, 0
+    pieces, kept_from = [], 0
+    for line_start, line_end in zip(line_starts[wrong], line_ends[wrong]):
+        pieces.append(block[kept_from:line_start])
+        kept_from = line_end + 1
+    pieces.append(block[kept_from:])
+    return b"".join(pieces), int(wrong.sum())
+
+
+def _read_frame_tolerant(block: bytes) -> pd.DataFrame:
+    # every row has the right field count, unparsable numbers become NaN
+    if not block.strip():
+        return pd.DataFrame({column: pd.Series(dtype="float64") for column in LATENCY_COLUMNS})
+    frame = pd.read_csv(io.BytesIO(block), header=None, names=LATENCY_COLUMNS, low_memory=False,
+                        dtype={column: dtype for column, dtype in LATENCY_DTYPES.items() if dtype == "category"})
+    for column in ["startTime", "responseTime", "statusCode"]:
+        frame[column] = pd.to_numeric(frame[column], errors="coerce").astype("float64")
+    return frame
+
+
+def _split_urls(urls: pd.Series):
+    # there are only a handful of distinct urls, so only parse the categories
+    categorical = urls.astype("category").cat
+    instances = []
+    functions = []
+    category_valid = []
+    for url in categorical.categories:
+        url_match = URL_REGEX.fullmatch(str(url))
+        instances.append(url_match[1] if url_match else "")
+        functions.append(url_match[2] if url_match else "")
+        category_valid.append(url_match is not None)
+    codes = categorical.codes.to_numpy()
+    # code -1 marks a missing url, it indexes the appended invalid entry
+    instances = np.array(instances + [""], dtype=object)
+    functions = np.array(functions + [""], dtype=object)
+    category_valid = np.array(category_valid + [False], dtype=bool)
+    return instances[codes], functions[codes], category_valid[codes]
+
+
+def _parse_bools(column: pd.Series):
+    column = column.astype("category")
+    values = (column == "true").to_numpy()
+    valid = column.isin(["true", "false"]).to_numpy()
+    return values, valid
+
+
+def percentiles_or_nan(values: np.ndarray, percentiles: List[float]) -> List[float]:
+    if len(values) == 0:
+        return [float("nan")] * len(percentiles)
+    return list(np.percentile(values, percentiles))
+
+
+def latency_percentiles(latency_ms: np.ndarray, percentiles: List[float]) -> Dict[str, float]:
+    return {
+        f"latency_p{percentile:3.1f}": value
+        for percentile, value in zip(percentiles, percentiles_or_nan(latency_ms, percentiles))
+    }
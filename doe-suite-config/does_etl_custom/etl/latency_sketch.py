@@ -0,0 +1,173 @@
+import math
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class LatencySketch:
+    """
+    Mergeable quantile sketch with logarithmically sized buckets (the DDSketch / HDR histogram idea).
+
+    A value x > min_value is counted in bucket i = ceil(log_gamma(x)) with gamma = (1 + a) / (1 - a),
+    where a is the relative accuracy, and the bucket is reported as 2 * gamma^i / (gamma + 1).
+    Every value in the bucket is within a factor of (1 +- a) of that representative, so a quantile read
+    from the sketch is within a relative error of a of the exact sample at the same rank.
+    For the interpolated quantiles numpy and pandas report, this means the sketch value is within a
+    of one of the two samples the exact quantile is interpolated between.
+    Values at or below min_value are counted separately and reported as 0.
+    The bound does not depend on the number of values, and merging two sketches with the same
+    accuracy adds their bucket counts, so it also holds for sketches merged across files.
+    Minimum and maximum are tracked exactly, so p0 and p100 are exact.
+    The memory use is one counter per occupied bucket range: with a = 1%, latencies from 1us to
+    1000s fit into roughly 1050 buckets.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-3):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"relative accuracy must be in (0, 1), got {relative_accuracy}")
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # counts[k] holds bucket offset + k
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.zero_count = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def __repr__(self):
+        return f"LatencySketch(count={self.count}, relative_accuracy={self.relative_accuracy})"
+
+    def add(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        positive = values[values > self.min_value]
+        self.zero_count += len(values) - len(positive)
+        if len(positive) == 0:
+            return
+        indices = np.ceil(np.log(positive) / self.log_gamma).astype(np.int64)
+        low = int(indices.min())
+        high = int(indices.max())
+        self._grow(low, high)
+        self.counts += np.bincount(indices - self.offset, minlength=len(self.counts))
+
+    def merge(self, other: "LatencySketch"):
+        if other.relative_accuracy != self.relative_accuracy or other.min_value != self.min_value:
+            raise ValueError("can only merge sketches with the same accuracy and minimum value")
+        if other.count == 0:
+            return
+        self.count += other.count
+        self.zero_count += other.zero_count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(other.counts) == 0:
+            return
+        self._grow(other.offset, other.offset + len(other.counts) - 1)
+        start = other.offset - self.offset
+        self.counts[start:start + len(other.counts)] += other.counts
+
+    @classmethod
+    def merged(cls, sketches: Iterable["LatencySketch"]) -> "LatencySketch":
+        sketches = list(sketches)
+        result = cls(sketches[0].relative_accuracy, sketches[0].min_value)
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    def _grow(self, low: int, high: int):
+        if len(self.counts) == 0:
+            self.offset = low
+            self.counts = np.zeros(high - low + 1, dtype=np.int64)
+            return
+        new_offset = min(self.offset, low)
+        new_end = max(self.offset + len(self.counts) - 1, high)
+        if new_offset == self.offset and new_end == self.offset + len(self.counts) - 1:
+            return
+        counts = np.zeros(new_end - new_offset + 1, dtype=np.int64)
+        counts[self.offset - new_offset:self.offset - new_offset + len(self.counts)] = self.counts
+        self.offset = new_offset
+        self.counts = counts
+
+    def quantiles(self, quantiles: List[float]) -> List[float]:
+        if self.count == 0:
+            return [math.nan] * len(quantiles)
+        cumulative = np.cumsum(self.counts)
+        values = []
+        for quantile in quantiles:
+            if quantile <= 0:
+                values.append(self.min)
+                continue
+            if quantile >= 1:
+                values.append(self.max)
+                continue
+            # rank of the lower sample numpy interpolates from
+            rank = math.floor(quantile * (self.count - 1))
+            if rank < self.zero_count:
+                values.append(0.0)
+                continue
+            bucket = int(np.searchsorted(cumulative, rank - self.zero_count, side="right"))
+            value = 2 * self.gamma ** (self.offset + bucket) / (self.gamma + 1)
+            values.append(min(max(value, self.min), self.max))
+        return values
+
+    def percentiles(self, percentiles: List[float]) -> Dict[str, float]:
+        values = self.quantiles([percentile / 100 for percentile in percentiles])
+        return {f"latency_p{percentile:3.1f}": value for percentile, value in zip(percentiles, values)}
+
+
+class BinnedLatencySketch:
+    """
+    Request counts, failures, latency sums and a LatencySketch per time bin of bin_us,
+    relative to origin_us, so percentiles can be read for any range of bins after a single pass.
+    Requests that started before the origin are counted in the first bin.
+    """
+
+    def __init__(self, bin_us: int, origin_us: int, relative_accuracy: float = 0.01):
+        self.bin_us = bin_us
+        self.origin_us = origin_us
+        self.relative_accuracy = relative_accuracy
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.failures = np.zeros(0, dtype=np.int64)
+        self.latency_sums = np.zeros(0, dtype=np.float64)
+        self.sketches: Dict[int, LatencySketch] = {}
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, start_us: np.ndarray, latency_ms: np.ndarray, failed: np.ndarray):
+        if len(start_us) == 0:
+            return
+        bins = np.maximum((np.asarray(start_us) - self.origin_us) // self.bin_us, 0)
+        size = max(len(self.counts), int(bins.max()) + 1)
+        self.counts = _padded(self.counts, size) + np.bincount(bins, minlength=size)
+        self.failures = _padded(self.failures, size) + np.bincount(bins, weights=failed, minlength=size).astype(np.int64)
+        self.latency_sums = _padded(self.latency_sums, size) + np.bincount(bins, weights=latency_ms, minlength=size)
+        order = np.argsort(bins, kind="stable")
+        sorted_bins = bins[order]
+        bin_values, bin_starts = np.unique(sorted_bins, return_index=True)
+        for bin_index, bin_latencies in zip(bin_values, np.split(np.asarray(latency_ms)[order], bin_starts[1:])):
+            sketch = self.sketches.get(int(bin_index))
+            if sketch is None:
+                sketch = LatencySketch(self.relative_accuracy)
+                self.sketches[int(bin_index)] = sketch
+            sketch.add(bin_latencies)
+
+    def sketch(self, first_bin: int = 0, end_bin: Optional[int] = None) -> LatencySketch:
+        end_bin = len(self.counts) if end_bin is None else end_bin
+        result = LatencySketch(self.relative_accuracy)
+        for bin_index in range(first_bin, end_bin):
+            if bin_index in self.sketches:
+                result.merge(self.sketches[bin_index])
+        return result
+
+
+def _padded(values: np.ndarray, size: int) -> np.ndarray:
+    if len(values) == size:
+        return values
+    return np.concatenate([values, np.zeros(size - len(values), dtype=values.dtype)])
@@ -5,7 +5,7 @@ from doespy.etl.steps.loaders import Loader, PlotLoader
 
 import seaborn as sns
 import pandas as pd
-from typing import Dict, List, Tuple, Match
+from typing import Dict, List, Optional, Tuple, Match
 import matplotlib.pyplot as plt
 import matplotlib.ticker
 from matplotlib.lines import Line2D
@@ -15,8 +15,14 @@ from numpy import int64,ndarray
 from pathlib import PurePath 
 import pickle
 from .helpers import *
+from .controller_sim import parse_controller_log
+from .coordinated_omission import load_rate_changes
+from .latency_log import iter_latency_log, read_latency_log, rate_from_path
+from .latency_sketch import LatencySketch
+from .parallel import extract_summary
+from .reaction_time import load_steps, step_reactions
 import math
-from .general import create_fig 
+from .general import create_fig, explode_columns
 import os
 
 # https://stackoverflow.com/questions/31147893/logarithmic-plot-of-a-cumulative-distribution-function-in-matplotlib
@@ -107,8 +113,8 @@ class ControllerLatencyHeatmapLoader(PlotLoader):
         print("creating middleware controller latency plot")
         set_fonts()
 
-        p_latency = df.groupby(['control_low_thre', 'control_high_thre'])['latency'].quantile(self.quantile).reset_index()
-        p_latency = p_latency.pivot('control_low_thre', 'control_high_thre', 'latency')
+        p_latency = merged_latency_quantile(df, ['control_low_thre', 'control_high_thre'], self.quantile)
+        p_latency = p_latency.pivot(index='control_low_thre', columns='control_high_thre', values='latency')
         p_latency = p_latency.sort_index(ascending=False)
         p_latency = p_latency.sort_index(axis=1)
         
@@ -143,7 +149,7 @@ class ControllerLatencyBarLoader(PlotLoader):
         print("creating controller latency plot")
         set_fonts()
 
-        p_latency = df.groupby(['control_delta'])['latency'].quantile(self.quantile).reset_index()
+        p_latency = merged_latency_quantile(df, ['control_delta'], self.quantile)
         p_latency = p_latency.sort_values(by='control_delta')
         delta_positions = range(len(p_latency['control_delta']))
 
@@ -158,7 +164,13 @@ class ControllerLatencyBarLoader(PlotLoader):
         return fig
 
 class ControllerCoresExtractor(Extractor):
-        
+        """
+        The cores and queue length of every engine type at every control tick of a worker stdout.log,
+        as one row of equally long arrays per file: tick, engine_type, cores and queue_length,
+        with the scalars control_delta and the val_key of the run's config.json.
+        explode_columns (or ExplodeColumnsTransformer) turns them into the long table the loaders use.
+        """
+
         val_key: str = "none"
     
         def default_file_regex():
@@ -170,57 +182,52 @@ class ControllerCoresExtractor(Extractor):
             with open(f"{input_file}/config.json", 'r') as file:
                 config = json.load(file)
             return config
-        
-        def parse_log_file(self, input_file: str):
-            with open(input_file, 'r') as file:
-                lines = file.readlines()
-            
-            delta_line = [line for line in lines if line.startswith("delta")][0]
-            control_delta = int(delta_line.split(",")[0].split(" ")[-1])
-            
-            lines = [line for line in lines if line.startswith("Engine type") and not "Buffer" in line]
-            lines = [lines[i:i+2] for i in range(0, len(lines), 2)]
-
-            cpu_core_map = { "control_delta": control_delta }
-            queue_length_map = { "control_delta": control_delta }
-
-            if self.val_key != "none":
-                config = self.parse_config(input_file)
-                cpu_core_map[self.val_key] = config[self.val_key]
-                queue_length_map[self.val_key] = config[self.val_key]
-
-            for line_pair in lines:
-                core_no_lines = line_pair[0].split("; ")
-                queue_length_lines = line_pair[1].split("; ")
-                self.parse_type_number_map(cpu_core_map, core_no_lines)
-                self.parse_type_number_map(queue_length_map, queue_length_lines)
-            
-            return cpu_core_map, queue_length_map
-        
-        def parse_type_number_map(self, engine_type_map: Dict, lines: List[str]):
-            for line in lines:
-                if not line.startswith("Engine type"):
-                    continue
-
-                engine_type, n = self.parse_type_number(line)
-
-                if engine_type not in engine_type_map:
-                    engine_type_map[engine_type] = []
-                engine_type_map[engine_type].append(n)
-            return engine_type_map
-        
-        def parse_type_number(self, line: str):
-            engine_type, n = line.split(", ")
-            n = int(n.split(": ")[1])
-            engine_type = engine_type.split(": ")[1]
-            return engine_type, n
     
         def extract(self, path: str, options: Dict) -> List[Dict]:
             if "loader" in path:
                 return []
             
-            cpu_core_map, queue_length_map = self.parse_log_file(path)
-            return [{ "cpu_cores": json.dumps(cpu_core_map), "queue_length": json.dumps(queue_length_map) }]
+            timeline = parse_controller_log(path)
+            if timeline.control_delta is None:
+                raise ValueError(f"no control delta in {path}")
+            ticks, engine_types = timeline.cores.shape
+            row = {
+                "tick": np.repeat(np.arange(ticks, dtype=np.int64), engine_types),
+                "engine_type": np.tile(np.array(timeline.engine_types), ticks),
+                "cores": timeline.cores.ravel(),
+                "queue_length": timeline.queue_length.ravel(),
+                "control_delta": timeline.control_delta,
+            }
+            if self.val_key != "none":
+                row[self.val_key] = self.parse_config(path)[self.val_key]
+            return [row]
+
+
+CONTROLLER_TIMELINE_COLUMNS = ["tick", "engine_type", "cores", "queue_length"]
+
+
+def controller_run_keys(df: pd.DataFrame, val_key: str) -> List[str]:
+    # columns identifying the run of a timeline row
+    keys = ["control_delta"] + ([val_key] if val_key != "none" else [])
+    return keys + [key for key in ["run", "rep", "host_idx"] if key in df.columns]
+
+
+def controller_timeline(df: pd.DataFrame, val_key: str = "none") -> pd.DataFrame:
+    # the long table of the ControllerCoresExtractor rows of df (other extractors' rows are dropped)
+    if "cores" not in df.columns:
+        return pd.DataFrame(columns=CONTROLLER_TIMELINE_COLUMNS)
+    if not pd.api.types.is_numeric_dtype(df["cores"]):
+        df = df[df["cores"].map(lambda cores: isinstance(cores, ndarray))]
+        df = explode_columns(df.dropna(axis=1, how="all"), CONTROLLER_TIMELINE_COLUMNS)
+    df = df.astype({"tick": np.int64, "cores": np.int64, "queue_length": np.int64})
+    # run keys turned float by the NaN of other extractors' rows, the other columns are left as they are
+    for column in controller_run_keys(df, val_key):
+        values = df[column]
+        if pd.api.types.is_float_dtype(values) and values.notna().all() and np.array_equal(values, np.round(values)):
+            df[column] = values.astype(np.int64)
+    df["engine_type"] = df["engine_type"].astype("category")
+    return df
+
 
 class ControllerCoresPlotLoader(PlotLoader):
         
@@ -232,33 +239,30 @@ class ControllerCoresPlotLoader(PlotLoader):
                 return
             
             output_dir = self.get_output_dir(etl_info)
+            timeline = controller_timeline(df, self.val_key)
+            keys = controller_run_keys(timeline, self.val_key)
 
-            cpu_cores_maps = df['cpu_cores']
-            cpu_cores_maps = [m for m in cpu_cores_maps[~cpu_cores_maps.isnull()]]
-            queue_length_maps = df['queue_length']
-            queue_length_maps = [m for m in queue_length_maps[~queue_length_maps.isnull()]]
-            map_pairs = list(zip(cpu_cores_maps, queue_length_maps))
-
-            for cpu_cores_map, queue_length_map in map_pairs:
-                cpu_cores_map = json.loads(cpu_cores_map)
-                queue_length_map = json.loads(queue_length_map)
-                options['cpu_cores'] = cpu_cores_map
-                options['queue_length'] = queue_length_map
-                fig = self.create_fig(df, options)
-                file_name = self.get_file_name(cpu_cores_map, queue_length_map)
+            for _, run in timeline.groupby(keys, observed=True, sort=False):
+                fig = self.create_fig(run, self.run_rps(df, run, keys), options)
+                file_name = self.get_file_name(run)
                 self.save_plot(fig, filename=file_name, output_dir=output_dir)
         
-        def get_file_name(self, cpu_cores_map: Dict, queue_length_map: Dict) -> str:
-            if cpu_cores_map['control_delta'] != queue_length_map['control_delta']:
-                raise ValueError("control deltas do not match")
-            
-            control_delta = cpu_cores_map['control_delta']
+        def get_file_name(self, run: pd.DataFrame) -> str:
+            control_delta = run['control_delta'].iloc[0]
             if self.val_key != "none":
-                if cpu_cores_map[self.val_key] != queue_length_map[self.val_key]:
-                    raise ValueError("changing values do not match")
-                return f"controller_cores_{self.val_key}={cpu_cores_map[self.val_key]},control_delta={control_delta}"
+                return f"controller_cores_{self.val_key}={run[self.val_key].iloc[0]},control_delta={control_delta}"
             else:
                 return f"controller_cores_control_delta={control_delta}"
+
+        def run_rps(self, df: pd.DataFrame, run: pd.DataFrame, keys: List[str]) -> ndarray:
+            # the rps of the rows of the same run, the host is left out as the rates come from the load generator
+            if 'rps' not in df.columns:
+                return np.array([])
+            rows = df['rps'].notna()
+            for key in keys:
+                if key != 'host_idx' and key in df.columns:
+                    rows &= df[key] == run[key].iloc[0]
+            return np.sort(df.loc[rows, 'rps'].unique())
         
         def distribute_points_equally(self, cores, time_ticks):
             num_intervals = len(time_ticks) - 1
@@ -276,47 +280,33 @@ class ControllerCoresPlotLoader(PlotLoader):
 
             return new_timestamps.tolist()
         
-        def create_fig(self, df: pd.DataFrame, options: Dict):
+        def create_fig(self, run: pd.DataFrame, rps_vals: ndarray, options: Dict):
             set_fonts()
             
             fig, axs = plt.subplots(2, figsize=(12, 10))
             cores_yticks = list(range(0, 14, 2))
 
-            cpu_core_map = options['cpu_cores']
-            queue_length_map = options['queue_length']
-            control_delta = cpu_core_map['control_delta']
-            if self.val_key != "none":
-                changing_value = cpu_core_map[self.val_key]
-
-            cpu_core_map = { k: v for k, v in cpu_core_map.items() if k != 'control_delta' and k != self.val_key }
-            queue_length_map = { k: v for k, v in queue_length_map.items() if k != 'control_delta' and k != self.val_key }
-
-            df = df[df['control_delta'] == control_delta]
-            if self.val_key != "none":
-                df = df[df[self.val_key] == changing_value]
-
-            # plot cores over time
-            for engine_type, cores in cpu_core_map.items():
-                timestamps = self.distribute_points_equally(cores, self.time_ticks)
-                axs[0].plot(timestamps, cores, label=engine_type)
-
-            # plot queue lengths over time
-            for engine_type, queue_length in queue_length_map.items():
-                timestamps = self.distribute_points_equally(queue_length, self.time_ticks)
-                axs[1].plot(timestamps, queue_length, label=engine_type)
-
-            rps_vals = df['rps'].unique()
-            rps_vals = rps_vals[~np.isnan(rps_vals)]
-            rps_vals = np.sort(rps_vals)
-            line_spacing = len(queue_length) / 5 / len(rps_vals)
-            for i in range(len(rps_vals)):
-                axs[0].axvline(x=i * line_spacing, color='red', linestyle='--')
-                axs[1].axvline(x=i * line_spacing, color='red', linestyle='--')
+            # plot cores and queue lengths over time
+            for engine_type, engine in run.groupby('engine_type', observed=True, sort=False):
+                engine = engine.sort_values('tick')
+                timestamps = self.distribute_points_equally(engine['cores'], self.time_ticks)
+                axs[0].plot(timestamps, engine['cores'], label=engine_type)
+                axs[1].plot(timestamps, engine['queue_length'], label=engine_type)
+
+            ticks = run['tick'].nunique()
+            if len(rps_vals) > 0:
+                line_spacing = ticks / 5 / len(rps_vals)
+                for i in range(len(rps_vals)):
+                    axs[0].axvline(x=i * line_spacing, color='red', linestyle='--')
+                    axs[1].axvline(x=i * line_spacing, color='red', linestyle='--')
+                rps_title = f"rps=[{rps_vals[0]}, {rps_vals[-1]}]"
+            else:
+                rps_title = ""
             
             if self.val_key != "none":
-                axs[0].set_title(f"{self.val_key}={changing_value}; rps=[{rps_vals[0]}, {rps_vals[-1]}]")
+                axs[0].set_title(f"{self.val_key}={run[self.val_key].iloc[0]}; {rps_title}")
             else:
-                axs[0].set_title(f"rps=[{rps_vals[0]}, {rps_vals[-1]}]")
+                axs[0].set_title(rps_title)
             
             axs[0].set_yticks(cores_yticks)
             axs[0].set_ylabel("Cores")
@@ -328,6 +318,42 @@ class ControllerCoresPlotLoader(PlotLoader):
 
             return fig
 
+
+class ControllerCoreUsageLoader(Loader):
+        """
+        Writes controller_core_usage.csv with, per run and engine type, the core seconds used, the mean cores and queue length
+        and the allocation churn (cores moved per second), from the timeline of ControllerCoresExtractor.
+        A tick lasts tick_ms, by default the span of time_ticks (as in ControllerCoresPlotLoader) divided by the ticks of the run.
+        """
+
+        val_key: str = "none"
+        time_ticks: List[int] = [0, 10]
+        tick_ms: Optional[float] = None
+
+        def load(self, df: pd.DataFrame, options: Dict, etl_info: Dict) -> None:
+            if df.empty:
+                return
+            timeline = controller_timeline(df, self.val_key)
+            keys = controller_run_keys(timeline, self.val_key)
+            timeline = timeline.sort_values(keys + ["engine_type", "tick"])
+            grouped = timeline.groupby(keys + ["engine_type"], observed=True, sort=False)
+            usage = grouped.agg(ticks=("tick", "nunique"), total_cores=("cores", "sum"),
+                                cores_mean=("cores", "mean"), queue_length_mean=("queue_length", "mean"))
+            # cores moved between consecutive ticks of the same run and engine type
+            timeline["core_moves"] = grouped["cores"].diff().abs().fillna(0)
+            usage["core_moves"] = timeline.groupby(keys + ["engine_type"], observed=True, sort=False)["core_moves"].sum()
+            if self.tick_ms is not None:
+                tick_s = pd.Series(self.tick_ms / 1000, index=usage.index)
+            else:
+                tick_s = (self.time_ticks[-1] - self.time_ticks[0]) / usage["ticks"]
+            usage["core_seconds"] = usage["total_cores"] * tick_s
+            usage["core_moves_per_s"] = usage["core_moves"] / (usage["ticks"] * tick_s)
+            usage = usage.drop(columns=["total_cores"]).reset_index()
+
+            output_dir = self.get_output_dir(etl_info)
+            usage.to_csv(os.path.join(output_dir, "controller_core_usage.csv"), index=False)
+
+
 class ControllerLatencyBoxLoader(PlotLoader):
 
     def load(self, df: pd.DataFrame, options: Dict, etl_info: Dict) -> None:
@@ -396,20 +422,9 @@ class ControllerRpsExtractor(Extractor):
 
 class ControllerLatencyCoreSweepExtractor(Extractor):
 
-    latency_line_regex = re.compile("http://[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}:8080/(\w+)/(\w+),([0-9]+),([0-9]+),(\w+),(\w+),([0-9]{1,3})\n")
-
     def default_file_regex():
         return [r"latencies.*\.csv$"]
     
-    def extract_latency(self, latency_line: str) -> int | None:
-        current_latency = re.fullmatch(self.latency_line_regex, latency_line)
-        if current_latency is not None:
-            response_time = int(current_latency[4]) / 1000
-            response_code = int(current_latency[7])
-            return response_time if response_code == 200 else None
-        else:
-            return None
-        
     def parse_config(self, input_file: str):
         while not os.path.exists(f"{input_file}/config.json"):
             input_file = os.path.dirname(input_file)
@@ -422,47 +437,125 @@ class ControllerLatencyCoreSweepExtractor(Extractor):
         io_cores = config['io_cores'] if not 'control_delta' in config else 0
 
         print(f"extracting {path}...")
-        result = []
-        with open(path) as latency_log:
-            latencies = [self.extract_latency(latency_line) for latency_line in latency_log.readlines()[1:]]
-            latencies = [lat for lat in latencies if lat is not None]
-            lat_p50 = np.percentile(latencies, 50)
-            lat_p90 = np.percentile(latencies, 90)
-            lat_p95 = np.percentile(latencies, 95)
-            lat_p99 = np.percentile(latencies, 99)
-            lat_p100 = np.percentile(latencies, 100)
-            latency_dict = {
-                'latency_p50': lat_p50,
-                'latency_p90': lat_p90,
-                'latency_p95': lat_p95,
-                'latency_p99': lat_p99,
-                'latency_p100': lat_p100,
-                'io_cores': io_cores,
-            }
-            result = [latency_dict]
-        return result
+        latency_log = read_latency_log(path)
+        latency_log.report_malformed()
+        latencies = latency_log.latency_ms[latency_log.status == 200]
+        lat_p50, lat_p90, lat_p95, lat_p99, lat_p100 = np.percentile(latencies, [50, 90, 95, 99, 100])
+        latency_dict = {
+            'latency_p50': lat_p50,
+            'latency_p90': lat_p90,
+            'latency_p95': lat_p95,
+            'latency_p99': lat_p99,
+            'latency_p100': lat_p100,
+            'io_cores': io_cores,
+        }
+        return [latency_dict]
 
         
 class ControllerLatencyExtractor(Extractor):
+    """
+    One row per file with a LatencySketch of all its latencies in latency_sketch,
+    the loaders merge the sketches of a group to read its quantiles (see merged_latency_quantile).
+    """
 
-    latency_line_regex = re.compile("http://[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}:8080/(\w+)/(\w+),([0-9]+),([0-9]+),(\w+),(\w+),([0-9]{1,3})\n")
+    summary_version: int = 1
+    workers: int = 0
+    # relative error bound of the quantiles, see LatencySketch
+    sketch_accuracy: float = 0.01
 
     def default_file_regex():
         return [r"latencies.*\.csv$"]
 
-    def extract_latency(self, latency_line: str) -> int | None:
-        current_latency = re.fullmatch(self.latency_line_regex, latency_line)
-        if current_latency is not None:
-            return int(current_latency[4]) / 1000
-        else:
-            return None
-
     def extract(self, path: str, options: Dict) -> List[Dict]:
+        return extract_summary(self, path, options)
+
+    def summarize(self, path: str, options: Dict) -> List[Dict]:
         print(f"extracting {path}...")
-        result = []
-        with open(path) as latency_log:
-            result = [{ 'latency': self.extract_latency(latency_line) } for latency_line in latency_log.readlines()[1:]]
-        return result
+        latency_sketch = LatencySketch(self.sketch_accuracy)
+        malformed = 0
+        for latency_chunk in iter_latency_log(path):
+            malformed += latency_chunk.malformed
+            latency_sketch.add(latency_chunk.latency_ms)
+        if malformed > 0:
+            print(f"could not parse {malformed} latency lines for {path}")
+        return [{ 'latency_sketch': latency_sketch, 'requests': latency_sketch.count }]
+
+
+def merged_latency_quantile(df: pd.DataFrame, group_by: List[str], quantile: float) -> pd.DataFrame:
+    # the quantile of the merged latency sketches of every group, in the column latency
+    df = df[df['latency_sketch'].notna()]
+    rows = []
+    for group_values, group in df.groupby(group_by, sort=True):
+        group_values = group_values if isinstance(group_values, tuple) else (group_values,)
+        row = dict(zip(group_by, group_values))
+        row['latency'] = LatencySketch.merged(group['latency_sketch']).quantiles([quantile])[0]
+        rows.append(row)
+    return pd.DataFrame(rows, columns=group_by + ['latency'])
+
+class ControllerReactionExtractor(Extractor):
+    """
+    For open loop runs replaying a rate change trace, how quickly the latency recovers after every load step
+    (see reaction_time.py), with the controller setting of the run.
+    """
+
+    # trace csv per request format of the file name, relative paths are relative to the repository root
+    trace_paths: Dict[str, str] = {
+        "middleware-app": "client/traces/example1.csv",
+        "compression-app": "client/traces/example2.csv",
+    }
+    slo_ms: float = 100
+    percentile: float = 99
+    window_ms: int = 1000
+    slide_ms: int = 100
+    config_keys: List[str] = ["control_kp", "control_ki", "control_interval", "io_cores"]
+
+    def default_file_regex():
+        return [r"latencies.*_open-loop_.*\.csv$"]
+
+    def parse_config(self, input_file: str):
+        while not os.path.exists(f"{input_file}/config.json"):
+            input_file = os.path.dirname(input_file)
+        with open(f"{input_file}/config.json", 'r') as file:
+            config = json.load(file)
+        return config
+
+    def extract(self, path: str, options: Dict) -> List[Dict]:
+        path_parser = re.fullmatch(r".*latencies_.*_open-loop_(.*)_.*_.*hot_[0-9]+_rate\.csv", path)
+        if not path_parser or path_parser[1] not in self.trace_paths:
+            print(f"no trace for {path}")
+            return []
+        function_name = path_parser[1]
+        trace_path = self.trace_paths[function_name]
+        if not os.path.isabs(trace_path):
+            trace_path = os.path.join(os.path.dirname(__file__), "..", "..", "..", trace_path)
+        steps = load_steps(load_rate_changes(trace_path))
+        latency_log = read_latency_log(path)
+        latency_log.report_malformed()
+        if len(latency_log) == 0:
+            return []
+        # the trace starts with the first request, the loader does not log its warm-up
+        start_s = (latency_log.start_us - latency_log.start_us.min()) / 1e6
+        config = self.parse_config(path)
+        setting = {key: config.get(key) for key in self.config_keys}
+        reactions = step_reactions(start_s, latency_log.latency_ms, latency_log.failed, steps, self.slo_ms,
+                                   self.window_ms, self.slide_ms, self.percentile)
+        return [{"function": function_name, **setting, **reaction} for reaction in reactions]
+
+class ControllerReactionLoader(Loader):
+
+    group_by: List[str] = ['server', 'function', 'control_kp', 'control_ki', 'control_interval', 'io_cores']
+
+    def load(self, df: pd.DataFrame, options: Dict, etl_info: Dict) -> None:
+        if df.empty:
+            return
+        group_by = [column for column in options.get('group_by', self.group_by) if column in df.columns]
+        columns = ['step_s', 'rate_before', 'rate_after', 'recovered', 'recover_s', 'peak_ms', 'settled_ms', 'overshoot_ms',
+                   'transition_failures', 'segment_requests']
+        # repetitions of a setting are averaged per step, recovered becomes the fraction of repetitions that recovered
+        table = df.groupby(group_by + ['step_s', 'rate_before', 'rate_after'], dropna=False)[columns[3:]].mean().reset_index()
+        print(table.to_string(index=False))
+        output_dir = self.get_output_dir(etl_info)
+        table.to_csv(os.path.join(output_dir, "reaction_times.csv"), index=False)
 
 class MiddlewareLatencyExtractor(Extractor):
 
@@ -472,21 +565,12 @@ class MiddlewareLatencyExtractor(Extractor):
         return [r"latencies.*\.csv$"]
 
     def extract(self, path: str, options: Dict) -> List[Dict]:
-        latency_log = open(path)
-        path_parser = re.fullmatch("(.*)hot_([0-9]+)_rate\.csv", path)
-        rps = int(path_parser[2])
+        rps = rate_from_path(path)
         if rps != self.rps:
             return []
-        end2end_list = []
-        for index, latency_line in enumerate(latency_log.readlines()[1:]):
-            current_latency = re.fullmatch("http://[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}:8080/(\w+)/(\w+),([0-9]+),([0-9]+),(\w+),(\w+),([0-9]{1,3})\n", latency_line)
-            if current_latency is not None:
-                # # check if timeout or other failure
-                # if current_latency[5] == "true" or current_latency[6] == "true":
-                end2end_list.append({'latency': int(current_latency[4]) / 1000})
-            else:
-                print(f"could not parse latency line for {path} at line {index + 1}")
-        return end2end_list 
+        latency_log = read_latency_log(path)
+        latency_log.report_malformed()
+        return [{'latency': latency} for latency in latency_log.latency_ms.tolist()]
 
 class MiddlewareLatencyPlotLoader(PlotLoader):
 
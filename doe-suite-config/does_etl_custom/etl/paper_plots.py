@@ -5,16 +5,24 @@ from doespy.etl.steps.loaders import Loader, PlotLoader
 
 import seaborn as sns
 import pandas as pd
-from typing import Dict, List, Tuple, Match
+from typing import Dict, List, Optional, Tuple, Match
 import matplotlib.pyplot as plt
 import matplotlib.ticker
 from matplotlib.lines import Line2D
 import itertools 
 import re 
+import numpy as np
 from numpy import int64,ndarray
 from pathlib import PurePath 
 import pickle
 from .helpers import *
+from .capacity import annotate_capacity
+from .latency_log import class_column, read_latency_log, rate_from_path, latency_percentiles
+from .parallel import extract_summary
+from .phases import DISPATCHER_PHASES, phase_durations
+from .span_events import grouped_summary, parse_span_events
+from .steady_state import steady_state_start
+from .windows import WindowAggregator
 import math
 from .general import create_fig 
 import os
@@ -68,46 +76,27 @@ def set_fonts():
     plt.rc('figure', titlesize=BIGGER_SIZE)  # fontsize of the figure title
 
 class MotivationLatencyExtractor(Extractor):
+
+    summary_version: int = 1
+    workers: int = 0
     
     def default_file_regex():
         return [r"latencies.*\.csv$"]
 
     def extract(self, path: str, options: Dict) -> List[Dict]:
         set_fonts()
-        log_summary_path = PurePath(path).with_suffix('.pkl')
-        try:
-            log_summary_file = open(log_summary_path, 'rb')
-            return pickle.load(log_summary_file)
-        except: 
-            pass
-        latency_log = open(path)
-        end2end_list = []
-        total_requests = 0
-        total_failures = 0
-        path_parser = re.fullmatch("(.*)hot_([0-9]+)_rate\.csv",path)
-        # path_parser = re.fullmatch("(.*)hot_([0-9]+)_rps\.csv",path)
-        for index, latency_line in enumerate(latency_log.readlines()[1:]):
-            current_latency = re.fullmatch("http://[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}:8080/(\w+)/(\w+),([0-9]+),([0-9]+),(\w+),(\w+),([0-9]{1,3})\n", latency_line)
-            if current_latency is not None:
-                total_requests = total_requests + 1
-                # check if timeout or other failure
-                if current_latency[5] == "true" or current_latency[6] == "true":
-                    total_failures = total_failures + 1
-                end2end_list.append(int(current_latency[4])/1000)
-            else:
-                print(f"could not parse latency line for {path} at line {index + 1}")
-
-        end2end_series = pd.Series(end2end_list)
-        span_dict = { "rps" : int(path_parser[2]),
-                     "total_requests": total_requests,
-                     "total_failures": total_failures} 
+        return extract_summary(self, path, options)
+
+    def summarize(self, path: str, options: Dict) -> List[Dict]:
+        latency_log = read_latency_log(path)
+        latency_log.report_malformed()
+        span_dict = { "rps" : rate_from_path(path),
+                     "total_requests": len(latency_log),
+                     "total_failures": int(latency_log.failed.sum())} 
         percentiles = [5, 50, 90, 95, 99, 99.5, 99.9]
         if 'percentiles' in options.keys():
             percentiles = options['percentiles'] 
-        for percentile in percentiles:
-            span_dict[f"latency_p{percentile:3.1f}"] = end2end_series.quantile(percentile/100)
-        log_summary_file = open(log_summary_path, 'wb')
-        pickle.dump([span_dict],log_summary_file) 
+        span_dict.update(latency_percentiles(latency_log.latency_ms, percentiles))
         return [span_dict] 
 
 class MotivationLoadLatencyPlotLoader(PlotLoader):
@@ -183,55 +172,25 @@ class UtilExtractor(Extractor):
 
 good_thresholds = [4, 35]
 class HotVMsExtractor(Extractor):
+
+    summary_version: int = 1
+    workers: int = 0
     
     def default_file_regex():
         return [r"latencies.*\.csv$"]
 
     def extract(self, path: str, options: Dict) -> List[Dict]: 
-        from collections import defaultdict
-        summary_path = PurePath(path).with_suffix('.pkl')
-        try:
-            summary_file = open(summary_path, 'rb')
-            return pickle.load(summary_file)
-        except: 
-            pass
-
-        latency_log = open(path)
-        total_requests = 0
-        succussul_requests = 0
-        good_requests = defaultdict(int)
-        min_timestamp = None
-        max_timestamp = None
-        path_parser = re.fullmatch("(.*)hot_([0-9]+)_rate\.csv", path)
-        rps = int(path_parser[2])
-        for index, latency_line in enumerate(latency_log.readlines()[1:]):
-            current_entry = re.fullmatch("http://[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}:8080/(\w+)/(\w+),([0-9]+),([0-9]+),(\w+),(\w+),([0-9]{1,3})\n", latency_line)
-            current_timestamp = int(current_entry[3])
-            if min_timestamp == None:
-                min_timestamp = current_timestamp
-                max_timestamp = current_timestamp
-            else:
-                min_timestamp = min(min_timestamp, current_timestamp)
-                max_timestamp = max(max_timestamp, current_timestamp)
-            if current_entry is not None:
-                total_requests += 1
-                if current_entry[5] == "false" and current_entry[6] == "false":
-                    succussul_requests += 1
-                    current_latency_ms = int(current_entry[4]) / 1000
-                    for threshold in good_thresholds:
-                        if current_latency_ms < threshold:
-                            good_requests[threshold] += 1
-            else:
-                print(f"could not parse latency line for {path} at line {index + 1}")
-
-        duration_sec = (max_timestamp - min_timestamp) / 1000000
-        span_dict = {'throughput' : succussul_requests / duration_sec,
+        return extract_summary(self, path, options)
+
+    def summarize(self, path: str, options: Dict) -> List[Dict]:
+        latency_log = read_latency_log(path)
+        latency_log.report_malformed()
+        duration_sec = (latency_log.start_us.max() - latency_log.start_us.min()) / 1000000
+        successful_ms = latency_log.latency_ms[~latency_log.failed]
+        span_dict = {'throughput' : len(successful_ms) / duration_sec,
                      'model': 'open' if 'open' in path else 'close'}
         for threshold in good_thresholds:
-            span_dict[f'goodput(SLO<{threshold}ms)'] = good_requests[threshold] / duration_sec
-
-        summary_file = open(summary_path, 'wb')
-        pickle.dump([span_dict],summary_file) 
+            span_dict[f'goodput(SLO<{threshold}ms)'] = np.count_nonzero(successful_ms < threshold) / duration_sec
 
         return [span_dict] 
 
@@ -312,89 +271,29 @@ class MorelloTimestampExtractor(Extractor):
 
     quartiles: Tuple[float,float] = (0.25,0.75)
     whiskers: Tuple[int,int] = (0.05,0.95)
+    # phase name -> (start point, end point) pairs whose durations add up to the phase, see phases.py
+    phases: Dict[str, List[Tuple[str,str]]] = DISPATCHER_PHASES
+    # the part of total_phase not covered by the other phases is reported as remainder_phase
+    total_phase: str = "Total"
+    remainder_phase: Optional[str] = "Others"
+
+    summary_version: int = 3
+    workers: int = 0
 
     def default_file_regex():
         return [r"timestamps.*\.csv$"]
 
     def extract(self, path: str, options: Dict) -> List[Dict]:
-        summary_path = PurePath(path).with_suffix('.pkl')
-        try:
-            summary_file = open(summary_path, 'rb')
-            return [pickle.load(summary_file)]
-        except: 
-            pass
-        timestamp_file = open(path)
-        path_parser = re.fullmatch("(.*)hot_([0-9]+)_rate\.csv",path)
-        series_list = []
-        next(timestamp_file)
-        for timestamp_line in timestamp_file:
- 
-            event_list = re.findall("parent:([0-9]+), span:([0-9]+), time:([0-9]+), point:(\w+)", timestamp_line)
-            # pairs that we are looking for
-            # Load start / end
-            def findEvent(evt_list, name):
-                evt_candidate = [event for event in evt_list if event[3] == name]
-                if len(evt_candidate) < 1:
-                    raise ValueError("did not find event candidate for f{name} in f{evt_list}") 
-                elif len(evt_candidate) > 1: 
-                    raise ValueError("did find more than one event candidate for f{name} in f{evt_list}") 
-                return evt_candidate[0]
-            arrival_start = findEvent(event_list, "Arrival")
-            arrival_end = findEvent(event_list, "PrepareEnvQueue")
-            arrival_time = int(arrival_end[2]) - int(arrival_start[2])
-
-            parse_start = findEvent(event_list, "ParsingStart")
-            parse_end = findEvent(event_list, "ParsingEnd")
-            parse_time = int(parse_end[2]) - int(parse_start[2])
-
-            load_start = findEvent(event_list, "LoadStart")
-            load_end = findEvent(event_list, "LoadEnd")
-            load_time = int(load_end[2]) - int(load_start[2])
-            load_time = parse_time + load_time
-
-            transfer_start = findEvent(event_list, "TransferStart")
-            transfer_end = findEvent(event_list, "TransferEnd")
-            transfer_time = int(transfer_end[2]) - int(transfer_start[2])
-
-            engine_start = findEvent(event_list, "EngineStart")
-            engine_end = findEvent(event_list, "EngineEnd")
-            engine_time = int(engine_end[2]) - int(engine_start[2])
-
-            departure_start = findEvent(event_list, "FutureReturn")
-            departure_end = findEvent(event_list, "EndService")
-            departure_time = int(departure_end[2]) - int(departure_start[2])
-
-            total_time = int(departure_end[2]) - int(arrival_start[2])
-
-            span_dict = {
-                "Arrival": arrival_time,
-                "Loading": load_time,
-                "Transfer": transfer_time,
-                "Engine": engine_time,
-                "Departure": departure_time,
-                "Others": total_time - arrival_time - load_time - transfer_time - engine_time - departure_time,
-                "Total": total_time,
-                }
-            # span_list = [(p_event, n_event) for (p_event,n_event) in zip(event_list, event_list[1:])]
-            # span_dict = {p_event[1]: int64(n_event[0])-int64(p_event[0]) for (p_event,n_event) in span_list}
-            span_series = pd.Series(span_dict)
-            series_list.append(span_series) 
-        timestamp_frame = pd.DataFrame(series_list)
-        # span_dict = {'clients': path_parser[2]}
-        span_dict = {}
-        for column in timestamp_frame.columns:
-            column_frame = timestamp_frame[column]
-            span_dict[f'{column}_mean'] = column_frame.mean()
-            span_dict[f'{column}_med'] = column_frame.median()
-            span_dict[f'{column}_q1'] = column_frame.quantile(options['quartiles'][0])
-            span_dict[f'{column}_q3'] = column_frame.quantile(options['quartiles'][1])
-            span_dict[f'{column}_whislo'] = column_frame.quantile(options['whiskers'][0])
-            span_dict[f'{column}_whishi'] = column_frame.quantile(options['whiskers'][1])
-            # print(column_frame[column_frame > column_frame.quantile(options['whiskers'][1])])
+        return extract_summary(self, path, options)
+
+    def summarize(self, path: str, options: Dict) -> List[Dict]:
+        # the first line of the dump is skipped
+        span_events = parse_span_events(path, skip_lines=1)
+        phase_times = phase_durations(span_events, self.phases, self.total_phase, self.remainder_phase)
+        phases = np.repeat(np.arange(len(phase_times)), span_events.request_count)
+        durations = np.concatenate(list(phase_times.values()))
+        span_dict = grouped_summary(phases, durations, list(phase_times.keys()), options['quartiles'], options['whiskers'])
         print(span_dict)
-        # create a summary to load instead of repeating preprocessing
-        summary_file = open(summary_path, 'wb')
-        pickle.dump(span_dict,summary_file) 
         return [span_dict]
 
 class MorelloLatencyBreakdownLoader(PlotLoader):
@@ -545,6 +444,11 @@ class MatmulMixedLoadLatencyPlotLoader(PlotLoader):
 
     percentiles: List[int]
 
+    annotate_capacity: bool = True
+
+    # "all" plots the blended latencies, "hot" or "cold" only the requests of that class
+    instance_class: str = "all"
+
     def load(self, df: pd.DataFrame, options: Dict, etl_info: Dict) -> None:
         if not df.empty:
             cold_rate = '0.97' 
@@ -555,6 +459,8 @@ class MatmulMixedLoadLatencyPlotLoader(PlotLoader):
             df=df[(df['size'] == size)]
             df=df[ df['total_failures'] / df['total_requests'] < 0.005]
             figurename = f"matmul {size}x{size} with {int(float(cold_rate)*100)} hot requests load latency"
+            if options.get('instance_class', self.instance_class) != "all":
+                figurename += f" {options.get('instance_class', self.instance_class)} only"
             # figurename = f"middleware with {int(float(cold_rate)*100)} hot requests load latency"
             # figurename = f"compression with {int(float(cold_rate)*100)} hot requests load latency"
             plt.rcParams.update({'font.size': 22})
@@ -585,9 +491,10 @@ class MatmulMixedLoadLatencyPlotLoader(PlotLoader):
             new_x_series = pd.Series(data={x_data.size: x_data.iat[x_data.size-1]+1})
             x_data = pd.concat([x_data, new_x_series])
             # append datapoint past the last one to give the ultimate knee
-            p50_col_name = f"latency_p{50:3.1f}"
-            p5_col_name = f"latency_p{5:3.1f}"
-            p95_col_name = f"latency_p{95:3.1f}"
+            instance_class = options.get('instance_class', self.instance_class)
+            p50_col_name = class_column(instance_class, f"latency_p{50:3.1f}")
+            p5_col_name = class_column(instance_class, f"latency_p{5:3.1f}")
+            p95_col_name = class_column(instance_class, f"latency_p{95:3.1f}")
             y_data= pd.concat([group[p50_col_name], pd.Series(data={group[p50_col_name].size: 2*max_y})])
             y_err_low= pd.concat([group[p50_col_name] - group[p5_col_name], pd.Series(data={group[p5_col_name].size: 0})])
             y_err_high= pd.concat([group[p95_col_name] - group[p50_col_name], pd.Series(data={group[p95_col_name].size: 0})])
@@ -608,6 +515,9 @@ class MatmulMixedLoadLatencyPlotLoader(PlotLoader):
                         markersize=15,
                         markevery=3 ,
                     )
+            # knee and SLO capacity, if the CapacityTransformer ran
+            if options.get('annotate_capacity', True):
+                annotate_capacity(axis, group, LINE_DICT[group_name].color)
         axis.grid(True)
 
         handles,labels = axis.get_legend_handles_labels()
@@ -783,45 +693,44 @@ class ChainScaleLatencyPlotLoader(PlotLoader):
         return fig
 
 class MixedWorkloadExtractor(Extractor):
+    """
+    One row per file whose request columns (startTime, responseTime, failure, statusCode) hold arrays,
+    use ExplodeColumnsTransformer to get one row per request.
+    """
+
+    summary_version: int = 3
+    workers: int = 0
+    # the load follows a trace, so only the start of the run is searched for a warm-up
+    warmup_max_fraction: float = 0.1
 
     def default_file_regex():
         return [r"latencies.*\.csv$"]
 
     def extract(self, path: str, options: Dict) -> List[Dict]:
-        summary_path = PurePath(path).with_suffix('.pkl')
-        try:
-            log_summary_file = open(summary_path, 'rb')
-            return pickle.load(summary_file)
-        except: 
-            pass 
-        latency_log = open(path)
+        return extract_summary(self, path, options)
+
+    def summarize(self, path: str, options: Dict) -> List[Dict]:
         path_parser = re.fullmatch(r".*latencies_.(.*)_open-loop_(.*)_.*_.*hot_1_rate\.csv", path)
         if not path_parser:
             print(f"Skipping invalid file name: {path}")
             return []
         process_type = path_parser[1]
         function_name = path_parser[2]
-        df = pd.read_csv(path)
+        df = pd.read_csv(path, usecols=["startTime", "responseTime", "connectionTimeout", "functionTimeout", "statusCode"],
+                         dtype={"startTime": "int64", "responseTime": "int64", "statusCode": "int16"})
         df = df.sort_values(by="startTime")
         # normalize start time
         min_start_time = df["startTime"][0]
-        df["startTime"] = df["startTime"] - min_start_time
         df = df[1:-1]
-        
-        start_second = (df["startTime"] / 1e6).astype("int")
-        # for every entry create a dics with start time, response time, status and failure 
-        dict_list = []
-        for index, row in df.iterrows():
-            row_dict = {"function": function_name,  
-                        "startTime": row[1],
-                        "responseTime": row[2],
-                        "failure": row[3] or row[4],
-                        "statusCode": row[5]}
-            dict_list.append(row_dict)
-        # memoize to avoid recompuatation
-        summary_file = open(summary_path, 'wb')
-        pickle.dump(dict_list,summary_file)
-        return dict_list
+        start_time = df["startTime"].to_numpy() - min_start_time
+        response_time = df["responseTime"].to_numpy()
+        warmup_cutoff = steady_state_start(start_time, response_time, max_fraction=self.warmup_max_fraction)
+        return [{"function": function_name,
+                 "startTime": start_time,
+                 "responseTime": response_time,
+                 "failure": (df["connectionTimeout"] | df["functionTimeout"]).to_numpy(dtype=bool),
+                 "statusCode": df["statusCode"].to_numpy(),
+                 "warmupCutoff": warmup_cutoff}]
 
 APP_DICT = {
     "compression-app": ("blue", "img compression"),
@@ -848,15 +757,21 @@ class MixedWorkloadLoader(PlotLoader):
 
         # loader rps
         load_df = df[df['server'] == 'wasmtime']
-        load_group = load_df.groupby('function')
+        load_group = load_df.groupby('function', observed=True)
         for load_name, load in load_group:
-            # Filter out first second of data
-            load = load[load['startTime'] >= 1_000_000]
-            start_second = (load["startTime"] / 1e6).astype("int") 
-            requests_per_second = start_second.groupby(start_second).size() 
+            # Filter out the warm-up detected by the extractor
+            load = load[load['startTime'] >= load['warmupCutoff']]
+            if load.empty:
+                continue
+            # requests per second, from the second the first request after the warm-up started in
+            start_time = load["startTime"].to_numpy()
+            rps_windows = WindowAggregator(1_000_000, origin=int(start_time.min()) // 1_000_000 * 1_000_000)
+            rps_windows.add(start_time)
+            requests_per_second = rps_windows.windows()
             
             axes[0].plot(
-                requests_per_second,
+                requests_per_second["window_start"] // 1_000_000,
+                requests_per_second["count"],
                 color=APP_DICT[load_name][0],
                 linewidth=4,
                 label=APP_DICT[load_name][1]
@@ -867,14 +782,14 @@ class MixedWorkloadLoader(PlotLoader):
         axes[0].set_ylabel("RPS")
         axes[0].legend(loc="upper right", bbox_to_anchor=(1, 0.95), framealpha=0)
 
-        server_function_grouped = df.groupby(['server', 'function'])
+        server_function_grouped = df.groupby(['server', 'function'], observed=True)
         for index,(server_function_name, server_function_group) in enumerate(server_function_grouped):
             axis_index = int(index / 2 + 1)
             axis = axes[axis_index]
             server = server_function_name[0]
             function = server_function_name[1]
-            # Filter out first second of data
-            server_function_group = server_function_group[server_function_group['startTime'] >= 1_000_000]
+            # Filter out the warm-up detected by the extractor
+            server_function_group = server_function_group[server_function_group['startTime'] >= server_function_group['warmupCutoff']]
             # usec until we classify a request as failure
             server_function_group = server_function_group[server_function_group["failure"] == False]
             print(server_function_name) 
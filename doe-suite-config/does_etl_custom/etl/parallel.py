@@ -0,0 +1,112 @@
+import atexit
+import json
+import os
+import re
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional
+
+from .summary_cache import cached_summary
+
+# default number of worker processes for extractors that do not set `workers`
+WORKERS_ENV = "DOES_ETL_WORKERS"
+
+RUN_DIR_REGEX = re.compile(r"run_[0-9]+")
+
+_executors: Dict[int, ProcessPoolExecutor] = {}
+# futures of the files of the experiment being extracted, by extractor and experiment directory
+_batches: Dict[tuple, Dict[str, Future]] = {}
+
+
+def worker_count(extractor) -> int:
+    workers = getattr(extractor, "workers", 0)
+    if not workers:
+        workers = int(os.environ.get(WORKERS_ENV, "1"))
+    return max(workers, 1)
+
+
+def extract_summary(extractor, path: str, options: Dict) -> List[Dict]:
+    """
+    Run extractor.summarize(path, options) through the summary cache.
+    With more than one worker, the first call for an experiment submits all files of that
+    experiment matching the extractor's file regex to a process pool, and later calls
+    pick up the finished results, so results still come back in the order doe-suite asks for them.
+    doe-suite extracts one experiment after the other, so files of an earlier experiment that
+    were never asked for are cancelled (or their results dropped) once the next experiment starts.
+    A failing file is reported with its path and contributes no rows.
+    """
+    summarize = partial(cached_summary, extractor, summarize=extractor.summarize)
+    workers = worker_count(extractor)
+    try:
+        if workers == 1:
+            return summarize(path, options)
+        return _pool_result(extractor, path, options, summarize, workers)
+    except Exception:
+        print(f"{type(extractor).__name__} failed to extract {path}:\n{traceback.format_exc()}")
+        return []
+
+
+def _pool_result(extractor, path: str, options: Dict, summarize, workers: int) -> List[Dict]:
+    executor = _executors.get(workers)
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        _executors[workers] = executor
+    path = os.path.abspath(path)
+    experiment_dir = _experiment_dir(path)
+    if experiment_dir is None:
+        return summarize(path, options)
+    for batch_key in [batch_key for batch_key in _batches if batch_key[1] != experiment_dir]:
+        _cancel(_batches.pop(batch_key))
+    batch_key = (_extractor_key(extractor, options), experiment_dir)
+    if batch_key not in _batches:
+        _batches[batch_key] = {file_path: executor.submit(summarize, file_path, options)
+                               for file_path in _experiment_files(extractor, experiment_dir)}
+    future = _batches[batch_key].pop(path, None)
+    if future is None:
+        # not matched by the walk of the experiment or asked for a second time
+        return summarize(path, options)
+    return future.result()
+
+
+def _cancel(batch: Dict[str, Future]):
+    for future in batch.values():
+        future.cancel()
+
+
+def _extractor_key(extractor, options: Dict) -> tuple:
+    extractor_class = type(extractor)
+    fields = json.dumps(vars(extractor), sort_keys=True, default=repr)
+    return (extractor_class.__module__, extractor_class.__qualname__, fields, json.dumps(options, sort_keys=True, default=repr))
+
+
+def _experiment_dir(path: str) -> Optional[str]:
+    # results are laid out as <suite>/<experiment>/run_<i>/rep_<j>/<host_type>/host_<k>/<file>
+    directory = os.path.dirname(path)
+    while os.path.dirname(directory) != directory:
+        if RUN_DIR_REGEX.fullmatch(os.path.basename(directory)):
+            return os.path.dirname(directory)
+        directory = os.path.dirname(directory)
+    return None
+
+
+def _experiment_files(extractor, experiment_dir: str) -> List[str]:
+    file_regex = extractor.file_regex
+    if isinstance(file_regex, str):
+        file_regex = [file_regex]
+    experiment_files = []
+    for root, dirs, files in os.walk(experiment_dir):
+        dirs.sort()
+        for file_name in sorted(files):
+            if any(re.match(regex, file_name) for regex in file_regex):
+                experiment_files.append(os.path.join(root, file_name))
+    return experiment_files
+
+
+@atexit.register
+def _shutdown():
+    for batch in _batches.values():
+        _cancel(batch)
+    _batches.clear()
+    for executor in _executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
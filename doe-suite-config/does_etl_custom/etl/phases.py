@@ -0,0 +1,55 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .span_events import SpanEvents
+
+# phases of the dispatcher, each the sum of the durations of its (start point, end point) pairs
+DISPATCHER_PHASES = {
+    "Arrival": [("Arrival", "PrepareEnvQueue")],
+    "Loading": [("ParsingStart", "ParsingEnd"), ("LoadStart", "LoadEnd")],
+    "Transfer": [("TransferStart", "TransferEnd")],
+    "Engine": [("EngineStart", "EngineEnd")],
+    "Departure": [("FutureReturn", "EndService")],
+    "Total": [("Arrival", "EndService")],
+}
+
+
+def phase_points(phases: Dict[str, List[Tuple[str, str]]]) -> List[str]:
+    points = []
+    for pairs in phases.values():
+        for pair in pairs:
+            if len(pair) != 2:
+                raise ValueError(f"a phase is made of (start point, end point) pairs, got {pair}")
+            points.extend(point for point in pair if point not in points)
+    return points
+
+
+def phase_durations(events: SpanEvents, phases: Dict[str, List[Tuple[str, str]]],
+                    total_phase: Optional[str] = None, remainder_phase: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """
+    Duration of every phase for every request, as differences of the columns of the point table.
+    With a remainder phase, the time of the total phase not covered by any other phase is added
+    under that name, right before the total phase.
+    """
+    points = phase_points(phases)
+    point_columns = {point: column for column, point in enumerate(points)}
+    times = events.point_table(points)
+    durations = {}
+    for phase, pairs in phases.items():
+        durations[phase] = sum(
+            times[:, point_columns[end]] - times[:, point_columns[start]] for start, end in pairs
+        )
+    if remainder_phase is None:
+        return durations
+    if total_phase not in durations:
+        raise ValueError(f"the remainder phase {remainder_phase} needs the total phase {total_phase} to be declared")
+    remainder = durations[total_phase] - sum(
+        duration for phase, duration in durations.items() if phase != total_phase
+    )
+    ordered = {}
+    for phase, duration in durations.items():
+        if phase == total_phase:
+            ordered[remainder_phase] = remainder
+        ordered[phase] = duration
+    return ordered
@@ -0,0 +1,75 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .windows import WindowAggregator
+
+
+def load_steps(rate_changes: List[Tuple[int, int]]) -> List[Tuple[int, int, int]]:
+    # (time_sec, rate before, rate after) of every change of the trace rate
+    steps = []
+    for (_, before), (time, after) in zip(rate_changes, rate_changes[1:]):
+        if after != before:
+            steps.append((time, before, after))
+    return steps
+
+
+def step_reactions(start_s: np.ndarray, latency_ms: np.ndarray, failed: np.ndarray, steps: List[Tuple[int, int, int]],
+                   slo_ms: float, window_ms: int = 1000, slide_ms: int = 100, percentile: float = 99,
+                   end_s: Optional[float] = None) -> List[Dict]:
+    """
+    How the latency reacts to every load step: the windowed percentile (width window_ms, every slide_ms,
+    windows by request start) is followed from the step to the next one.
+    recover_s is the time from the step to the start of the first window after the last one above the SLO,
+    0 if no window was above it and NaN if the last window before the next step still was.
+    overshoot_ms is the peak windowed percentile above the settled one, the median of the second half of the segment.
+    transition_failures counts the failed requests started between the step and the recovery.
+    """
+    if len(start_s) == 0:
+        return []
+    end_s = float(start_s.max()) if end_s is None else end_s
+    windows = WindowAggregator(window_ms * 1000, step=slide_ms * 1000, origin=0, slo=slo_ms)
+    windows.add((start_s * 1e6).astype(np.int64), latency_ms, failed)
+    table = windows.windows([percentile])
+    column = f"latency_p{percentile:3.1f}"
+    window_start_s = table["window_start"].to_numpy() / 1e6
+    window_end_s = table["window_end"].to_numpy() / 1e6
+    values = table[column].to_numpy()
+    violating = values > slo_ms
+
+    reactions = []
+    for index, (time, before, after) in enumerate(steps):
+        segment_end = steps[index + 1][0] if index + 1 < len(steps) else end_s
+        if time >= end_s:
+            break
+        # windows fully inside the segment of this step
+        segment = np.flatnonzero((window_start_s >= time) & (window_end_s <= segment_end))
+        reaction = {"step_s": time, "rate_before": before, "rate_after": after,
+                    "recover_s": np.nan, "peak_ms": np.nan, "settled_ms": np.nan, "overshoot_ms": np.nan,
+                    "recovered": False, "transition_failures": np.nan, "segment_requests": 0}
+        if len(segment) == 0:
+            reactions.append(reaction)
+            continue
+        segment_values = values[segment]
+        late_half = segment_values[len(segment_values) // 2:]
+        reaction["peak_ms"] = float(np.nanmax(segment_values)) if not np.isnan(segment_values).all() else np.nan
+        reaction["settled_ms"] = float(np.nanmedian(late_half)) if not np.isnan(late_half).all() else np.nan
+        reaction["overshoot_ms"] = max(reaction["peak_ms"] - reaction["settled_ms"], 0)
+        segment_violations = np.flatnonzero(violating[segment])
+        if len(segment_violations) == 0:
+            recovered_at = time
+        elif segment_violations[-1] == len(segment) - 1:
+            recovered_at = None
+        else:
+            recovered_at = float(window_start_s[segment[segment_violations[-1] + 1]])
+        in_segment = (start_s >= time) & (start_s < segment_end)
+        reaction["segment_requests"] = int(in_segment.sum())
+        if recovered_at is not None:
+            reaction["recovered"] = True
+            reaction["recover_s"] = recovered_at - time
+            in_transition = (start_s >= time) & (start_s < recovered_at)
+        else:
+            in_transition = in_segment
+        reaction["transition_failures"] = int(failed[in_transition].sum())
+        reactions.append(reaction)
+    return reactions
@@ -0,0 +1,147 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .latency_log import read_latency_log
+from .phases import phase_durations
+from .span_events import SpanEvents, parse_span_events
+from .span_tree import build_span_tree
+
+# time outside of the dispatcher: network, client and anything before the first or after the last event
+OUTSIDE_PHASE = "Outside"
+
+# latency percentile ranges of the tail attribution report
+DEFAULT_BUCKETS = [(0, 50), (50, 90), (90, 99), (99, 99.9), (99.9, 100)]
+
+
+def timestamps_path(latency_path: str) -> str:
+    # both files of a rate are written next to each other by the loader, see client/src/file_writing.rs
+    directory, file_name = os.path.split(latency_path)
+    return os.path.join(directory, file_name.replace("latencies_", "timestamps_", 1))
+
+
+def dispatcher_unit_us(client_start_us: np.ndarray, arrival: np.ndarray) -> float:
+    # the dump does not say its unit: pick the power of 1000 that makes both runs last equally long
+    client_range = float(client_start_us.max() - client_start_us.min())
+    arrival_range = float(arrival.max() - arrival.min())
+    if client_range <= 0 or arrival_range <= 0:
+        return 1.0
+    exponent = round(np.log10(client_range / arrival_range) / 3)
+    return float(1000.0 ** exponent)
+
+
+def align_requests(client_start_us: np.ndarray, arrival_us: np.ndarray, tolerance_us: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pair client requests with dispatcher requests when no request id is shared: the clock offset is estimated
+    from requests paired by rank (from the start and from the end, as either file can miss requests at its ends),
+    then every dispatcher request is matched to the client request that started closest to its shifted arrival.
+    Matches further apart than the tolerance (default half the median gap between client requests)
+    and all but the closest of several matches of one client request are dropped.
+    Returns (client indices, dispatcher indices) of the pairs.
+    """
+    client_order = np.argsort(client_start_us, kind="stable")
+    arrival_order = np.argsort(arrival_us, kind="stable")
+    client_sorted = client_start_us[client_order].astype(np.float64)
+    arrival_sorted = arrival_us[arrival_order].astype(np.float64)
+    pairs = min(len(client_sorted), len(arrival_sorted))
+    if pairs == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    if tolerance_us is None:
+        gaps = np.diff(client_sorted)
+        tolerance_us = max(float(np.median(gaps)) / 2, 1.0) if len(gaps) > 0 else 1.0
+
+    best = None
+    for offset in [np.median(arrival_sorted[:pairs] - client_sorted[:pairs]),
+                   np.median(arrival_sorted[-pairs:] - client_sorted[-pairs:])]:
+        shifted = arrival_sorted - offset
+        right = np.clip(np.searchsorted(client_sorted, shifted), 1, len(client_sorted) - 1) if len(client_sorted) > 1 \
+            else np.zeros(len(shifted), dtype=np.int64)
+        left = np.maximum(right - 1, 0)
+        nearest = np.where(np.abs(client_sorted[left] - shifted) <= np.abs(client_sorted[right] - shifted), left, right)
+        distance = np.abs(client_sorted[nearest] - shifted)
+        matched = distance <= tolerance_us
+        if best is None or matched.sum() > best[0].sum():
+            best = (matched, nearest, distance)
+    matched, nearest, distance = best
+
+    # one dispatcher request per client request, the closest one
+    candidates = np.flatnonzero(matched)
+    closest_first = candidates[np.lexsort((distance[candidates], nearest[candidates]))]
+    keep = np.r_[True, nearest[closest_first][1:] != nearest[closest_first][:-1]] if len(closest_first) > 0 else np.zeros(0, dtype=bool)
+    chosen = closest_first[keep]
+    return client_order[nearest[chosen]], arrival_order[chosen]
+
+
+def request_phases(events: SpanEvents, phases: Optional[Dict[str, List[Tuple[str, str]]]]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    # (arrival time, phase durations) of every dispatcher request, in the unit of the dump
+    if phases is not None:
+        point_times = events.point_table([pairs[0][0] for pairs in phases.values()])
+        return point_times.min(axis=1), phase_durations(events, phases)
+    # without declared phases, the time of every span kind on the critical path
+    span_tree = build_span_tree(events)
+    critical = span_tree.per_request(span_tree.critical_time())
+    arrival = span_tree.start[span_tree.root_offset:]
+    return arrival, {kind: critical[:, kind_id] for kind_id, kind in enumerate(span_tree.kind_names)}
+
+
+def join_requests(latency_path: str, timestamp_path: str, phases: Optional[Dict[str, List[Tuple[str, str]]]] = None,
+                  total_phase: Optional[str] = None, skip_lines: int = 0, time_unit_us: Optional[float] = None) -> pd.DataFrame:
+    """
+    One row per request found in both files: client start and latency, failure, the time (in ms) of each
+    dispatcher phase and the time outside the dispatcher, i.e. the latency minus the total phase
+    (or minus the sum of all phases, which for the critical path is the whole dispatcher time).
+    """
+    latency_log = read_latency_log(latency_path)
+    latency_log.report_malformed()
+    events = parse_span_events(timestamp_path, skip_lines=skip_lines)
+    if len(latency_log) == 0 or events.request_count == 0:
+        return pd.DataFrame()
+    arrival, durations = request_phases(events, phases)
+    if time_unit_us is None:
+        time_unit_us = dispatcher_unit_us(latency_log.start_us, arrival)
+    client_index, dispatcher_index = align_requests(latency_log.start_us, arrival * time_unit_us)
+    unmatched = len(arrival) - len(dispatcher_index)
+    if unmatched > 0:
+        print(f"could not match {unmatched} of {len(arrival)} requests of {timestamp_path} to {latency_path}")
+
+    frame = pd.DataFrame({
+        "start_us": latency_log.start_us[client_index],
+        "instance": latency_log.instance[client_index],
+        "failed": latency_log.failed[client_index],
+        "latency_ms": latency_log.latency_ms[client_index],
+    })
+    for phase, duration in durations.items():
+        frame[phase] = duration[dispatcher_index] * time_unit_us / 1000
+    if total_phase is not None:
+        dispatcher_ms = frame[total_phase]
+    else:
+        dispatcher_ms = frame[list(durations.keys())].sum(axis=1)
+    frame[OUTSIDE_PHASE] = frame["latency_ms"] - dispatcher_ms
+    return frame.sort_values("start_us", ignore_index=True)
+
+
+def tail_attribution(frame: pd.DataFrame, phase_columns: List[str], buckets: List[Tuple[float, float]] = DEFAULT_BUCKETS) -> List[Dict]:
+    """
+    Mean time of every phase over the requests in each latency percentile bucket.
+    """
+    rows = []
+    if frame.empty:
+        return rows
+    latency = frame["latency_ms"].to_numpy()
+    bounds = np.percentile(latency, sorted({bound for bucket in buckets for bound in bucket}))
+    bound_values = dict(zip(sorted({bound for bucket in buckets for bound in bucket}), bounds))
+    for low, high in buckets:
+        selected = (latency >= bound_values[low]) & ((latency < bound_values[high]) if high < 100 else True)
+        bucket_frame = frame[selected]
+        row = {
+            "bucket": f"p{low}-p{high}",
+            "requests": len(bucket_frame),
+            "latency_ms": bucket_frame["latency_ms"].mean(),
+            "failure_rate": bucket_frame["failed"].mean(),
+        }
+        for phase in phase_columns:
+            row[f"{phase}_ms"] = bucket_frame[phase].mean()
+        rows.append(row)
+    return rows
@@ -0,0 +1,373 @@
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .latency_log import LatencyLog, iter_latency_log
+from .span_events import parse_span_events
+
+# Columnar copy of a doe-suite results tree:
+#   <store>/<table>/suite=<suite>/experiment=<exp>/server=<server>/function=<function>/rate=<rate>/<file>.parquet
+# with one parquet file per ingested result file and the scalar config.json values of its run as extra columns.
+# Building it needs pyarrow, everything else keeps working on the csv files without it.
+
+# when set, latency logs that were ingested into this store are read from it instead of the csv files
+STORE_DIR_ENV = "DOES_ETL_STORE_DIR"
+
+TABLES = ["latencies", "timestamps", "monitoring"]
+PARTITION_COLUMNS = ["suite", "experiment", "server", "function", "rate"]
+# partition value for files that are not tied to a rate (monitoring) or a function
+NO_RATE = -1
+NO_VALUE = "none"
+
+LATENCY_FILE_REGEX = re.compile(r"latencies.*\.csv")
+TIMESTAMP_FILE_REGEX = re.compile(r"timestamps.*\.csv")
+# header written by servers/monitoring.py
+MONITORING_HEADER_PREFIX = "timestamp,cpu,"
+# latencies_<target>_<model>_<request type>_<size>_<hot>%hot_<rate>_rate.csv, see client/src/file_writing.rs
+RESULT_FILE_REGEX = re.compile(
+    r"(latencies|timestamps)_(?P<target>.+)_(?P<model>open-loop|open-sweep|open-adaptive|closed-unloaded|closed-peak)"
+    r"_(?P<request_type>[\w-]+?)_(?P<size>[0-9]+)_(?P<hot>[0-9]+)%hot_(?P<rate>[0-9]+)_rate\.csv"
+)
+RUN_DIR_REGEX = re.compile(r"run_([0-9]+)")
+REP_DIR_REGEX = re.compile(r"rep_([0-9]+)")
+
+MANIFEST_FILE = "manifest.json"
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError("the results store needs pyarrow, install the custom etl steps with the 'store' extra") from error
+    return pyarrow
+
+
+def store_dir() -> Optional[Path]:
+    directory = os.environ.get(STORE_DIR_ENV, "")
+    if directory == "":
+        return None
+    return Path(directory)
+
+
+class RunInfo:
+    """
+    Where a result file sits in the results tree:
+    <results>/<suite>_<id>/<experiment>/run_<i>/rep_<j>/<host_type>/host_<k>/<file>
+    """
+
+    def __init__(self, suite, experiment, run, rep, host_type, host, config):
+        self.suite = suite
+        self.experiment = experiment
+        self.run = run
+        self.rep = rep
+        self.host_type = host_type
+        self.host = host
+        self.config = config
+
+    @classmethod
+    def from_path(cls, results_dir: Path, path: Path, config: Dict) -> "RunInfo":
+        parts = path.relative_to(results_dir).parts
+        run_index = next(index for index, part in enumerate(parts) if RUN_DIR_REGEX.fullmatch(part))
+        rep_match = REP_DIR_REGEX.fullmatch(parts[run_index + 1]) if len(parts) > run_index + 2 else None
+        host_parts = parts[run_index + 2:-1] if rep_match else parts[run_index + 1:-1]
+        return cls(
+            # the results directory can also be a single suite directory
+            suite=parts[run_index - 2] if run_index >= 2 else results_dir.name,
+            experiment=parts[run_index - 1],
+            run=int(RUN_DIR_REGEX.fullmatch(parts[run_index])[1]),
+            rep=int(rep_match[1]) if rep_match else 0,
+            host_type=host_parts[0] if len(host_parts) > 0 else NO_VALUE,
+            host=host_parts[1] if len(host_parts) > 1 else NO_VALUE,
+            config=config,
+        )
+
+    def factors(self, reserved: List[str]) -> Dict[str, str]:
+        # nested values (server_configs) are the same for every run and are left out,
+        # values are kept as strings so every file of the dataset has the same schema
+        return {
+            key: str(value)
+            for key, value in self.config.items()
+            if isinstance(value, (str, int, float, bool)) and key not in reserved and key not in PARTITION_COLUMNS
+        }
+
+
+def find_config(path: Path, results_dir: Path, configs: Dict[Path, Dict]) -> Dict:
+    directory = path.parent
+    while directory != results_dir and directory != directory.parent:
+        if directory in configs:
+            return configs[directory]
+        config_path = directory / "config.json"
+        if config_path.exists():
+            with open(config_path, "r") as config_file:
+                configs[directory] = json.load(config_file)
+            return configs[directory]
+        directory = directory.parent
+    return {}
+
+
+def classify(path: Path) -> Optional[str]:
+    if LATENCY_FILE_REGEX.fullmatch(path.name):
+        return "latencies"
+    if TIMESTAMP_FILE_REGEX.fullmatch(path.name):
+        return "timestamps"
+    if path.suffix == ".csv":
+        with open(path, "r", errors="replace") as csv_file:
+            if csv_file.readline().startswith(MONITORING_HEADER_PREFIX):
+                return "monitoring"
+    return None
+
+
+def partition_values(table: str, path: Path, info: RunInfo) -> Dict:
+    file_match = RESULT_FILE_REGEX.fullmatch(path.name)
+    function = info.config.get("function")
+    if function is None:
+        function = file_match["request_type"] if file_match else NO_VALUE
+    return {
+        "suite": info.suite,
+        "experiment": info.experiment,
+        "server": str(info.config.get("server", NO_VALUE)),
+        "function": str(function),
+        "rate": int(file_match["rate"]) if file_match else NO_RATE,
+    }
+
+
+def latency_table(path: Path) -> tuple:
+    pa = _pyarrow()
+    log = LatencyLog.concat(str(path), list(iter_latency_log(str(path), use_store=False)))
+    columns = {
+        "instance": pa.array(log.instance.astype(str)).dictionary_encode(),
+        "url_function": pa.array(log.function.astype(str)).dictionary_encode(),
+        "start_us": pa.array(log.start_us, type=pa.int64()),
+        "latency_us": pa.array(log.latency_us, type=pa.int64()),
+        "timeout": pa.array(log.timeout, type=pa.bool_()),
+        "error": pa.array(log.error, type=pa.bool_()),
+        "status": pa.array(log.status, type=pa.int16()),
+    }
+    return columns, log.malformed
+
+
+def timestamp_table(path: Path) -> tuple:
+    # one row per event, request numbers the lines with events
+    pa = _pyarrow()
+    span_events = parse_span_events(str(path))
+    point_names = pa.array(span_events.point_names, type=pa.string())
+    columns = {
+        "request": pa.array(span_events.request, type=pa.int64()),
+        "event": pa.array(span_events.position, type=pa.int32()),
+        "parent": pa.array(span_events.parent, type=pa.uint64()),
+        "span": pa.array(span_events.span, type=pa.uint64()),
+        "time": pa.array(span_events.time, type=pa.int64()),
+        "point": pa.DictionaryArray.from_arrays(pa.array(span_events.point, type=pa.int32()), point_names),
+    }
+    return columns, 0
+
+
+def monitoring_table(path: Path) -> tuple:
+    pa = _pyarrow()
+    frame = pd.read_csv(path, on_bad_lines="skip")
+    columns = {column: pa.array(frame[column].to_numpy()) for column in frame.columns}
+    return columns, 0
+
+
+TABLE_READERS = {
+    "latencies": latency_table,
+    "timestamps": timestamp_table,
+    "monitoring": monitoring_table,
+}
+
+
+def ingest(results_dir: str, target_dir: str, force: bool = False) -> int:
+    """
+    Convert every latency log, timestamp file and monitoring csv below results_dir into
+    the store at target_dir. Files that were ingested before and did not change are skipped.
+    Returns the number of files written.
+    """
+    pa = _pyarrow()
+    results_dir = Path(results_dir).resolve()
+    target_dir = Path(target_dir)
+    manifest = load_manifest(target_dir)
+    configs = {}
+    written = 0
+    for root, dirs, files in os.walk(results_dir):
+        dirs.sort()
+        for file_name in sorted(files):
+            path = Path(root) / file_name
+            table = classify(path)
+            if table is None:
+                continue
+            stat = path.stat()
+            entry = manifest.get(str(path))
+            if not force and entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                continue
+            try:
+                info = RunInfo.from_path(results_dir, path, find_config(path, results_dir, configs))
+            except StopIteration:
+                print(f"skipping {path}: not inside a run_<i> directory")
+                continue
+
+            columns, malformed = TABLE_READERS[table](path)
+            rows = len(next(iter(columns.values()))) if columns else 0
+            columns.update({
+                "run": pa.array(np.full(rows, info.run), type=pa.int32()),
+                "rep": pa.array(np.full(rows, info.rep), type=pa.int32()),
+                "host_type": pa.array([info.host_type] * rows, type=pa.string()).dictionary_encode(),
+                "host": pa.array([info.host] * rows, type=pa.string()).dictionary_encode(),
+                "file": pa.array([file_name] * rows, type=pa.string()).dictionary_encode(),
+            })
+            for key, value in info.factors(list(columns.keys())).items():
+                columns[key] = pa.array([value] * rows, type=pa.string()).dictionary_encode()
+            partition = partition_values(table, path, info)
+            relative_dir = Path(table, *[f"{column}={partition[column]}" for column in PARTITION_COLUMNS])
+            relative_path = relative_dir / f"run_{info.run}_rep_{info.rep}_{info.host_type}_{info.host}_{path.stem}.parquet"
+            write_parquet(target_dir / relative_path, pa.table(columns))
+            manifest[str(path)] = {
+                "table": table,
+                "file": str(relative_path),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "malformed": malformed,
+            }
+            written += 1
+    write_manifest(target_dir, manifest)
+    return written
+
+
+def write_parquet(path: Path, table):
+    pq = _pyarrow().parquet
+    path.parent.mkdir(parents=True, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    os.close(file_descriptor)
+    try:
+        pq.write_table(table, temp_path, compression="zstd")
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def load_manifest(directory: Path) -> Dict[str, Dict]:
+    try:
+        with open(directory / MANIFEST_FILE, "r") as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return {}
+
+
+def write_manifest(directory: Path, manifest: Dict[str, Dict]):
+    directory.mkdir(parents=True, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(file_descriptor, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    os.replace(temp_path, directory / MANIFEST_FILE)
+
+
+_manifests: Dict[Path, tuple] = {}
+
+
+def stored_entry(path: str) -> Optional[Dict]:
+    """
+    Manifest entry of an up to date copy of the result file in the store configured by DOES_ETL_STORE_DIR,
+    or None if there is no store or the file was not ingested since it last changed.
+    """
+    directory = store_dir()
+    if directory is None:
+        return None
+    try:
+        manifest_mtime = (directory / MANIFEST_FILE).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _manifests.get(directory)
+    if cached is None or cached[0] != manifest_mtime:
+        cached = (manifest_mtime, load_manifest(directory))
+        _manifests[directory] = cached
+    entry = cached[1].get(str(Path(path).resolve()))
+    if entry is None:
+        return None
+    stat = os.stat(path)
+    if entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+        return None
+    return dict(entry, file=str(directory / entry["file"]))
+
+
+def iter_stored_latency_log(path: str, entry: Dict, batch_rows: int = 1 << 22) -> Iterator[LatencyLog]:
+    pq = _pyarrow().parquet
+    parquet_file = pq.ParquetFile(entry["file"], memory_map=True)
+    columns = ["instance", "url_function", "start_us", "latency_us", "timeout", "error", "status"]
+    malformed = entry.get("malformed", 0)
+    for batch in parquet_file.iter_batches(batch_size=batch_rows, columns=columns):
+        log = LatencyLog(
+            path,
+            _decode(batch.column(0)),
+            _decode(batch.column(1)),
+            batch.column(2).to_numpy(),
+            batch.column(3).to_numpy(),
+            batch.column(4).to_numpy(zero_copy_only=False),
+            batch.column(5).to_numpy(zero_copy_only=False),
+            batch.column(6).to_numpy(),
+            malformed,
+        )
+        # the dropped rows are only reported once per file
+        malformed = 0
+        yield log
+    if malformed > 0:
+        empty = LatencyLog.concat(path, [])
+        empty.malformed = malformed
+        yield empty
+
+
+def _decode(column) -> np.ndarray:
+    if hasattr(column, "indices"):
+        dictionary = column.dictionary.to_numpy(zero_copy_only=False).astype(object)
+        return dictionary[column.indices.to_numpy()]
+    return column.to_numpy(zero_copy_only=False).astype(object)
+
+
+def read_table(table: str, columns: Optional[List[str]] = None, filters: Optional[Dict] = None,
+               directory: Optional[str] = None) -> pd.DataFrame:
+    """
+    Read the given columns of a table in the store, only touching the partitions and row groups
+    that can match the filters, e.g. filters={"server": ["dandelion_process", "wasmtime"], "rate": 1000}.
+    """
+    pa = _pyarrow()
+    directory = Path(directory) if directory is not None else store_dir()
+    if directory is None:
+        raise ValueError(f"no results store given and {STORE_DIR_ENV} is not set")
+    partitioning = pa.dataset.partitioning(pa.schema([
+        ("suite", pa.string()),
+        ("experiment", pa.string()),
+        ("server", pa.string()),
+        ("function", pa.string()),
+        ("rate", pa.int64()),
+    ]), flavor="hive")
+    dataset = pa.dataset.dataset(directory / table, format="parquet", partitioning=partitioning)
+    # runs with different config keys have different columns, the missing ones read as null
+    schema = pa.unify_schemas(
+        [fragment.physical_schema for fragment in dataset.get_fragments()] + [partitioning.schema],
+        promote_options="permissive",
+    )
+    dataset = pa.dataset.dataset(directory / table, format="parquet", partitioning=partitioning, schema=schema)
+    expression = None
+    for column, value in (filters or {}).items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        condition = pa.dataset.field(column).isin(list(values))
+        expression = condition if expression is None else expression & condition
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="convert a doe-suite results tree into a parquet results store")
+    parser.add_argument("results", help="doe-suite-results directory or a single suite directory in it")
+    parser.add_argument("store", help="directory of the results store")
+    parser.add_argument("--force", action="store_true", help="rewrite files that are already up to date")
+    args = parser.parse_args()
+    print(f"ingested {ingest(args.results, args.store, args.force)} files into {args.store}")
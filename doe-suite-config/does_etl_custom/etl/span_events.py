@@ -0,0 +1,138 @@
+import re
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+# one event of the dispatcher /stats dump, a line holds all events of one request
+EVENT_REGEX = re.compile(r"parent:([0-9]+), span:([0-9]+), time:([0-9]+), point:(\w+)")
+
+
+class SpanEvents:
+    """
+    All events of a timestamp dump as flat arrays with one entry per event, in file order.
+    request numbers the lines that hold at least one event, position is the index of the event in its line
+    and point holds ids into the interned point names.
+    """
+
+    def __init__(self, path, request, position, parent, span, time, point, point_names):
+        self.path = path
+        self.request = request
+        self.position = position
+        self.parent = parent
+        self.span = span
+        self.time = time
+        self.point = point
+        self.point_names = point_names
+        self.point_ids = {name: point_id for point_id, name in enumerate(point_names)}
+        self.request_count = int(request[-1]) + 1 if len(request) > 0 else 0
+
+    def __len__(self):
+        return len(self.time)
+
+    def point_table(self, names: List[str]) -> np.ndarray:
+        """
+        Time of the event of each of the given points for every request, shape (request_count, len(names)).
+        Every request needs exactly one event of each point, all violations are reported at once.
+        """
+        columns = np.full(len(self.point_names), -1, dtype=np.int64)
+        for column, name in enumerate(names):
+            if name in self.point_ids:
+                columns[self.point_ids[name]] = column
+        event_column = columns[self.point]
+        selected = event_column >= 0
+        cells = self.request[selected] * len(names) + event_column[selected]
+        occurrences = np.bincount(cells, minlength=self.request_count * len(names)).reshape(self.request_count, len(names))
+        invalid = occurrences != 1
+        if invalid.any():
+            problems = [
+                f"{name}: {int(invalid[:, column].sum())} requests, first {int(np.argmax(invalid[:, column]))}"
+                for column, name in enumerate(names) if invalid[:, column].any()
+            ]
+            raise ValueError(f"points missing or repeated in {self.path} ({'; '.join(problems)})")
+        table = np.empty(self.request_count * len(names), dtype=np.int64)
+        table[cells] = self.time[selected]
+        return table.reshape(self.request_count, len(names))
+
+    def consecutive_spans(self) -> tuple:
+        """
+        Time between each event and the next one of the same request, labeled by the position and point of the
+        first event: returns (label ids, durations, label names) with names like T03_LoadStart.
+        """
+        same_request = self.request[1:] == self.request[:-1]
+        first = np.flatnonzero(same_request)
+        durations = self.time[first + 1] - self.time[first]
+        label_keys = self.position[first].astype(np.int64) * len(self.point_names) + self.point[first]
+        unique_keys, labels = np.unique(label_keys, return_inverse=True)
+        label_names = [
+            f"T{key // len(self.point_names):02}_{self.point_names[key % len(self.point_names)]}" for key in unique_keys
+        ]
+        return labels, durations, label_names
+
+
+def parse_span_events(path: str, skip_lines: int = 0) -> SpanEvents:
+    with open(path, "r") as timestamp_file:
+        for _ in range(skip_lines):
+            timestamp_file.readline()
+        text = timestamp_file.read()
+    events = EVENT_REGEX.findall(text)
+    if len(events) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return SpanEvents(path, empty, empty.astype(np.int32), empty.astype(np.uint64), empty.astype(np.uint64), empty,
+                          empty.astype(np.int32), [])
+    # lines without events do not count as requests
+    events_per_line = np.array([line.count("point:") for line in text.split("\n")], dtype=np.int64)
+    events_per_line = events_per_line[events_per_line > 0]
+    if events_per_line.sum() != len(events):
+        raise ValueError(f"malformed events in {path}")
+    request = np.repeat(np.arange(len(events_per_line)), events_per_line)
+    starts = np.cumsum(events_per_line) - events_per_line
+    position = np.arange(len(events)) - np.repeat(starts, events_per_line)
+    parent, span, time, point = zip(*events)
+    # interning the point names by hashing is much cheaper than sorting them
+    point, point_names = pd.factorize(np.array(point, dtype=object))
+    return SpanEvents(
+        path,
+        request,
+        position.astype(np.int32),
+        # span ids can use the full 64 bits
+        np.array(parent, dtype=np.uint64),
+        np.array(span, dtype=np.uint64),
+        np.array(time, dtype=np.int64),
+        point.astype(np.int32),
+        [str(name) for name in point_names],
+    )
+
+
+def grouped_quantiles(groups: np.ndarray, values: np.ndarray, group_count: int, quantiles: List[float]) -> np.ndarray:
+    """
+    Linearly interpolated quantiles (as numpy and pandas compute them) of the values of every group,
+    shape (group_count, len(quantiles)), NaN for empty groups.
+    """
+    order = np.lexsort((values, groups))
+    sorted_values = values[order].astype(np.float64)
+    counts = np.bincount(groups, minlength=group_count)
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    result = np.full((group_count, len(quantiles)), np.nan)
+    present = counts > 0
+    for column, quantile in enumerate(quantiles):
+        rank = starts[present] + quantile * (counts[present] - 1)
+        low = np.floor(rank).astype(np.int64)
+        high = np.minimum(low + 1, starts[present] + counts[present] - 1)
+        fraction = rank - low
+        result[present, column] = sorted_values[low] + fraction * (sorted_values[high] - sorted_values[low])
+    return result
+
+
+def grouped_summary(groups: np.ndarray, values: np.ndarray, names: List[str], quartiles, whiskers) -> Dict[str, float]:
+    # the box plot statistics of every group, keyed like <name>_med
+    counts = np.bincount(groups, minlength=len(names))
+    sums = np.bincount(groups, weights=values, minlength=len(names))
+    means = np.divide(sums, counts, out=np.full(len(names), np.nan), where=counts > 0)
+    quantiles = grouped_quantiles(groups, values, len(names), [0.5, quartiles[0], quartiles[1], whiskers[0], whiskers[1]])
+    summary = {}
+    for index, name in enumerate(names):
+        summary[f'{name}_mean'] = means[index]
+        for column, statistic in enumerate(["med", "q1", "q3", "whislo", "whishi"]):
+            summary[f'{name}_{statistic}'] = quantiles[index, column]
+    return summary
@@ -0,0 +1,227 @@
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from .span_events import SpanEvents
+
+# kind of the synthetic root every request gets, its self time is the time not covered by any reported span
+UNTRACKED_KIND = "Untracked"
+# cap on the parent chain length, spans further down (or in a parent cycle) are attached to the request root
+MAX_DEPTH = 64
+
+
+def span_kind(point_name: str) -> str:
+    # a span is named after the point of its first event, LoadStart -> Load
+    for suffix in ["Start", "Begin"]:
+        if point_name.endswith(suffix) and len(point_name) > len(suffix):
+            return point_name[:-len(suffix)]
+    return point_name
+
+
+class SpanTree:
+    """
+    The spans of every request of a timestamp dump as a forest in flat arrays, one entry per span.
+    A span covers the time from its first to its last event and hangs below the span its events name as parent.
+    Every request has a synthetic root span (kind Untracked) covering all its events, below which the spans
+    without a parent in the request are attached, so each request is one tree.
+    The last request_count entries are the roots, the root of request r is at index root_offset + r.
+    """
+
+    def __init__(self, request, parent, start, end, kind, kind_names, depth):
+        self.request = request
+        self.parent = parent
+        self.start = start
+        self.end = end
+        self.kind = kind
+        self.kind_names = kind_names
+        self.depth = depth
+        self.request_count = int(request.max()) + 1 if len(request) > 0 else 0
+        self.root_offset = len(request) - self.request_count
+
+    def __len__(self):
+        return len(self.request)
+
+    @property
+    def duration(self) -> np.ndarray:
+        return self.end - self.start
+
+    @property
+    def latency(self) -> np.ndarray:
+        # time from the first to the last event of every request
+        return self.duration[self.root_offset:]
+
+    def clipped_children(self) -> tuple:
+        # (child index, start, end) of every non root span, limited to its parent's interval
+        children = np.arange(self.root_offset)
+        parents = self.parent[children]
+        start = np.clip(self.start[children], self.start[parents], self.end[parents])
+        end = np.clip(self.end[children], start, self.end[parents])
+        return children, start, end
+
+    def self_time(self) -> np.ndarray:
+        """
+        Time of every span not covered by any of its children, overlapping children are only counted once.
+        """
+        children, start, end = self.clipped_children()
+        parents = self.parent[children]
+        order = np.lexsort((start, parents))
+        parents, start, end = parents[order], start[order], end[order]
+        # the end of the children covered so far, within each parent
+        covered_end = pd.Series(end).groupby(parents).cummax().to_numpy()
+        previous_end = np.r_[np.iinfo(np.int64).min, covered_end[:-1]]
+        previous_end[np.r_[True, parents[1:] != parents[:-1]]] = np.iinfo(np.int64).min
+        uncovered = np.maximum(end - np.maximum(start, previous_end), 0)
+        covered = np.bincount(parents, weights=uncovered, minlength=len(self))
+        return self.duration - covered.astype(np.int64)
+
+    def nested_intervals(self) -> tuple:
+        # (start, end) of every span limited to its parent's limited interval, so each span lies within all its ancestors
+        start, end = self.start.copy(), self.end.copy()
+        for depth in range(1, int(self.depth.max()) + 1 if len(self) > 0 else 0):
+            level = np.flatnonzero(self.depth[:self.root_offset] == depth)
+            parents = self.parent[level]
+            start[level] = np.clip(start[level], start[parents], end[parents])
+            end[level] = np.clip(end[level], start[level], end[parents])
+        return start, end
+
+    def critical_time(self) -> np.ndarray:
+        """
+        Time every span contributes to the critical path of its request, 0 for spans not on it.
+        Spans are limited to the interval of their ancestors (see nested_intervals).
+        Going backwards from the end of a span on the path, the child that finished last is on the path,
+        then the child that finished last before that child started, and so on.
+        The rest of a span on the path is its own contribution, so the contributions of a request add up to its latency.
+        """
+        span_start, span_end = self.nested_intervals()
+        children = np.arange(self.root_offset)
+        parents = self.parent[children]
+        start, end = span_start[children], span_end[children]
+        request_start = self.start[self.root_offset:][self.request]
+        end_offset = end - request_start[children]
+
+        critical = np.zeros(len(children), dtype=bool)
+        candidates = np.unique(parents)
+        limit = span_end[candidates] - request_start[candidates]
+        # keys of different parents must not overlap, for the children and the limits searched with
+        scale = int(max(end_offset.max(), limit.max())) + 2 if len(end_offset) > 0 else 1
+        order = np.lexsort((end_offset, parents))
+        keys = parents[order].astype(np.int64) * scale + end_offset[order]
+        bound = np.full(len(candidates), len(keys))
+        while len(candidates) > 0:
+            index = np.minimum(np.searchsorted(keys, candidates * scale + limit, side="right"), bound) - 1
+            found = index >= 0
+            found[found] = parents[order[index[found]]] == candidates[found]
+            candidates, index = candidates[found], index[found]
+            child = order[index]
+            critical[child] = True
+            limit = start[child] - request_start[child]
+            bound = index
+
+        on_path = np.zeros(len(self), dtype=bool)
+        on_path[self.root_offset:] = True
+        for depth in range(1, int(self.depth.max()) + 1 if len(self) > 0 else 0):
+            level = np.flatnonzero(self.depth[children] == depth)
+            on_path[children[level]] = critical[level] & on_path[parents[level]]
+        critical_children = on_path[children]
+        covered = np.bincount(parents[critical_children], weights=(end - start)[critical_children], minlength=len(self))
+        return np.where(on_path, span_end - span_start - covered.astype(np.int64), 0)
+
+    def per_request(self, values: np.ndarray) -> np.ndarray:
+        # sum of a per span value by request and kind, shape (request_count, number of kinds)
+        kind_count = len(self.kind_names)
+        totals = np.bincount(self.request * kind_count + self.kind, weights=values, minlength=self.request_count * kind_count)
+        return totals.reshape(self.request_count, kind_count)
+
+
+def build_span_tree(events: SpanEvents) -> SpanTree:
+    order = np.lexsort((events.time, events.span, events.request))
+    request, span, time = events.request[order], events.span[order], events.time[order]
+    new_span = np.r_[True, (request[1:] != request[:-1]) | (span[1:] != span[:-1])]
+    first = np.flatnonzero(new_span)
+    last = np.r_[first[1:], len(order)] - 1
+    span_request = request[first]
+    span_id = span[first]
+    parent_id = events.parent[order][first]
+    start = time[first]
+    end = time[last]
+
+    span_count = len(first)
+    request_count = events.request_count
+    # parents are looked up within the same request
+    span_index = pd.MultiIndex.from_arrays([span_request, span_id])
+    parent = span_index.get_indexer(pd.MultiIndex.from_arrays([span_request, parent_id]))
+    roots = span_count + np.arange(request_count)
+    parent = np.where((parent < 0) | (parent_id == span_id), roots[span_request] if span_count > 0 else parent, parent)
+
+    depth = np.ones(span_count, dtype=np.int64)
+    ancestor = parent.copy()
+    for _ in range(MAX_DEPTH):
+        below_root = ancestor < span_count
+        if not below_root.any():
+            break
+        depth[below_root] += 1
+        ancestor[below_root] = parent[ancestor[below_root]]
+    else:
+        too_deep = ancestor < span_count
+        parent[too_deep] = roots[span_request[too_deep]]
+        depth[too_deep] = 1
+        # spans below the reattached ones keep a too large depth, which only delays them in critical_time
+        print(f"reattached {int(too_deep.sum())} spans of {events.path} without a path to the request root")
+
+    # kinds of the points that start a span, the root kind first
+    first_point = events.point[order][first]
+    kind_names = [UNTRACKED_KIND]
+    point_kinds = np.zeros(len(events.point_names), dtype=np.int64)
+    for point_id in np.unique(first_point):
+        kind = span_kind(events.point_names[point_id])
+        if kind not in kind_names:
+            kind_names.append(kind)
+        point_kinds[point_id] = kind_names.index(kind)
+    kind = point_kinds[first_point]
+
+    root_start = np.full(request_count, np.iinfo(np.int64).max)
+    root_end = np.full(request_count, np.iinfo(np.int64).min)
+    np.minimum.at(root_start, span_request, start)
+    np.maximum.at(root_end, span_request, end)
+    return SpanTree(
+        np.r_[span_request, np.arange(request_count)].astype(np.int64),
+        np.r_[parent, np.full(request_count, -1)].astype(np.int64),
+        np.r_[start, root_start].astype(np.int64),
+        np.r_[end, root_end].astype(np.int64),
+        np.r_[kind, np.zeros(request_count, dtype=np.int64)],
+        kind_names,
+        np.r_[depth, np.zeros(request_count, dtype=np.int64)],
+    )
+
+
+def in_bucket(latency: np.ndarray, bucket: tuple) -> np.ndarray:
+    # requests whose latency rank lies in the (low, high) quantile range, at least one request
+    order = np.argsort(latency, kind="stable")
+    low = int(np.floor(bucket[0] * (len(latency) - 1)))
+    high = int(np.ceil(bucket[1] * (len(latency) - 1)))
+    selected = np.zeros(len(latency), dtype=bool)
+    selected[order[low:high + 1]] = True
+    return selected
+
+
+def dominant_phases(tree: SpanTree, buckets: Dict[str, tuple]) -> Dict:
+    """
+    Mean critical path time and self time per span kind of the requests in each latency bucket
+    and the kind with the largest critical path time, e.g. {"p50": (0.45, 0.55), "p99": (0.99, 1.0)}.
+    """
+    if tree.request_count == 0:
+        return {}
+    critical = tree.per_request(tree.critical_time())
+    self_times = tree.per_request(tree.self_time())
+    summary = {}
+    for bucket, quantile_range in buckets.items():
+        selected = in_bucket(tree.latency, quantile_range)
+        critical_means = critical[selected].mean(axis=0)
+        self_means = self_times[selected].mean(axis=0)
+        summary[f"latency_{bucket}_mean"] = float(tree.latency[selected].mean())
+        for kind_id, kind in enumerate(tree.kind_names):
+            summary[f"critical_{kind}_{bucket}"] = critical_means[kind_id]
+            summary[f"self_{kind}_{bucket}"] = self_means[kind_id]
+        summary[f"dominant_{bucket}"] = tree.kind_names[int(np.argmax(critical_means))]
+    return summary
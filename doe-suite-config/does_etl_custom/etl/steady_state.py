@@ -0,0 +1,54 @@
+import numpy as np
+
+# MSER-5 (White 1997): average the series in batches of 5, and drop the number of leading batches d
+# that minimizes the squared standard error of the mean of the remaining batches,
+#   MSER(d) = sum_{i >= d} (Y_i - mean(Y_d..))^2 / (m - d)^2
+# Truncation points beyond max_fraction of the series are not considered, as the statistic
+# gets unreliable when only few batches remain.
+MSER_BATCH_SIZE = 5
+MSER_MAX_FRACTION = 0.5
+
+
+def mser_truncation(values: np.ndarray, batch_size: int = MSER_BATCH_SIZE, max_fraction: float = MSER_MAX_FRACTION) -> int:
+    """
+    Number of leading values to drop as warm-up, always a multiple of batch_size.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    batch_count = len(values) // batch_size
+    if batch_count < 2:
+        return 0
+    batches = values[:batch_count * batch_size].reshape(batch_count, batch_size).mean(axis=1)
+    # suffix sums give the statistic for every truncation point at once
+    suffix_sum = np.cumsum(batches[::-1])[::-1]
+    suffix_squares = np.cumsum((batches * batches)[::-1])[::-1]
+    remaining = np.arange(batch_count, 0, -1, dtype=np.float64)
+    squared_deviations = np.maximum(suffix_squares - suffix_sum * suffix_sum / remaining, 0)
+    mser = squared_deviations / (remaining * remaining)
+    candidates = max(int(batch_count * max_fraction), 1)
+    return int(np.argmin(mser[:candidates])) * batch_size
+
+
+def binned_means(bin_sums: np.ndarray, bin_counts: np.ndarray) -> np.ndarray:
+    # empty bins take the value of the previous bin, so they neither start nor end a transient
+    means = np.divide(bin_sums, bin_counts, out=np.full(len(bin_sums), np.nan), where=bin_counts > 0)
+    filled = np.where(bin_counts > 0, np.arange(len(means)), 0)
+    np.maximum.accumulate(filled, out=filled)
+    means = means[filled]
+    return np.nan_to_num(means, nan=0.0)
+
+
+def steady_state_start(start_us: np.ndarray, latency: np.ndarray, bin_us: int = 200_000,
+                       batch_size: int = MSER_BATCH_SIZE, max_fraction: float = MSER_MAX_FRACTION) -> int:
+    """
+    Start time (same unit as start_us) from which on the mean latency of requests started
+    in bins of bin_us is in steady state according to MSER.
+    """
+    start_us = np.asarray(start_us)
+    if len(start_us) == 0:
+        return 0
+    first_start = int(start_us.min())
+    bins = (start_us - first_start) // bin_us
+    bin_counts = np.bincount(bins)
+    bin_sums = np.bincount(bins, weights=latency)
+    cutoff_bins = mser_truncation(binned_means(bin_sums, bin_counts), batch_size, max_fraction)
+    return first_start + cutoff_bins * bin_us
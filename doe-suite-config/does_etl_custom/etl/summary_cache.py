@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# cache location and size can be changed through the environment,
+# setting DOES_ETL_CACHE_DIR to an empty string disables the cache
+CACHE_DIR_ENV = "DOES_ETL_CACHE_DIR"
+CACHE_MAX_MB_ENV = "DOES_ETL_CACHE_MAX_MB"
+# hash file contents instead of trusting size and modification time
+CACHE_HASH_ENV = "DOES_ETL_CACHE_HASH"
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "does_etl_custom"
+DEFAULT_CACHE_MAX_MB = 2048
+
+# extractor fields that do not change the summary
+IGNORED_FIELDS = {"workers"}
+
+
+def cache_dir() -> Optional[Path]:
+    directory = os.environ.get(CACHE_DIR_ENV, str(DEFAULT_CACHE_DIR))
+    if directory == "":
+        return None
+    return Path(directory)
+
+
+def file_fingerprint(path: str) -> Dict:
+    stat = os.stat(path)
+    if os.environ.get(CACHE_HASH_ENV, "0") not in ("", "0"):
+        content_hash = hashlib.sha256()
+        with open(path, "rb") as input_file:
+            for chunk in iter(lambda: input_file.read(1 << 24), b""):
+                content_hash.update(chunk)
+        return {"size": stat.st_size, "sha256": content_hash.hexdigest()}
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def cache_key(extractor, path: str, options: Dict) -> str:
+    extractor_class = type(extractor)
+    key_dict = {
+        # summaries can depend on the file name (rate, function), so it is part of the key
+        "path": os.path.abspath(path),
+        "file": file_fingerprint(path),
+        "extractor": f"{extractor_class.__module__}.{extractor_class.__qualname__}",
+        "version": getattr(extractor, "summary_version", 0),
+        "options": options,
+        "fields": {name: value for name, value in vars(extractor).items() if name not in IGNORED_FIELDS},
+    }
+    normalized = json.dumps(key_dict, sort_keys=True, default=repr)
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def cached_summary(extractor, path: str, options: Dict, summarize: Callable[[str, Dict], List[Dict]]) -> List[Dict]:
+    """
+    Return summarize(path, options), reusing a previous result if neither the file,
+    the extractor (class, summary_version, fields) nor the options have changed.
+    """
+    directory = cache_dir()
+    if directory is None:
+        return summarize(path, options)
+
+    key = cache_key(extractor, path, options)
+    entry_path = directory / key[:2] / f"{key}.pkl"
+    try:
+        with open(entry_path, "rb") as entry_file:
+            summary = pickle.load(entry_file)
+        # modification time doubles as last access time for the eviction
+        os.utime(entry_path)
+        return summary
+    except FileNotFoundError:
+        pass
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as error:
+        print(f"dropping unreadable cache entry {entry_path} for {path}: {error}")
+        entry_path.unlink(missing_ok=True)
+
+    summary = summarize(path, options)
+    write_entry(entry_path, summary)
+    evict(directory)
+    return summary
+
+
+def write_entry(entry_path: Path, summary):
+    entry_path.parent.mkdir(parents=True, exist_ok=True)
+    # write next to the final location and rename, so readers never see partial entries
+    file_descriptor, temp_path = tempfile.mkstemp(dir=entry_path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as temp_file:
+            pickle.dump(summary, temp_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, entry_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def evict(directory: Path, max_bytes: Optional[int] = None):
+    if max_bytes is None:
+        max_bytes = int(float(os.environ.get(CACHE_MAX_MB_ENV, DEFAULT_CACHE_MAX_MB)) * 1024 * 1024)
+    entries = []
+    total_bytes = 0
+    for entry_path in directory.glob("*/*.pkl"):
+        try:
+            stat = entry_path.stat()
+        except FileNotFoundError:
+            # removed by a concurrent run
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, entry_path))
+        total_bytes += stat.st_size
+    if total_bytes <= max_bytes:
+        return
+    # least recently used first
+    entries.sort()
+    for _, size, entry_path in entries:
+        entry_path.unlink(missing_ok=True)
+        total_bytes -= size
+        if total_bytes <= max_bytes:
+            break
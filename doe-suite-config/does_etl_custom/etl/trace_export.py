@@ -0,0 +1,83 @@
+import json
+from typing import Dict, List
+
+import numpy as np
+
+from .span_events import parse_span_events
+from .span_tree import SpanTree, build_span_tree
+
+
+def sample_requests(latency: np.ndarray, percentiles: List[float], requests_per_percentile: int) -> Dict[float, np.ndarray]:
+    # the requests whose latency rank is closest to each percentile
+    order = np.argsort(latency, kind="stable")
+    samples = {}
+    for percentile in percentiles:
+        center = int(round(percentile / 100 * (len(latency) - 1)))
+        low = min(max(center - requests_per_percentile // 2, 0), max(len(latency) - requests_per_percentile, 0))
+        samples[percentile] = order[low:low + requests_per_percentile]
+    return samples
+
+
+def chrome_trace(span_tree: SpanTree, samples: Dict[float, np.ndarray], time_unit_us: float = 1.0) -> Dict:
+    """
+    Chrome trace event format:
+    one process per sampled percentile, one thread per request and a complete event (ph X) per span,
+    shifted so every request starts at 0 and the requests of a percentile can be compared.
+    """
+    events = []
+    span_order = np.lexsort((span_tree.start, span_tree.request))
+    span_starts = np.searchsorted(span_tree.request[span_order], np.arange(span_tree.request_count + 1))
+    for process_id, (percentile, requests) in enumerate(samples.items()):
+        events.append({"ph": "M", "name": "process_name", "pid": process_id, "args": {"name": f"p{percentile}"}})
+        events.append({"ph": "M", "name": "process_sort_index", "pid": process_id, "args": {"sort_index": process_id}})
+        for request in requests:
+            request = int(request)
+            root = span_tree.root_offset + request
+            request_start = span_tree.start[root]
+            latency_us = span_tree.duration[root] * time_unit_us
+            events.append({"ph": "M", "name": "thread_name", "pid": process_id, "tid": request,
+                           "args": {"name": f"request {request} ({latency_us:.0f}us)"}})
+            for span in span_order[span_starts[request]:span_starts[request + 1]]:
+                name = "request" if span == root else span_tree.kind_names[span_tree.kind[span]]
+                events.append({
+                    "ph": "X",
+                    "name": name,
+                    "cat": "span",
+                    "pid": process_id,
+                    "tid": request,
+                    "ts": float((span_tree.start[span] - request_start) * time_unit_us),
+                    "dur": float(span_tree.duration[span] * time_unit_us),
+                    "args": {"depth": int(span_tree.depth[span])},
+                })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def export_chrome_trace(path: str, output_path: str, percentiles: List[float] = [50, 99, 99.9],
+                        requests_per_percentile: int = 10, skip_lines: int = 0, time_unit_us: float = 1.0) -> int:
+    """
+    Write the requests of a timestamp dump around the given latency percentiles as a Chrome trace event json,
+    which chrome://tracing and ui.perfetto.dev open. Returns the number of exported requests.
+    """
+    span_tree = build_span_tree(parse_span_events(path, skip_lines=skip_lines))
+    if span_tree.request_count == 0:
+        raise ValueError(f"no requests in {path}")
+    samples = sample_requests(span_tree.latency, percentiles, requests_per_percentile)
+    with open(output_path, "w") as output_file:
+        json.dump(chrome_trace(span_tree, samples, time_unit_us), output_file)
+    return sum(len(requests) for requests in samples.values())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="export requests of a timestamps_*.csv dump as Chrome trace event json")
+    parser.add_argument("timestamps", help="timestamp dump of the dispatcher")
+    parser.add_argument("output", help="json file to write")
+    parser.add_argument("--percentiles", type=float, nargs="+", default=[50, 99, 99.9],
+                        help="latency percentiles to sample requests around")
+    parser.add_argument("--requests", type=int, default=10, help="requests per percentile")
+    parser.add_argument("--skip-lines", type=int, default=0, help="lines before the first request")
+    parser.add_argument("--time-unit-us", type=float, default=1.0, help="microseconds per time unit of the dump")
+    args = parser.parse_args()
+    exported = export_chrome_trace(args.timestamps, args.output, args.percentiles, args.requests, args.skip_lines, args.time_unit_us)
+    print(f"exported {exported} requests to {args.output}")
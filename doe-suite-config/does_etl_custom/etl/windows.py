@@ -0,0 +1,126 @@
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .latency_sketch import BinnedLatencySketch, _padded
+
+
+class WindowAggregator:
+    """
+    Count, throughput, failure ratio, SLO violations and sketched value percentiles per time window,
+    fed with (timestamp, value) columns in chunks of any size.
+    Windows are width long and start every step (tumbling if step is width, sliding if it is smaller),
+    width has to be a multiple of step. Internally one bin per step is kept (see BinnedLatencySketch)
+    and a window merges the width / step bins it covers, so the memory use only grows with the time span
+    covered, not with the number of rows.
+    Timestamps are in any integer unit, units_per_second converts counts to throughput (1e6 for us).
+    Timestamps before the origin (by default the earliest timestamp of the first chunk) count in the first bin.
+    """
+
+    def __init__(self, width: int, step: Optional[int] = None, origin: Optional[int] = None, units_per_second: float = 1e6,
+                 slo: Optional[float] = None, relative_accuracy: float = 0.01):
+        step = width if step is None else step
+        if step <= 0 or width % step != 0:
+            raise ValueError(f"the window width {width} has to be a positive multiple of the step {step}")
+        self.width = width
+        self.step = step
+        self.origin = origin
+        self.units_per_second = units_per_second
+        self.slo = slo
+        self.relative_accuracy = relative_accuracy
+        self.bins = None
+        self.violations = np.zeros(0, dtype=np.int64)
+
+    def add(self, timestamps: np.ndarray, values: Optional[np.ndarray] = None, failed: Optional[np.ndarray] = None):
+        # without values only the counts are meaningful, failed requests count as SLO violations
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if len(timestamps) == 0:
+            return
+        if self.bins is None:
+            origin = int(timestamps.min()) if self.origin is None else self.origin
+            self.bins = BinnedLatencySketch(self.step, origin, self.relative_accuracy)
+        values = np.zeros(len(timestamps)) if values is None else np.asarray(values, dtype=np.float64)
+        failed = np.zeros(len(timestamps), dtype=bool) if failed is None else np.asarray(failed, dtype=bool)
+        self.bins.add(timestamps, values, failed)
+        if self.slo is not None:
+            violated = failed | (values > self.slo)
+            bins = self.bin_of(timestamps)
+            self.violations = _padded(self.violations, len(self.bins)) + \
+                np.bincount(bins, weights=violated, minlength=len(self.bins)).astype(np.int64)
+
+    def bin_of(self, timestamps: np.ndarray) -> np.ndarray:
+        return np.maximum((np.asarray(timestamps, dtype=np.int64) - self.bins.origin_us) // self.step, 0)
+
+    def window_of(self, timestamps: np.ndarray) -> np.ndarray:
+        # position in windows() of the window starting in the bin of every timestamp, for tumbling windows its window
+        return np.minimum(self.bin_of(timestamps), max(self.window_count() - 1, 0))
+
+    def window_count(self) -> int:
+        if self.bins is None or len(self.bins) == 0:
+            return 0
+        # only full windows, or a single partial one if the data does not cover one
+        return max(len(self.bins) - self.width // self.step + 1, 1)
+
+    def windows(self, percentiles: List[float] = []) -> pd.DataFrame:
+        """
+        One row per window: window_start, window_end, count, throughput, failures, failure_ratio,
+        mean and latency_p<percentile> of the values and, with an SLO, slo_violations and slo_violation_ratio.
+        """
+        window_count = self.window_count()
+        bins_per_window = self.width // self.step
+        if window_count == 0:
+            return pd.DataFrame(columns=["window_start", "window_end", "count", "throughput", "failures", "failure_ratio", "mean"])
+        starts = np.arange(window_count)
+        ends = np.minimum(starts + bins_per_window, len(self.bins))
+
+        def window_sums(per_bin):
+            cumulative = np.r_[0, np.cumsum(per_bin)]
+            return cumulative[ends] - cumulative[starts]
+
+        counts = window_sums(self.bins.counts)
+        failures = window_sums(self.bins.failures)
+        frame = pd.DataFrame({
+            "window_start": self.bins.origin_us + starts * self.step,
+            "window_end": self.bins.origin_us + starts * self.step + self.width,
+            "count": counts,
+            "throughput": counts / (self.width / self.units_per_second),
+            "failures": failures,
+            "failure_ratio": np.divide(failures, counts, out=np.full(window_count, np.nan), where=counts > 0),
+            "mean": np.divide(window_sums(self.bins.latency_sums), counts, out=np.full(window_count, np.nan), where=counts > 0),
+        })
+        if self.slo is not None:
+            violations = window_sums(_padded(self.violations, len(self.bins)))
+            frame["slo_violations"] = violations
+            frame["slo_violation_ratio"] = np.divide(violations, counts, out=np.full(window_count, np.nan), where=counts > 0)
+        if len(percentiles) > 0:
+            rows = [self.bins.sketch(start, end).percentiles(percentiles) for start, end in zip(starts, ends)]
+            frame = pd.concat([frame, pd.DataFrame(rows)], axis=1)
+        return frame
+
+
+def interval_sums(start: np.ndarray, end: np.ndarray, values: np.ndarray, width: int, origin: int = 0) -> pd.DataFrame:
+    """
+    Sum of the values of all intervals active in each window of width, an interval counts in every window
+    from the one its start falls into to the one its end falls into (both included).
+    Returns window_start, active (number of intervals) and sum for the windows with at least one interval.
+    """
+    first = (np.asarray(start, dtype=np.int64) - origin) // width
+    last = (np.asarray(end, dtype=np.int64) - origin) // width
+    # intervals ending before they start are in no window
+    valid = last >= first
+    first, last, values = first[valid], last[valid], np.asarray(values, dtype=np.float64)[valid]
+    if len(first) == 0:
+        return pd.DataFrame(columns=["window_start", "active", "sum"])
+    offset = int(first.min())
+    size = int(last.max()) - offset + 2
+    # difference arrays: +value from the first window on, -value after the last
+    active = np.cumsum(np.bincount(first - offset, minlength=size) - np.bincount(last - offset + 1, minlength=size))
+    sums = np.cumsum(np.bincount(first - offset, weights=values, minlength=size)
+                     - np.bincount(last - offset + 1, weights=values, minlength=size))
+    present = np.flatnonzero(active[:-1] > 0)
+    return pd.DataFrame({
+        "window_start": origin + (present + offset) * width,
+        "active": active[present],
+        "sum": sums[present],
+    })
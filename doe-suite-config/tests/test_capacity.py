@@ -0,0 +1,29 @@
+import math
+
+import numpy as np
+
+from does_etl_custom.etl.capacity import slo_capacity
+
+
+def test_slo_capacity_interpolates_the_crossing():
+    rps = np.array([100.0, 200.0, 300.0])
+    capacity, interpolated = slo_capacity(rps, {"p99": np.array([10.0, 30.0, 70.0])}, {"p99": 50.0})
+    assert capacity == 200.0
+    assert interpolated == 250.0
+
+
+def test_slo_capacity_nan_step_violates():
+    # a step without latencies in the steady window counts as violation at the step itself
+    capacity, interpolated = slo_capacity(np.array([100.0, 200.0]), {"p99": np.array([10.0, math.nan])}, {"p99": 50.0})
+    assert capacity == 100.0
+    assert interpolated == 200.0
+
+
+def test_slo_capacity_first_step_violates():
+    capacity, interpolated = slo_capacity(np.array([100.0, 200.0]), {"p99": np.array([60.0, 70.0])}, {"p99": 50.0})
+    assert math.isnan(capacity) and math.isnan(interpolated)
+
+
+def test_slo_capacity_without_violation():
+    capacity, interpolated = slo_capacity(np.array([100.0, 200.0]), {"p99": np.array([10.0, 20.0])}, {"p99": 50.0})
+    assert capacity == interpolated == 200.0
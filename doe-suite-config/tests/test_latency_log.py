@@ -0,0 +1,33 @@
+import numpy as np
+
+from does_etl_custom.etl.latency_log import LATENCY_COLUMNS, read_latency_log
+
+URL = "http://10.0.0.1:8080/{}/matmul"
+
+
+def write_log(path, lines):
+    path.write_text(",".join(LATENCY_COLUMNS) + "\n" + "\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_malformed_rows_are_dropped(tmp_path):
+    good = [f"{URL.format('hot' if row % 2 else 'cold')},{1000 + row},{10 * row},false,false,200" for row in range(10)]
+    lines = good[:2] + [
+        good[2] + ",1",  # a field too many
+        "garbage",  # a single field
+        "",
+        f"{URL.format('hot')},abc,5,false,false,200",  # not a number
+        f"{URL.format('hot')},1,5,maybe,false,200",  # not a bool
+    ] + good[2:]
+    log = read_latency_log(write_log(tmp_path / "latencies.csv", lines))
+    assert log.malformed == 4
+    np.testing.assert_array_equal(log.start_us, 1000 + np.arange(10))
+    np.testing.assert_array_equal(log.latency_us, 10 * np.arange(10))
+    assert list(log.instance[:2]) == ["cold", "hot"]
+
+
+def test_extra_field_in_first_row(tmp_path):
+    lines = [f"{URL.format('hot')},1,2,false,false,200,1", f"{URL.format('cold')},3,4,true,false,500"]
+    log = read_latency_log(write_log(tmp_path / "latencies.csv", lines))
+    assert log.malformed == 1
+    assert list(log.start_us) == [3] and list(log.timeout) == [True] and list(log.status) == [500]
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from does_etl_custom.etl.latency_sketch import LatencySketch
+
+ACCURACY = 0.01
+
+QUANTILES = [0.0, 0.01, 0.05, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 0.999, 1.0]
+
+
+def skewed_latencies(seed):
+    # long tailed latencies in ms: a lognormal body and a Pareto tail
+    rng = np.random.default_rng(seed)
+    body = rng.lognormal(mean=1.0, sigma=1.2, size=40_000)
+    tail = 5 * (1 + rng.pareto(1.5, size=2_000))
+    return rng.permutation(np.concatenate([body, tail]))
+
+
+def assert_close_to_numpy(sketch, values):
+    estimates = np.array(sketch.quantiles(QUANTILES))
+    # the two samples np.quantile interpolates between (method lower and higher of newer numpy)
+    ordered = np.sort(values)
+    ranks = np.array(QUANTILES) * (len(values) - 1)
+    lower, higher = ordered[np.floor(ranks).astype(int)], ordered[np.ceil(ranks).astype(int)]
+    # within the accuracy of the sample at the rank of the lower sample numpy interpolates from
+    np.testing.assert_allclose(estimates, lower, rtol=ACCURACY * (1 + 1e-9))
+    # so also within the accuracy of the interval the interpolated quantile lies in
+    interpolated = np.quantile(values, QUANTILES)
+    assert np.all(estimates >= np.minimum(lower, interpolated) * (1 - ACCURACY))
+    assert np.all(estimates <= np.maximum(higher, interpolated) * (1 + ACCURACY))
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_quantiles_match_numpy(seed):
+    values = skewed_latencies(seed)
+    sketch = LatencySketch(ACCURACY)
+    sketch.add(values)
+    assert sketch.count == len(values)
+    assert_close_to_numpy(sketch, values)
+
+
+def test_quantiles_match_numpy_after_merge():
+    first, second = skewed_latencies(3), 3 * skewed_latencies(4)[:10_000]
+    first_sketch, second_sketch = LatencySketch(ACCURACY), LatencySketch(ACCURACY)
+    # added in chunks, as the extractors do per block of the log
+    for chunk in np.array_split(first, 7):
+        first_sketch.add(chunk)
+    second_sketch.add(second)
+    merged = LatencySketch.merged([first_sketch, second_sketch])
+    assert merged.count == len(first) + len(second)
+    assert_close_to_numpy(merged, np.concatenate([first, second]))
+    first_sketch.merge(second_sketch)
+    assert first_sketch.quantiles(QUANTILES) == merged.quantiles(QUANTILES)
+
+
+def test_merge_rejects_other_accuracy():
+    with pytest.raises(ValueError):
+        LatencySketch(0.01).merge(LatencySketch(0.02))
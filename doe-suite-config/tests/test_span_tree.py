@@ -0,0 +1,129 @@
+import numpy as np
+
+from does_etl_custom.etl.span_tree import SpanTree
+
+
+def make_tree(requests):
+    """
+    SpanTree of hand built requests, each a list of (parent position in the request or None, start, end),
+    with the synthetic roots covering all spans of their request as build_span_tree adds them.
+    """
+    span_count = sum(len(spans) for spans in requests)
+    request, parent, start, end, depth = [], [], [], [], []
+    first = 0
+    for request_id, spans in enumerate(requests):
+        root = span_count + request_id
+        for position, (parent_position, span_start, span_end) in enumerate(spans):
+            request.append(request_id)
+            parent.append(root if parent_position is None else first + parent_position)
+            start.append(span_start)
+            end.append(span_end)
+            span_depth, ancestor = 1, parent_position
+            while ancestor is not None:
+                span_depth, ancestor = span_depth + 1, spans[ancestor][0]
+            depth.append(span_depth)
+        first += len(spans)
+    for request_id, spans in enumerate(requests):
+        request.append(request_id)
+        parent.append(-1)
+        start.append(min(span[1] for span in spans))
+        end.append(max(span[2] for span in spans))
+        depth.append(0)
+    return SpanTree(
+        np.array(request, dtype=np.int64),
+        np.array(parent, dtype=np.int64),
+        np.array(start, dtype=np.int64),
+        np.array(end, dtype=np.int64),
+        np.zeros(len(request), dtype=np.int64),
+        ["Untracked"],
+        np.array(depth, dtype=np.int64),
+    )
+
+
+def children_of(tree, span):
+    return [child for child in range(tree.root_offset) if tree.parent[child] == span]
+
+
+def loop_self_time(tree):
+    # duration minus the union of the children, each limited to the span
+    self_time = []
+    for span in range(len(tree)):
+        intervals = []
+        for child in children_of(tree, span):
+            start = min(max(tree.start[child], tree.start[span]), tree.end[span])
+            end = min(max(tree.end[child], start), tree.end[span])
+            intervals.append((start, end))
+        covered, covered_end = 0, None
+        for start, end in sorted(intervals):
+            if covered_end is not None and start < covered_end:
+                start = covered_end
+            if end > start:
+                covered += end - start
+                covered_end = end
+        self_time.append(tree.end[span] - tree.start[span] - covered)
+    return np.array(self_time)
+
+
+def loop_critical_time(tree):
+    # walks the critical path of every request from its root, spans limited to all their ancestors
+    def limited(span):
+        start, end = tree.start[span], tree.end[span]
+        if tree.parent[span] >= 0:
+            parent_start, parent_end = limited(tree.parent[span])
+            start = min(max(start, parent_start), parent_end)
+            end = min(max(end, start), parent_end)
+        return start, end
+
+    critical = np.zeros(len(tree), dtype=np.int64)
+
+    def walk(span):
+        start, end = limited(span)
+        critical[span] = end - start
+        children = sorted(children_of(tree, span), key=lambda child: (limited(child)[1], child))
+        limit = end
+        for child in reversed(children):
+            child_start, child_end = limited(child)
+            if child_end <= limit:
+                critical[span] -= child_end - child_start
+                walk(child)
+                limit = child_start
+
+    for root in range(tree.root_offset, len(tree)):
+        walk(root)
+    return critical
+
+
+REQUESTS = [
+    # nested children
+    [(None, 0, 100), (0, 10, 50), (1, 20, 30), (0, 60, 90)],
+    # overlapping children
+    [(None, 0, 100), (0, 10, 60), (0, 40, 80), (0, 70, 75)],
+    # children clipped by their parent, one starting before and one ending after it
+    [(None, 10, 50), (0, 0, 30), (0, 40, 120), (2, 100, 130)],
+    # a parent without children
+    [(None, 5, 25)],
+    # a parent ending before its children (the end logged under a child span), the root ends much later
+    [(None, 0, 12), (0, 2, 1004), (1, 3, 5)],
+    # parents ending well after their last child
+    [(None, 0, 1500), (0, 0, 10), (0, 5, 12), (1, 1, 4)],
+]
+
+
+def test_self_time_matches_loop():
+    tree = make_tree(REQUESTS)
+    np.testing.assert_array_equal(tree.self_time(), loop_self_time(tree))
+
+
+def test_critical_time_matches_loop():
+    tree = make_tree(REQUESTS)
+    np.testing.assert_array_equal(tree.critical_time(), loop_critical_time(tree))
+
+
+def test_critical_time_adds_up_to_latency():
+    tree = make_tree(REQUESTS)
+    per_request = np.bincount(tree.request, weights=tree.critical_time(), minlength=tree.request_count)
+    np.testing.assert_array_equal(per_request, tree.latency)
+    # each request alone, without the key ranges of the others
+    for spans in REQUESTS:
+        tree = make_tree([spans])
+        assert tree.critical_time().sum() == tree.latency[0]
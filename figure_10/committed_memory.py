@@ -1,10 +1,8 @@
 import matplotlib
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 
-from statistics import mean
-from tqdm import tqdm
-
 NUMBER_OF_BUCKETS = 100  # per second
 GRANULARITY = (1000 / NUMBER_OF_BUCKETS)
 
@@ -34,10 +32,6 @@ def common_preprocessing(df):
     df['end_time'] /= 1_000_000  # to ms
     df['end_time'] = df['end_time'].astype(int)
 
-    # drop first 10 minutes
-    # ts = df['start_time'].min() + (df['start_time'].max() - df['start_time'].min()) / 3
-    # df = df[df['start_time'] > ts]
-
     # split invocations into groups
     df['group_start'] = df['start_time'] / GRANULARITY
     df['group_start'] = df['group_start'].astype(int)
@@ -47,6 +41,49 @@ def common_preprocessing(df):
     return df
 
 
+def active_sums(group_start, group_end, memory):
+    # groups with at least one active invocation and the memory of the invocations active in them,
+    # an invocation is active in every group from its start group to its end group (both included)
+    group_start = np.asarray(group_start, dtype=np.int64)
+    group_end = np.asarray(group_end, dtype=np.int64)
+    valid = group_end >= group_start
+    group_start, group_end = group_start[valid], group_end[valid]
+    memory = np.asarray(memory, dtype=float)[valid]
+    if len(group_start) == 0:
+        return np.array([], dtype=np.int64), np.array([])
+    offset = group_start.min()
+    size = group_end.max() - offset + 2
+    # difference arrays: +memory from the start group on, -memory after the end group
+    active = np.cumsum(np.bincount(group_start - offset, minlength=size)
+                       - np.bincount(group_end - offset + 1, minlength=size))
+    sums = np.cumsum(np.bincount(group_start - offset, weights=memory, minlength=size)
+                     - np.bincount(group_end - offset + 1, weights=memory, minlength=size))
+    present = np.flatnonzero(active[:-1] > 0)
+    return present + offset, sums[present]
+
+
+def mser_truncation(values, batch_size=5, max_fraction=0.5):
+    # number of leading values to drop as warm-up (MSER on batch means), a multiple of batch_size
+    batch_count = len(values) // batch_size
+    if batch_count < 2:
+        return 0
+    batches = np.asarray(values, dtype=float)[:batch_count * batch_size].reshape(batch_count, batch_size).mean(axis=1)
+    suffix_sum = np.cumsum(batches[::-1])[::-1]
+    suffix_squares = np.cumsum((batches * batches)[::-1])[::-1]
+    remaining = np.arange(batch_count, 0, -1, dtype=float)
+    mser = np.maximum(suffix_squares - suffix_sum * suffix_sum / remaining, 0) / (remaining * remaining)
+    return int(np.argmin(mser[:max(int(batch_count * max_fraction), 1)])) * batch_size
+
+
+def steady_state_mean(ts, ram, batch_size=5):
+    # mean and start of the series after the MSER-5 warm-up
+    order = np.argsort(ts)
+    ts = np.asarray(ts, dtype=float)[order]
+    ram = np.asarray(ram, dtype=float)[order]
+    cutoff = mser_truncation(ram, batch_size=batch_size)
+    return ram[cutoff:].mean(), ts[cutoff]
+
+
 def install_memory_usage(df, small_hash, memory_trace_path):
     memory_trace = pd.read_csv(memory_trace_path)
 
@@ -62,20 +99,12 @@ def install_memory_usage(df, small_hash, memory_trace_path):
 
 
 def prepare_for_plotting(df, granularity):
-    groups = {}
-
-    for index, row in tqdm(df.iterrows(), total=df.shape[0]):
-        for g in range(row['group_start'], row['group_end'] + 1):
-            if g in groups:
-                groups[g] += row['memory']
-            else:
-                groups[g] = row['memory']
-
-    ts = list(groups.keys())
-    ram = list(groups.values())
+    # memory of all invocations active in each group, for the groups with at least one
+    groups, sums = active_sums(df['group_start'].to_numpy(), df['group_end'].to_numpy(), df['memory'].to_numpy())
 
-    ts = [x * granularity for x in ts]  # granularity
+    ts = list(groups * granularity)  # granularity
     ts = [x / 1_000 for x in ts]
+    ram = list(sums)
 
     return ts, ram
 
@@ -203,13 +232,15 @@ for fc in function_count:
 
             # Figure 1 - motivation
             plt.plot(fc_as_dnd_ts, fc_as_dnd_ram, label='VMs actively serving requests', color='tab:blue')
-            plt.axhline(y=mean(fc_as_dnd_ram), label=None, color='darkblue', linestyle='--') # 'No keep-alive - average'
-            print(f'Firecracker (no keep-alive) average: {mean(fc_as_dnd_ram)} MB')
+            fc_as_dnd_mean, fc_as_dnd_start = steady_state_mean(fc_as_dnd_ts, fc_as_dnd_ram)
+            plt.axhline(y=fc_as_dnd_mean, label=None, color='darkblue', linestyle='--') # 'No keep-alive - average'
+            print(f'Firecracker (no keep-alive) average: {fc_as_dnd_mean} MB (steady from {fc_as_dnd_start} s)')
 
             # Common for Figure 1 (Hot VMs with Knative autoscaling) and Figure 10 (Firecracker w/ Knative autoscaling)
             plt.plot(firecracker_ts, firecracker_ram, label='Firecracker w/ Knative autoscaling', color='purple')
-            plt.axhline(y=mean(firecracker_ram), label=None, color='darkmagenta', linestyle='--') # 'Knative autoscaling - average'
-            print(f'Firecracker (Knative autoscaling) average: {mean(firecracker_ram)} MB')
+            firecracker_mean, firecracker_start = steady_state_mean(firecracker_ts, firecracker_ram)
+            plt.axhline(y=firecracker_mean, label=None, color='darkmagenta', linestyle='--') # 'Knative autoscaling - average'
+            print(f'Firecracker (Knative autoscaling) average: {firecracker_mean} MB (steady from {firecracker_start} s)')
 
             # Figure 10
             #plt.plot(dandelion_ts, dandelion_ram, label='Hummingbird', color='tab:green')
@@ -255,14 +286,16 @@ for fc in function_count:
 
             # Common for Figure 1 (Hot VMs with Knative autoscaling) and Figure 14 (Firecracker w/ Knative autoscaling)
             plt.plot(firecracker_ts, firecracker_ram, label='Firecracker w/ Knative autoscaling', color='purple')
-            plt.axhline(y=mean(firecracker_ram), label=None, color='darkmagenta',
+            firecracker_mean, firecracker_start = steady_state_mean(firecracker_ts, firecracker_ram)
+            plt.axhline(y=firecracker_mean, label=None, color='darkmagenta',
                         linestyle='--')  # 'Knative autoscaling - average'
-            print(f'Firecracker (Knative autoscaling) average: {mean(firecracker_ram)} MB')
+            print(f'Firecracker (Knative autoscaling) average: {firecracker_mean} MB (steady from {firecracker_start} s)')
 
             # Figure 10
             plt.plot(dandelion_ts, dandelion_ram, label='Hummingbird', color='tab:green')
-            plt.axhline(y=mean(dandelion_ram), label=None, color='darkgreen', linestyle='--')
-            print(f'Dandelion average: {mean(dandelion_ram)} MB')
+            dandelion_mean, dandelion_start = steady_state_mean(dandelion_ts, dandelion_ram)
+            plt.axhline(y=dandelion_mean, label=None, color='darkgreen', linestyle='--')
+            print(f'Dandelion average: {dandelion_mean} MB (steady from {dandelion_start} s)')
 
             plt.xlabel('Time [s]')
             plt.ylabel('Committed Memory [MB]')
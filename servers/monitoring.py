@@ -2,62 +2,779 @@ import os
 from os.path import expanduser
 from threading import Thread
 
-import psutil
 import time
 
 # CPU and MEM collection logic
 SLEEP_TIME = 0.1  # 100ms
 DUMP_TIME = 10    # 10s
-DUMP_FREQ = int(DUMP_TIME / SLEEP_TIME)
 
+# /proc/stat cpu fields that count as time, guest and guest_nice are already part of user and nice
+CPU_TIME_FIELDS = 8
+CPU_IDLE_FIELDS = (3, 4)  # idle, iowait
+SECTOR_BYTES = 512
+# /proc/stat fields reported per core role, user includes nice
+ROLE_FIELDS = {"user": (0, 1), "system": (2,), "softirq": (6,), "iowait": (4,)}
+# roles of the worker's pinned cores, counts from the environment of the worker command
+ROLE_ENV = [("dispatcher", "DISPATCHER_CORES"), ("frontend", "FRONTEND_CORES"), ("io", "IO_CORES")]
+OTHER_ROLE = "other"
+OVERRUN_POLICIES = ["skip", "coalesce"]
+# lateness histogram buckets: [0, 1us), [1us, 2us), [2us, 4us), ... the last one is open
+JITTER_BUCKETS = 32
+# processes that match none of the process groups
+REST_GROUP = "rest"
+GROUP_METRICS = ["processes", "cpu", "reaped_cpu", "rss_mb", "pss_mb", "minflt", "majflt", "ctx_switches"]
 
-def cpu_mem_measure(output_path):
-    # Accumulate the measurements: [[time, cpu, mem], ...]
-    measurements = []
 
-    # Create the file
-    with open(output_path, "w+") as f:
-        f.write(
-            "timestamp,cpu,cpu_first,cpu_last,mem,net_bytes_sent,net_bytes_recv,disk_read_bytes,disk_write_bytes,disk_busy_time\n"
+class ProcSampler:
+    """
+    Reads the counters straight from /proc: the files stay open and are re-read with pread,
+    and the values are parsed into lists allocated once, so a sample costs a few syscalls and
+    no allocations proportional to the history. Reports the same values as the psutil sampler.
+    """
+
+    def __init__(self):
+        self.fds = {
+            name: os.open(f"/proc/{name}", os.O_RDONLY)
+            for name in ["stat", "meminfo", "net/dev", "diskstats"]
+        }
+        self.buffer_sizes = {name: 1 << 16 for name in self.fds}
+        # physical disks only, partitions are counted in their disk (as psutil does)
+        self.disks = {
+            name.encode() for name in os.listdir("/sys/block")
+            if not name.startswith(("loop", "ram"))
+        } if os.path.isdir("/sys/block") else None
+        self.cores = sum(
+            1 for line in self.read("stat").split(b"\n")
+            if line.startswith(b"cpu") and line[3:4].isdigit()
         )
+        # cumulative jiffies per core of the previous and the current sample
+        self.cpu_times = [[0] * CPU_TIME_FIELDS for _ in range(self.cores)]
+        self.previous_cpu_times = [[0] * CPU_TIME_FIELDS for _ in range(self.cores)]
+        self.cpu_percent = [0.0] * self.cores
+        self.read_cpu_times()
 
-    # Define function which dumps metrics
-    def dump():
-        with open(output_path, "a") as f:
-            for el in measurements:
-                f.write(",".join(map(str, el)) + "\n")
-        measurements.clear()
+    def read(self, name: str) -> bytes:
+        while True:
+            data = os.pread(self.fds[name], self.buffer_sizes[name], 0)
+            if len(data) < self.buffer_sizes[name]:
+                return data
+            self.buffer_sizes[name] *= 2
 
-    # ref_time = time.time()
-    next_time = time.time()
-    while True:
-        # timestamp = time.time() - ref_time
-        cpu = psutil.cpu_percent(percpu=True)
-        mem = psutil.virtual_memory().percent
-        net_io = psutil.net_io_counters()
-        disk_io = psutil.disk_io_counters()
+    def read_cpu_times(self):
+        self.cpu_times, self.previous_cpu_times = self.previous_cpu_times, self.cpu_times
+        core = 0
+        for line in self.read("stat").split(b"\n"):
+            if not line.startswith(b"cpu"):
+                if core > 0:
+                    break
+                continue
+            if not line[3:4].isdigit():
+                continue
+            times = self.cpu_times[core]
+            fields = line.split()
+            for i in range(CPU_TIME_FIELDS):
+                times[i] = int(fields[i + 1])
+            core += 1
+
+    def sample_cpu(self):
+        # busy percent of every core since the previous sample
+        self.read_cpu_times()
+        for core in range(self.cores):
+            times, previous = self.cpu_times[core], self.previous_cpu_times[core]
+            total = sum(times) - sum(previous)
+            idle = sum(times[i] - previous[i] for i in CPU_IDLE_FIELDS)
+            self.cpu_percent[core] = round(100 * (total - idle) / total, 1) if total > 0 else 0.0
+        return self.cpu_percent
+
+    def sample_mem(self) -> float:
+        total = available = None
+        for line in self.read("meminfo").split(b"\n"):
+            if line.startswith(b"MemTotal:"):
+                total = int(line.split()[1])
+            elif line.startswith(b"MemAvailable:"):
+                available = int(line.split()[1])
+                break
+        return round(100 * (total - available) / total, 1)
+
+    def sample_net(self):
+        sent = recv = 0
+        # two header lines, then "<interface>: <8 receive fields> <8 transmit fields>"
+        for line in self.read("net/dev").split(b"\n")[2:]:
+            if not line:
+                continue
+            fields = line.split(b":", 1)[1].split()
+            recv += int(fields[0])
+            sent += int(fields[8])
+        return sent, recv
+
+    def sample_disk(self):
+        read_bytes = write_bytes = busy_time = 0
+        for line in self.read("diskstats").split(b"\n"):
+            fields = line.split()
+            if len(fields) < 13 or (self.disks is not None and fields[2] not in self.disks):
+                continue
+            read_bytes += int(fields[5]) * SECTOR_BYTES
+            write_bytes += int(fields[9]) * SECTOR_BYTES
+            busy_time += int(fields[12])
+        return read_bytes, write_bytes, busy_time
+
+    def sample(self) -> tuple:
+        cpu = self.sample_cpu()
+        net_sent, net_recv = self.sample_net()
+        return [sum(cpu) / len(cpu), cpu[0], cpu[-1], self.sample_mem(), net_sent, net_recv, *self.sample_disk()], cpu
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+
+
+class PsutilSampler:
+    # the original sampler, for systems without /proc
+
+    def __init__(self):
+        import psutil
+        self.psutil = psutil
+        self.cores = len(psutil.cpu_percent(percpu=True))
+
+    def sample(self) -> tuple:
+        cpu = self.psutil.cpu_percent(percpu=True)
+        mem = self.psutil.virtual_memory().percent
+        net_io = self.psutil.net_io_counters()
+        disk_io = self.psutil.disk_io_counters()
         assert disk_io is not None
+        return [
+            sum(cpu) / len(cpu),
+            cpu[0],
+            cpu[-1],
+            mem,
+            net_io.bytes_sent,
+            net_io.bytes_recv,
+            disk_io.read_bytes,
+            disk_io.write_bytes,
+            disk_io.busy_time,  # !! Platform specific field - time spent doing disk I/O in milliseconds
+        ], cpu
 
-        measurements.append(
-            [
-                time.time_ns(),
-                sum(cpu) / len(cpu),
-                cpu[0],
-                cpu[-1],
-                mem,
-                net_io.bytes_sent,
-                net_io.bytes_recv,
-                disk_io.read_bytes,
-                disk_io.write_bytes,
-                disk_io.busy_time,  # !! Platform specific field - time spent doing disk I/O in milliseconds
-            ]
-        )
+    def close(self):
+        pass
+
+
+def parse_core_list(cores: str) -> list:
+    # "0-2,5" -> [0, 1, 2, 5], as in taskset and /sys/devices/system/cpu
+    result = []
+    for part in cores.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            result.extend(range(int(first), int(last) + 1))
+        elif part:
+            result.append(int(part))
+    return result
+
+
+def parse_roles(spec: str) -> dict:
+    # "dispatcher=0 frontend=1-2 io=3-4" (entries separated by spaces, newlines or ;) -> {role: [cores]}
+    roles = {}
+    for entry in spec.replace(";", " ").split():
+        role, cores = entry.split("=", 1)
+        roles[role] = parse_core_list(cores)
+    return roles
+
+
+def roles_from_env(environ, cores: int) -> dict:
+    """
+    The worker takes its dispatcher, frontend and I/O cores in this order from core 0 on and runs the
+    compute engines on the remaining ones, so the core counts of its command give the role of every core.
+    Empty if none of the counts is set.
+    """
+    if not any(variable in environ for _, variable in ROLE_ENV):
+        return {}
+    roles = {}
+    first = 0
+    for role, variable in ROLE_ENV:
+        count = int(environ.get(variable, 0))
+        roles[role] = list(range(first, min(first + count, cores)))
+        first += count
+    roles["compute"] = list(range(min(first, cores), cores))
+    return roles
+
+
+class CoreRoles:
+    """
+    Splits the CPU time of the cores by their role: per role the percent of its cores' time spent in
+    user, system, softirq and iowait, the busy percent (everything but idle and iowait) and the number of cores.
+    The roles come from a spec (see parse_roles), a file with a spec the worker rewrites when it moves
+    cores (re-read when it changes), or the core counts in the environment. Cores without a role, and
+    cores given a role that was not known at the start, are counted as other.
+    """
+
+    def __init__(self, cores: int, spec: str = None, path: str = None, environ=os.environ):
+        self.cores = cores
+        self.path = path
+        self.mtime = None
+        if path is not None:
+            with open(path) as f:
+                roles = parse_roles(f.read())
+            self.mtime = os.stat(path).st_mtime_ns
+        elif spec is not None:
+            roles = parse_roles(spec)
+        else:
+            roles = roles_from_env(environ, cores)
+        self.names = [role for role in roles if role != OTHER_ROLE] + [OTHER_ROLE]
+        self.core_role = [0] * cores
+        self.assign(roles)
+        # per role: one sum per ROLE_FIELDS entry, the busy and the total time
+        self.sums = [[0] * (len(ROLE_FIELDS) + 2) for _ in self.names]
+        self.values = [0.0] * (len(self.names) * (len(ROLE_FIELDS) + 2))
+
+    def __bool__(self):
+        return len(self.names) > 1
+
+    def assign(self, roles: dict):
+        other = self.names.index(OTHER_ROLE)
+        for core in range(self.cores):
+            self.core_role[core] = other
+        for role, cores in roles.items():
+            index = self.names.index(role) if role in self.names else other
+            for core in cores:
+                if core < self.cores:
+                    self.core_role[core] = index
+
+    def refresh(self):
+        if self.path is None:
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self.mtime:
+                return
+            with open(self.path) as f:
+                roles = parse_roles(f.read())
+        except (OSError, ValueError):
+            # the worker may be rewriting the file, keep the previous roles
+            return
+        self.mtime = mtime
+        self.assign(roles)
+
+    def columns(self) -> list:
+        return [
+            (f"{role}_{field}", "<f4", ())
+            for role in self.names
+            for field in list(ROLE_FIELDS.keys()) + ["busy", "cores"]
+        ]
+
+    def sample(self, cpu_times, previous_cpu_times) -> list:
+        # the values of columns() from the cumulative jiffies per core of two samples
+        self.refresh()
+        for sums in self.sums:
+            for i in range(len(sums)):
+                sums[i] = 0
+        cores = [0] * len(self.names)
+        for core in range(self.cores):
+            times, previous = cpu_times[core], previous_cpu_times[core]
+            sums = self.sums[self.core_role[core]]
+            cores[self.core_role[core]] += 1
+            for i, fields in enumerate(ROLE_FIELDS.values()):
+                sums[i] += sum(times[field] - previous[field] for field in fields)
+            total = sum(times) - sum(previous)
+            sums[-2] += total - sum(times[field] - previous[field] for field in CPU_IDLE_FIELDS)
+            sums[-1] += total
+        position = 0
+        for role, sums in enumerate(self.sums):
+            total = sums[-1]
+            for value in sums[:-1]:
+                self.values[position] = round(100 * value / total, 1) if total > 0 else 0.0
+                position += 1
+            self.values[position] = cores[role]
+            position += 1
+        return self.values
+
+
+class ProcessGroups:
+    """
+    CPU, memory, page faults and context switches of the processes of the worker, summed per group,
+    either of the process tree below root_pid (grouped by the first of groups their name starts with)
+    or of a cgroup v2 subtree (grouped by the child cgroup of the root they are in, "self" for the
+    processes of the root itself). Processes in neither a group are counted in rest.
+    Per group and sample: the number of processes, cpu and reaped_cpu (CPU of the processes and of their
+    children that exited and were waited for, in percent of one core since the previous sample),
+    rss_mb, pss_mb (refreshed every pss_interval seconds, reading it makes the kernel walk the page tables),
+    the minor and major page faults and the context switches since the previous sample.
+    With a cgroup the cpu comes from its cpu.stat, so it includes processes that lived shorter than a sample,
+    and memory_pressure is the percent of the time some process of the group stalled on memory (PSI);
+    without one there is a single system wide memory_pressure column.
+    The /proc files of the known processes stay open, and new ones are found through the children of the
+    known ones (or the cgroup.procs files), so a sample costs a few reads per process; at most max_pids
+    processes are followed, the others are counted in dropped_processes.
+    """
+
+    def __init__(self, root_pid: int = None, cgroup: str = None, groups: list = [], max_pids: int = 4096,
+                 pss_interval: float = 1.0):
+        self.root_pid = root_pid
+        self.cgroup = cgroup
+        if cgroup is not None:
+            self.names = ["self"] + sorted(
+                name for name in os.listdir(cgroup) if os.path.exists(os.path.join(cgroup, name, "cgroup.procs"))
+            ) + [REST_GROUP]
+        else:
+            self.names = list(groups) + [REST_GROUP]
+        self.max_pids = max_pids
+        self.pss_interval = pss_interval
+        self.clock_ticks = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        # pid -> [group, stat fd, status fd, children fd, cpu ticks, reaped ticks, minflt, majflt, ctx switches, pss kB, name]
+        self.processes = {}
+        self.dropped = 0
+        self.last_pss = 0.0
+        self.last_time = time.monotonic()
+        self.sums = [[0.0] * len(GROUP_METRICS) for _ in self.names]
+        pressure_files = [os.path.join(cgroup, name, "memory.pressure") if name != "self" else None
+                          for name in self.names[:-1]] if cgroup is not None else ["/proc/pressure/memory"]
+        self.pressure_fds = [os.open(path, os.O_RDONLY) if path and os.path.exists(path) else None for path in pressure_files]
+        self.pressure_totals = [self.read_pressure(fd) for fd in self.pressure_fds]
+        self.cpu_fds = [os.open(os.path.join(cgroup, name, "cpu.stat"), os.O_RDONLY) if name != "self" else None
+                        for name in self.names[:-1]] if cgroup is not None else []
+        self.cpu_usages = [self.read_cgroup_cpu(fd) for fd in self.cpu_fds]
+        self.values = [0.0] * len(self.columns())
+        self.discover()
+        # the first sample only covers what happened since the start
+        for entry in self.processes.values():
+            self.read_process(entry)
+
+    def columns(self) -> list:
+        columns = [(f"group_{name}_{metric}", "<f4", ()) for name in self.names for metric in GROUP_METRICS]
+        if self.cgroup is not None:
+            columns += [(f"group_{name}_memory_pressure", "<f4", ()) for name in self.names[:-1]]
+        else:
+            columns += [("memory_pressure", "<f4", ())]
+        return columns + [("dropped_processes", "<u8", ())]
+
+    def group_of(self, comm: str) -> int:
+        for index, name in enumerate(self.names[:-1]):
+            if comm.startswith(name):
+                return index
+        return len(self.names) - 1
+
+    def track(self, pid: int, cgroup_group: int = None):
+        if pid in self.processes:
+            return
+        if len(self.processes) >= self.max_pids:
+            self.dropped += 1
+            return
+        try:
+            stat_fd = os.open(f"/proc/{pid}/stat", os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            status_fd = os.open(f"/proc/{pid}/status", os.O_RDONLY)
+            children_fd = os.open(f"/proc/{pid}/task/{pid}/children", os.O_RDONLY) if self.cgroup is None else None
+        except OSError:
+            os.close(stat_fd)
+            return
+        # new processes count with everything they used so far, the group is set at the first read
+        self.processes[pid] = [cgroup_group, stat_fd, status_fd, children_fd, 0, 0, 0, 0, 0, 0.0, None]
+
+    def untrack(self, pid: int):
+        for fd in self.processes.pop(pid)[1:4]:
+            if fd is not None:
+                os.close(fd)
+
+    def discover(self):
+        if self.cgroup is not None:
+            for index, name in enumerate(self.names[:-1]):
+                if name == "self":
+                    self.track_cgroup_procs(self.cgroup, index)
+                    continue
+                for directory, _, _ in os.walk(os.path.join(self.cgroup, name)):
+                    self.track_cgroup_procs(directory, index)
+            # processes in cgroups created after the start
+            for name in os.listdir(self.cgroup):
+                if name not in self.names and os.path.isdir(os.path.join(self.cgroup, name)):
+                    for directory, _, _ in os.walk(os.path.join(self.cgroup, name)):
+                        self.track_cgroup_procs(directory, len(self.names) - 1)
+            return
+        self.track(self.root_pid)
+        pending = list(self.processes)
+        while pending:
+            entry = self.processes.get(pending.pop())
+            if entry is None:
+                continue
+            try:
+                children = os.pread(entry[3], 1 << 16, 0).split()
+            except OSError:
+                continue
+            for child in children:
+                child = int(child)
+                if child not in self.processes:
+                    self.track(child)
+                    if child in self.processes:
+                        pending.append(child)
+
+    def track_cgroup_procs(self, directory: str, group: int):
+        try:
+            with open(os.path.join(directory, "cgroup.procs")) as f:
+                pids = f.read().split()
+        except OSError:
+            return
+        for pid in pids:
+            self.track(int(pid), group)
+
+    def read_process(self, entry) -> tuple:
+        # counters of the process since the previous read, None if it exited
+        try:
+            stat = os.pread(entry[1], 4096, 0)
+            status = os.pread(entry[2], 1 << 14, 0)
+        except OSError:
+            return None
+        if not stat:
+            return None
+        name_end = stat.rindex(b")")
+        if self.cgroup is None and stat[:name_end] != entry[10]:
+            # the name changes when a forked process execs
+            entry[10] = stat[:name_end]
+            entry[0] = self.group_of(stat[stat.index(b"(") + 1:name_end].decode(errors="replace"))
+        fields = stat[name_end + 2:].split()
+        cpu = int(fields[11]) + int(fields[12])
+        reaped = int(fields[13]) + int(fields[14])
+        minflt, majflt = int(fields[7]), int(fields[9])
+        rss = int(fields[21])
+        ctx = 0
+        for line in status.split(b"\n"):
+            if line.startswith((b"voluntary_ctxt_switches", b"nonvoluntary_ctxt_switches")):
+                ctx += int(line.split()[1])
+        deltas = (cpu - entry[4], reaped - entry[5], minflt - entry[6], majflt - entry[7], ctx - entry[8], rss)
+        entry[4:9] = [cpu, reaped, minflt, majflt, ctx]
+        return deltas
+
+    def read_pss(self, pid: int) -> float:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup", "rb") as f:
+                for line in f:
+                    if line.startswith(b"Pss:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return 0.0
+
+    def read_pressure(self, fd) -> int:
+        # total microseconds some process stalled on memory
+        if fd is None:
+            return 0
+        some = os.pread(fd, 256, 0).split(b"\n")[0]
+        return int(some.rsplit(b"total=", 1)[1])
+
+    def read_cgroup_cpu(self, fd) -> int:
+        if fd is None:
+            return 0
+        return int(os.pread(fd, 4096, 0).split(b"\n")[0].split()[1])
+
+    def sample(self) -> list:
+        now = time.monotonic()
+        elapsed = max(now - self.last_time, 1e-9)
+        self.last_time = now
+        refresh_pss = now - self.last_pss >= self.pss_interval
+        if refresh_pss:
+            self.last_pss = now
+        self.discover()
+        for sums in self.sums:
+            for i in range(len(sums)):
+                sums[i] = 0.0
+        for pid in list(self.processes):
+            entry = self.processes[pid]
+            deltas = self.read_process(entry)
+            if deltas is None:
+                self.untrack(pid)
+                continue
+            cpu, reaped, minflt, majflt, ctx, rss = deltas
+            if refresh_pss:
+                entry[9] = self.read_pss(pid)
+            sums = self.sums[entry[0]]
+            sums[0] += 1
+            sums[1] += 100 * cpu / self.clock_ticks / elapsed
+            sums[2] += 100 * reaped / self.clock_ticks / elapsed
+            sums[3] += rss * self.page_size / (1 << 20)
+            sums[4] += entry[9]
+            sums[5] += minflt
+            sums[6] += majflt
+            sums[7] += ctx
+        # the cgroup knows the CPU of all its processes, also of those that were never sampled
+        for index, fd in enumerate(self.cpu_fds):
+            if fd is None:
+                continue
+            usage = self.read_cgroup_cpu(fd)
+            self.sums[index][1] = 100 * (usage - self.cpu_usages[index]) / 1e6 / elapsed
+            self.cpu_usages[index] = usage
+
+        position = 0
+        for sums in self.sums:
+            for value in sums:
+                self.values[position] = round(value, 2)
+                position += 1
+        for index, fd in enumerate(self.pressure_fds):
+            total = self.read_pressure(fd)
+            self.values[position] = round(100 * (total - self.pressure_totals[index]) / 1e6 / elapsed, 2)
+            self.pressure_totals[index] = total
+            position += 1
+        self.values[position] = self.dropped
+        return self.values
+
+
+SAMPLERS = {"proc": ProcSampler, "psutil": PsutilSampler}
+
+
+def sample_columns(cores: int) -> list:
+    """
+    (name, numpy type, shape) of every value of a sample, in the order of the rows:
+    the system wide values, the busy percent of every core, the CPU the sampler itself
+    used since the previous sample, in percent of one core, and how well it kept its schedule
+    (see TickScheduler): the ticks missed before the sample and how late the sample was taken.
+    In the csv, a column with a shape is written as one column per element, <name>_<index>.
+    """
+    return [
+        ("timestamp", "<i8", ()),
+        ("cpu", "<f4", ()),
+        ("cpu_first", "<f4", ()),
+        ("cpu_last", "<f4", ()),
+        ("mem", "<f4", ()),
+        ("net_bytes_sent", "<u8", ()),
+        ("net_bytes_recv", "<u8", ()),
+        ("disk_read_bytes", "<u8", ()),
+        ("disk_write_bytes", "<u8", ()),
+        ("disk_busy_time", "<u8", ()),
+        ("core_cpu", "<f4", (cores,)),
+        ("sampler_cpu", "<f4", ()),
+        ("missed_ticks", "<u8", ()),
+        ("lateness_us", "<f4", ()),
+    ]
+
+
+def csv_names(columns: list) -> list:
+    names = []
+    for name, _, shape in columns:
+        names.extend([f"{name}_{i}" for i in range(shape[0])] if shape else [name])
+    return names
+
+
+class CsvWriter:
+    # text rows, appended to the file at every flush
+
+    def __init__(self, output_path, columns, metadata):
+        self.output_path = output_path
+        self.measurements = []
+        with open(output_path, "w+") as f:
+            f.write(",".join(csv_names(columns)) + "\n")
+
+    def append(self, row):
+        self.measurements.append(row)
+
+    def flush(self):
+        with open(self.output_path, "a") as f:
+            for el in self.measurements:
+                f.write(",".join(map(str, el)) + "\n")
+        self.measurements.clear()
+
+
+STRUCT_CODES = {"<i8": "q", "<u8": "Q", "<f4": "f", "<f8": "d"}
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+SEQUENCE_COLUMN = ("seq", "<u8", ())
 
-        if len(measurements) >= DUMP_FREQ:
-            dump()
 
-        next_time += SLEEP_TIME
-        time.sleep(next_time - time.time())
+class NpyRingWriter:
+    """
+    Fixed width binary records in a preallocated, memory mapped .npy file that np.load(mmap_mode="r") reads
+    as a structured array of capacity rows. When it is full, the oldest rows are overwritten. Every row
+    starts with its sequence number (from 1, 0 marks unwritten rows), so the order is known without
+    any shared counter and a crash only loses the rows the kernel did not write back yet: rows are in
+    the page cache as soon as they are written, flush() forces them to disk.
+    The columns, core count and sample period are in <output>.json, as the .npy header has no room for them.
+    """
+
+    def __init__(self, output_path, columns, metadata, capacity):
+        import json
+        import mmap
+        import struct
+
+        columns = [SEQUENCE_COLUMN] + columns
+        descr = [(name, kind, shape) if shape else (name, kind) for name, kind, shape in columns]
+        header = repr({"descr": descr, "fortran_order": False, "shape": (capacity,)}).encode("latin1")
+        # magic, version, header length and the header padded with spaces to a multiple of 64 bytes
+        header += b" " * (63 - (len(NPY_MAGIC) + 2 + len(header)) % 64) + b"\n"
+        self.record = struct.Struct("<" + "".join(
+            f"{shape[0] if shape else 1}{STRUCT_CODES[kind]}" for _, kind, shape in columns
+        ))
+        self.offset = len(NPY_MAGIC) + 2 + len(header)
+        self.capacity = capacity
+        self.sequence = 0
+
+        with open(output_path, "w+b") as f:
+            f.write(NPY_MAGIC + struct.pack("<H", len(header)) + header)
+            f.truncate(self.offset + capacity * self.record.size)
+        self.file = open(output_path, "r+b")
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        with open(output_path + ".json", "w") as f:
+            json.dump({**metadata, "capacity": capacity, "columns": columns}, f)
+
+    def append(self, row):
+        self.sequence += 1
+        position = (self.sequence - 1) % self.capacity
+        self.record.pack_into(self.map, self.offset + position * self.record.size, self.sequence, *row)
+
+    def flush(self):
+        self.map.flush()
+
+
+WRITERS = {"csv": CsvWriter, "npy": NpyRingWriter}
+
+
+def read_samples(path):
+    """
+    The rows of a NpyRingWriter file in time order as a numpy structured array,
+    a view of the memory mapped file unless the ring has wrapped around.
+    """
+    import numpy as np
+
+    samples = np.load(path, mmap_mode="r")
+    written = samples[samples["seq"] > 0] if samples["seq"][-1] == 0 else samples
+    if len(written) == 0 or written["seq"][0] == 1:
+        return samples[:len(written)]
+    oldest = int(np.argmin(written["seq"]))
+    return np.concatenate([written[oldest:], written[:oldest]])
+
+
+def read_samples_frame(path):
+    # the rows of a NpyRingWriter file with the columns of the csv output
+    import pandas as pd
+
+    samples = read_samples(path)
+    frame = {}
+    for name in samples.dtype.names:
+        if name == SEQUENCE_COLUMN[0]:
+            continue
+        values = samples[name]
+        if values.ndim == 1:
+            frame[name] = values
+        else:
+            for i in range(values.shape[1]):
+                frame[f"{name}_{i}"] = values[:, i]
+    return pd.DataFrame(frame)
+
+
+class TickScheduler:
+    """
+    Ticks every period on the monotonic clock from the start, tick k is due at start + k * period,
+    so the schedule does not drift with the time spent sampling.
+    When a sample took so long that the next tick is already overdue, the overrun policy decides:
+    "skip" waits for the next tick that is still ahead and drops all overdue ones,
+    "coalesce" samples right away for the overdue ticks and then continues with the next one ahead.
+    wait() returns the number of ticks missed before the sample and how late it is, in us;
+    the lateness of all samples is counted in a histogram with power of two buckets.
+    """
+
+    def __init__(self, period: float, policy: str = "skip"):
+        if policy not in OVERRUN_POLICIES:
+            raise ValueError(f"unknown overrun policy {policy}, expected one of {OVERRUN_POLICIES}")
+        self.period_ns = int(period * 1e9)
+        self.policy = policy
+        self.start = time.monotonic_ns()
+        self.tick = 0
+        self.samples = 0
+        self.missed = 0
+        self.histogram = [0] * JITTER_BUCKETS
+
+    def due(self, tick: int) -> int:
+        return self.start + tick * self.period_ns
+
+    def wait(self) -> tuple:
+        now = time.monotonic_ns()
+        missed = 0
+        if now > self.due(self.tick) and self.samples > 0:
+            # ticks whose time is over, the current one included if the next one has passed too
+            overdue = (now - self.due(self.tick)) // self.period_ns + 1
+            if self.policy == "skip":
+                missed = overdue
+                self.tick += overdue
+            elif overdue > 1:
+                # one sample stands for all overdue ticks
+                missed = overdue - 1
+                self.tick += overdue - 1
+        due = self.due(self.tick)
+        if due > now:
+            time.sleep((due - now) / 1e9)
+        lateness_us = max(time.monotonic_ns() - due, 0) / 1000
+        self.histogram[min(int(lateness_us).bit_length(), JITTER_BUCKETS - 1)] += 1
+        self.tick += 1
+        self.samples += 1
+        self.missed += missed
+        return missed, round(lateness_us, 1)
+
+    def report(self) -> dict:
+        return {
+            "period_s": self.period_ns / 1e9,
+            "policy": self.policy,
+            "samples": self.samples,
+            "missed_ticks": self.missed,
+            # bucket i counts samples less than bucket_upper_us[i] late (and at least the previous bound)
+            "bucket_upper_us": [1 << i for i in range(JITTER_BUCKETS - 1)] + [None],
+            "counts": self.histogram,
+        }
+
+
+def pin_sampler(core: int = None, nice: int = None):
+    # run the sampler on a housekeeping core, away from the worker's pinned cores, and at a higher priority
+    if core is not None:
+        os.sched_setaffinity(0, {core})
+    if nice is not None:
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, nice)
+        except PermissionError:
+            print(f"could not set the sampler's nice value to {nice}, running at {os.getpriority(os.PRIO_PROCESS, 0)}")
+
+
+def write_jitter_report(path: str, report: dict):
+    import json
+
+    with open(path + ".tmp", "w") as f:
+        json.dump(report, f)
+    os.replace(path + ".tmp", path)
+
+
+def cpu_mem_measure(output_path, backend="proc", sleep_time=SLEEP_TIME, output_format="csv", capacity_time=24 * 3600,
+                    roles=None, role_file=None, process_groups=None, overrun_policy="skip", core=None, nice=None):
+    pin_sampler(core, nice)
+    sampler = SAMPLERS[backend]()
+    dump_freq = max(int(DUMP_TIME / sleep_time), 1)
+    core_roles = CoreRoles(sampler.cores, roles, role_file)
+    if core_roles and backend != "proc":
+        raise ValueError("the CPU time per core role needs the proc backend")
+    columns = sample_columns(sampler.cores) + (core_roles.columns() if core_roles else []) + \
+        (process_groups.columns() if process_groups else [])
+    metadata = {"cores": sampler.cores, "sample_period_s": sleep_time, "backend": backend, "roles": core_roles.names,
+                "process_groups": process_groups.names if process_groups else []}
+    if output_format == "npy":
+        writer = NpyRingWriter(output_path, columns, metadata, max(int(capacity_time / sleep_time), 1))
+    else:
+        writer = CsvWriter(output_path, columns, metadata)
+
+    # the lateness histogram is next to the output, rewritten at every flush
+    jitter_path = output_path + ".jitter.json"
+    scheduler = TickScheduler(sleep_time, overrun_policy)
+    previous_wall, previous_cpu = time.monotonic(), time.thread_time()
+    while True:
+        missed_ticks, lateness_us = scheduler.wait()
+        timestamp = time.time_ns()
+        values, cpu = sampler.sample()
+        wall, own_cpu = time.monotonic(), time.thread_time()
+        sampler_cpu = round(100 * (own_cpu - previous_cpu) / (wall - previous_wall), 2) if wall > previous_wall else 0.0
+        previous_wall, previous_cpu = wall, own_cpu
+
+        row = [timestamp, *values, *cpu, sampler_cpu, missed_ticks, lateness_us]
+        if core_roles:
+            row.extend(core_roles.sample(sampler.cpu_times, sampler.previous_cpu_times))
+        if process_groups:
+            row.extend(process_groups.sample())
+        writer.append(row)
+
+        # every dump_freq ticks, also when the tick that completes them was skipped
+        if scheduler.tick // dump_freq != (scheduler.tick - missed_ticks - 1) // dump_freq:
+            writer.flush()
+            write_jitter_report(jitter_path, scheduler.report())
 
 
 if __name__ == "__main__":
@@ -71,6 +788,75 @@ if __name__ == "__main__":
         metavar="OUTPUT",
         required=True,
     )
+    parser.add_argument(
+        "--backend",
+        help="Read the counters from /proc directly (proc) or through psutil",
+        choices=list(SAMPLERS.keys()),
+        default="proc" if os.path.exists("/proc/stat") else "psutil",
+    )
+    parser.add_argument(
+        "--interval",
+        help="Time between samples in seconds",
+        type=float,
+        default=SLEEP_TIME,
+    )
+    parser.add_argument(
+        "--format",
+        help="Write text rows (csv) or binary rows to a memory mapped ring buffer (npy), see NpyRingWriter",
+        choices=list(WRITERS.keys()),
+        default="csv",
+    )
+    parser.add_argument(
+        "--capacity",
+        help="Seconds of samples the npy ring buffer holds before overwriting the oldest",
+        type=float,
+        default=24 * 3600,
+    )
+    parser.add_argument(
+        "--roles",
+        help="Role of every core, e.g. 'dispatcher=0 frontend=1-2 io=3-4', for the CPU time per role "
+             "(by default from DISPATCHER_CORES, FRONTEND_CORES and IO_CORES if set)",
+    )
+    parser.add_argument(
+        "--role-file",
+        help="File with the roles in the format of --roles, re-read whenever it changes",
+    )
+    parser.add_argument(
+        "--pid",
+        help="Report CPU, memory, page faults and context switches of the process tree below this process",
+        type=int,
+    )
+    parser.add_argument(
+        "--cgroup",
+        help="Report them for the child cgroups of this cgroup v2 directory instead (e.g. /sys/fs/cgroup/firecracker)",
+    )
+    parser.add_argument(
+        "--process-groups",
+        help="Comma separated process names to group the process tree by, e.g. firecracker,wasmtime",
+        default="",
+    )
+    parser.add_argument(
+        "--max-pids",
+        help="Number of processes followed at most",
+        type=int,
+        default=4096,
+    )
+    parser.add_argument(
+        "--overrun",
+        help="When a sample overruns the next tick, skip the overdue ticks or coalesce them into one sample taken right away",
+        choices=OVERRUN_POLICIES,
+        default="skip",
+    )
+    parser.add_argument(
+        "--core",
+        help="Housekeeping core to run the sampler on",
+        type=int,
+    )
+    parser.add_argument(
+        "--nice",
+        help="Nice value of the sampler, negative values need root",
+        type=int,
+    )
     args = parser.parse_args()
     output_file = args.output
 
@@ -78,8 +864,15 @@ if __name__ == "__main__":
     directory = os.path.dirname(os.path.abspath(output_file))
     os.makedirs(directory, exist_ok=True)
 
+    process_groups = None
+    if args.pid is not None or args.cgroup is not None:
+        groups = [group for group in args.process_groups.split(",") if group]
+        process_groups = ProcessGroups(args.pid, args.cgroup, groups, args.max_pids)
+
     # Start measurement
-    measure_thread = Thread(target=cpu_mem_measure, args=(output_file,))
+    measure_thread = Thread(target=cpu_mem_measure, args=(output_file, args.backend, args.interval, args.format, args.capacity,
+                                                          args.roles, args.role_file, process_groups,
+                                                          args.overrun, args.core, args.nice))
     measure_thread.start()
 
     measure_thread.join()